@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+NICE-BOT PDF Benchmark
+Documents per second for each template and executor mode
+
+Usage: python benchmarks/bench_pdf.py [documents]
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fpdf import FPDF, XPos, YPos
+
+from services.pdf import FONT_FAMILY, PDFRenderer, _load_fonts, find_fonts, render_document
+
+SAMPLE = "Bonjour ! Привет, ¿qué tal? Ελληνικά — NICE-BOT ✓ " * 20
+
+DOCUMENTS = {
+    'text': dict(text=SAMPLE, author="Zoé"),
+    'translation': dict(original=SAMPLE, translated=SAMPLE.upper(), target_lang='en'),
+    'ai_answer': dict(question="Explique la photosynthèse", answer=SAMPLE),
+    'transcript': dict(messages=[("Vous", SAMPLE[:200]), ("NICE-BOT", SAMPLE[:300])] * 5),
+}
+
+
+def naive_document(text: str, font_files: dict) -> bytes:
+    """Baseline: the 'text' template drawn by a fresh FPDF that loads its fonts itself"""
+    pdf = FPDF()
+    for style, path in font_files.items():
+        pdf.add_font(FONT_FAMILY, style, path)
+    family = FONT_FAMILY if font_files else 'helvetica'
+    if not font_files:
+        text = text.encode('latin-1', errors='replace').decode('latin-1')
+    pdf.add_page()
+    pdf.set_font(family, 'B', 16)
+    pdf.multi_cell(0, 10, "Document NICE-BOT", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.set_font(family, '', 12)
+    pdf.multi_cell(0, 7, text, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    return bytes(pdf.output())
+
+
+def report(label: str, count: int, elapsed: float):
+    print(f"{label:<32} {count / elapsed:7.1f} docs/s   ({elapsed * 1000 / count:6.1f} ms/doc)")
+
+
+async def bench_renderer(mode: str, count: int):
+    renderer = PDFRenderer(mode=mode)
+    start = time.perf_counter()
+    await renderer.warm_up()
+    print(f"\n⚙️ {mode} pool ({renderer.workers} workers), démarrage {time.perf_counter() - start:.2f}s")
+
+    for template, fields in DOCUMENTS.items():
+        start = time.perf_counter()
+        await asyncio.gather(*(renderer.render(template, **fields) for _ in range(count)))
+        report(f"  {template}", count, time.perf_counter() - start)
+    renderer.shutdown()
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    font_files = find_fonts()
+    print(f"📄 PDF benchmark - {count} documents par mesure")
+    print(f"🔤 Polices : {', '.join(font_files.values()) or 'aucune (latin-1)'}")
+
+    start = time.perf_counter()
+    for _ in range(count):
+        naive_document(SAMPLE, font_files)
+    report("\nInline, add_font par document", count, time.perf_counter() - start)
+
+    _load_fonts(font_files)
+    start = time.perf_counter()
+    for _ in range(count):
+        render_document('text', DOCUMENTS['text'])
+    report("Inline, polices en cache", count, time.perf_counter() - start)
+
+    await bench_renderer('thread', count)
+    await bench_renderer('process', count)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+NICE-BOT QR Benchmark
+Compare local QR rendering latency against the QR Server API
+
+Usage: python benchmarks/bench_qr.py [rounds]
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.qr import QREngine, QRSpec, render_remote
+
+PAYLOADS = [
+    "https://google.com",
+    "Bonjour le monde !",
+    "Contactez-moi: +33123456789",
+    "https://example.com/" + "x" * 200,
+]
+
+
+def report(label: str, timings: list):
+    """Print p50/p95/max in milliseconds"""
+    if not timings:
+        print(f"{label:<28} aucune mesure")
+        return
+    timings = sorted(t * 1000 for t in timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{label:<28} p50 {statistics.median(timings):7.2f} ms   "
+          f"p95 {p95:7.2f} ms   max {timings[-1]:7.2f} ms   (n={len(timings)})")
+
+
+async def timed(coroutine) -> float:
+    start = time.perf_counter()
+    await coroutine
+    return time.perf_counter() - start
+
+
+async def bench_local(rounds: int):
+    """Cold renders (fresh cache each round), cached renders and a 10-code album"""
+    cold, warm, batch = [], [], []
+    for _ in range(rounds):
+        engine = QREngine()
+        for payload in PAYLOADS:
+            cold.append(await timed(engine.render(QRSpec(payload))))
+            warm.append(await timed(engine.render(QRSpec(payload))))
+        batch.append(await timed(engine.render_many(
+            [QRSpec(f"{PAYLOADS[0]}?n={i}") for i in range(10)]
+        )))
+        engine.shutdown()
+
+    report("Local PNG (cold)", cold)
+    report("Local PNG (cache)", warm)
+    report("Local album x10", batch)
+
+    engine = QREngine()
+    svg = [await timed(engine.render(QRSpec(f"{payload}#{i}", fmt='svg')))
+           for i in range(rounds) for payload in PAYLOADS]
+    engine.shutdown()
+    report("Local SVG (cold)", svg)
+
+
+async def bench_remote(rounds: int):
+    """Same payloads through api.qrserver.com over one keep-alive session"""
+    timings = []
+    failures = 0
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10)) as session:
+        for i in range(rounds):
+            for payload in PAYLOADS:
+                start = time.perf_counter()
+                data = await render_remote(QRSpec(f"{payload}#{i}"), session)
+                if data:
+                    timings.append(time.perf_counter() - start)
+                else:
+                    failures += 1
+
+    report("QR Server API", timings)
+    if failures:
+        print(f"⚠️ {failures} requête(s) API en échec")
+
+
+async def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    print(f"📱 QR benchmark - {rounds} rounds x {len(PAYLOADS)} payloads\n")
+    await bench_local(rounds)
+    await bench_remote(rounds)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
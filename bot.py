@@ -13,20 +13,22 @@ from dotenv import load_dotenv
 from commands.general import start, help_command, menu, about
 from commands.utils import traduire, meteo, devise, qr, pdf
 from commands.ai import ai, resume, idee
-from commands.info import citation, blague, film, news, wiki, meme
-from commands.dev import ping, uptime, logs
+from commands.info import citation, blague, film, film_page, news, wiki, meme
+from commands.dev import ping, uptime, logs, register_metrics
 from commands.admin import (admin_panel, admin_stats, admin_users, admin_broadcast, admin_logs,
-                            ban_user, unban_user, add_xp_admin, reset_xp_admin, gamification_stats)
+                            ban_user, unban_user, add_xp_admin, reset_xp_admin, gamification_stats,
+                            admin_profile)
 from commands.interactive import interactive_menu, quick_actions, handle_callback, remove_keyboard, handle_quick_buttons
-from commands.notifications import set_reminder, list_reminders, weather_alerts
-from commands.gamification import profile, leaderboard
+from commands.notifications import set_reminder, list_reminders, set_timezone, weather_alerts
+from commands.gamification import profile, leaderboard, register_xp_tracking
 from commands.chatbot import chatbot_command, handle_chatbot_message
 from commands.downloader import (tiktok_download, facebook_download, instagram_download, 
-                                 twitter_download, pinterest_download, apk_download)
+                                 twitter_download, pinterest_download, apk_download, auto_download)
 from commands.group_management import (welcome_group, setup_group, invite_link, 
                                        group_info, bot_permissions)
 from commands.channel_management import (list_groups, leave_group, broadcast_to_groups, 
                                          group_stats_admin)
+from services.metrics import TracedRequest
 
 # Load environment variables
 load_dotenv()
@@ -50,12 +52,14 @@ def setup_bot() -> Application:
         Application.builder()
         .token(bot_token)
         .concurrent_updates(True)           # Enable concurrent processing
-        .pool_timeout(30.0)                 # Connection pool timeout
-        .connection_pool_size(8)            # Smaller pool for free tier
-        .read_timeout(20.0)                 # Faster read timeout
-        .write_timeout(20.0)                # Faster write timeout
-        .connect_timeout(10.0)              # Faster connection timeout
-        .get_updates_pool_timeout(5.0)      # Faster polling timeout
+        .get_updates_pool_timeout(5.0)      # Faster polling timeout (set before .request())
+        .request(TracedRequest(             # Bot API calls reach /metrics and the traces
+            pool_timeout=30.0,              # Connection pool timeout
+            connection_pool_size=8,         # Smaller pool for free tier
+            read_timeout=20.0,              # Faster read timeout
+            write_timeout=20.0,             # Faster write timeout
+            connect_timeout=10.0,           # Faster connection timeout
+        ))
         .build()
     )
     
@@ -102,6 +106,7 @@ def setup_bot() -> Application:
     application.add_handler(CommandHandler("addxp", add_xp_admin))
     application.add_handler(CommandHandler("resetxp", reset_xp_admin))
     application.add_handler(CommandHandler("gamestats", gamification_stats))
+    application.add_handler(CommandHandler("perfprofile", admin_profile))
     
     # Interactive commands
     application.add_handler(CommandHandler("imenu", interactive_menu))
@@ -111,6 +116,7 @@ def setup_bot() -> Application:
     # Notification commands
     application.add_handler(CommandHandler("rappel", set_reminder))
     application.add_handler(CommandHandler("rappels", list_reminders))
+    application.add_handler(CommandHandler("fuseau", set_timezone))
     application.add_handler(CommandHandler("alertes", weather_alerts))
     
     # Gamification commands
@@ -124,6 +130,7 @@ def setup_bot() -> Application:
     application.add_handler(CommandHandler("twitter", twitter_download))
     application.add_handler(CommandHandler("pinterest", pinterest_download))
     application.add_handler(CommandHandler("apk", apk_download))
+    application.add_handler(CommandHandler("dl", auto_download))
     
     # Chatbot command
     application.add_handler(CommandHandler("chatbot", chatbot_command))
@@ -140,6 +147,9 @@ def setup_bot() -> Application:
     application.add_handler(CommandHandler("broadcastgroups", broadcast_to_groups))
     application.add_handler(CommandHandler("groupstats", group_stats_admin))
     
+    # XP, counters and badges for every command above
+    register_xp_tracking(application)
+    
     # Welcome message when bot is added to group
     from telegram.ext import ChatMemberHandler
     async def track_bot_added(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -152,6 +162,7 @@ def setup_bot() -> Application:
     
     # Callback query handler for inline keyboards
     from telegram.ext import CallbackQueryHandler
+    application.add_handler(CallbackQueryHandler(film_page, pattern=r"^film:"))
     application.add_handler(CallbackQueryHandler(handle_callback))
     
     # Handle chatbot messages (mentions and replies) - BEFORE quick buttons
@@ -175,6 +186,9 @@ def setup_bot() -> Application:
     
     application.add_handler(MessageHandler(filters.COMMAND, unknown_command))
     
+    # Update counts and handler latencies for /metrics
+    register_metrics(application)
+    
     logger.info("Bot handlers registered successfully")
     return application
 
@@ -194,6 +208,7 @@ async def setup_menu_button(application: Application):
             BotCommand("chatbot", "🤖 Activer/désactiver chatbot IA"),
             BotCommand("rappel", "⏰ Programmer un rappel"),
             BotCommand("rappels", "📋 Voir mes rappels"),
+            BotCommand("fuseau", "🌍 Fuseau horaire des rappels"),
             BotCommand("alertes", "🌦️ Alertes météo"),
             BotCommand("traduire", "🌐 Traduire du texte"),
             BotCommand("meteo", "🌤️ Météo d'une ville"),
@@ -215,6 +230,7 @@ async def setup_menu_button(application: Application):
             BotCommand("twitter", "🐦 Télécharger Twitter"),
             BotCommand("pinterest", "📌 Télécharger Pinterest"),
             BotCommand("apk", "📦 Télécharger APK"),
+            BotCommand("dl", "📥 Télécharger depuis un lien"),
             BotCommand("setup", "⚙️ Configuration groupe"),
             BotCommand("invite", "📨 Inviter le bot"),
             BotCommand("groupinfo", "📊 Infos du groupe"),
@@ -233,6 +249,7 @@ async def setup_menu_button(application: Application):
             BotCommand("addxp", "⚡ Ajouter XP (admin)"),
             BotCommand("resetxp", "🔄 Reset XP (admin)"),
             BotCommand("gamestats", "🎮 Stats gamification (admin)"),
+            BotCommand("perfprofile", "🔥 Profilage performances (admin)"),
             BotCommand("listgroups", "📋 Liste groupes (admin)"),
             BotCommand("leavegroup", "🚪 Quitter groupe (admin)"),
             BotCommand("broadcastgroups", "📢 Broadcast groupes (admin)"),
@@ -5,6 +5,7 @@ Admin commands for NICE-BOT
 Only accessible to bot administrators
 """
 
+import io
 import os
 import sys
 import logging
@@ -14,6 +15,7 @@ from telegram.ext import ContextTypes
 from dotenv import load_dotenv
 
 from db import get_user_stats, get_recent_history, get_all_users, get_connection
+from services.profiler import PROFILE_DEFAULT_SECONDS, PROFILE_MAX_SECONDS, ProfilerBusy, profiler
 
 # Fix encoding for Windows console
 if sys.platform == 'win32':
@@ -77,13 +79,14 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 • /stats - Statistiques détaillées
 • /users - Liste des utilisateurs
-• /logs - Logs récents
+• /logs - Logs récents (/logs lents : traces)
 • /broadcast - Message à tous
 • /ban - Bannir un utilisateur
 • /unban - Débannir un utilisateur
 • /addxp - Ajouter XP à un utilisateur
 • /addbadge - Donner un badge
 • /resetxp - Reset XP utilisateur
+• /perfprofile - Profilage des performances
 
 ╔══════════════════════════╗
 ║    Powered by NICE-DEV   ║
@@ -390,6 +393,10 @@ async def reset_xp_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         target_user_id = int(context.args[0])
         
+        # Write buffered XP first so it cannot overwrite the reset
+        from commands.gamification import xp_accumulator, leaderboard_index
+        xp_accumulator.flush()
+        
         # Reset XP in database
         conn = get_connection()
         cursor = conn.cursor()
@@ -403,6 +410,10 @@ async def reset_xp_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
         conn.commit()
         conn.close()
         
+        xp_accumulator.forget(target_user_id)
+        if target_user_id in leaderboard_index.board():
+            leaderboard_index.record(target_user_id, 0, 0)
+        
         reset_text = f"""
 ✅ **XP RESET EFFECTUÉ**
 
@@ -484,3 +495,65 @@ async def gamification_stats(update: Update, context: ContextTypes.DEFAULT_TYPE)
         
     except Exception as e:
         await update.message.reply_text(f"❌ **Erreur:** {str(e)}")
+
+async def admin_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /perfprofile command - Sampling profile of the running bot (admin only)"""
+    user = update.effective_user
+    
+    if not is_admin(user.id):
+        await send_access_denied(update)
+        return
+    
+    seconds = PROFILE_DEFAULT_SECONDS
+    if context.args:
+        if not context.args[0].isdigit():
+            await update.message.reply_text(
+                f"❌ **Usage :** `/perfprofile [secondes]` (1 à {PROFILE_MAX_SECONDS}, {PROFILE_DEFAULT_SECONDS} par défaut)",
+                parse_mode='Markdown'
+            )
+            return
+        seconds = max(1, min(int(context.args[0]), PROFILE_MAX_SECONDS))
+    
+    if profiler.running:
+        await update.message.reply_text("⏳ Un profilage est déjà en cours, réessayez dans un instant.")
+        return
+    
+    status = await update.message.reply_text(
+        f"⏱️ **Profilage en cours pendant {seconds}s...**\n\nThreads et boucle asyncio échantillonnés.",
+        parse_mode='Markdown'
+    )
+    # The handler returns now: a webhook update held past Telegram's timeout is delivered again
+    context.application.create_task(send_profile(update.message, status, seconds), update=update)
+
+async def send_profile(message, status, seconds: int):
+    """Run the profile in the background and reply with the collapsed stacks"""
+    try:
+        result = await profiler.profile(seconds)
+    except ProfilerBusy:
+        await status.edit_text("⏳ Un profilage est déjà en cours, réessayez dans un instant.")
+        return
+    except Exception as e:
+        logger.error(f"Error while profiling: {e}")
+        await status.edit_text("❌ Erreur pendant le profilage.")
+        return
+    
+    hot = '\n'.join(f"• `{name}` — {share:.0%}" for name, share in result.hot) or "• Aucune (boucle inactive)"
+    document = io.BytesIO(result.folded.encode('utf-8'))
+    document.name = f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.folded"
+    
+    await message.reply_document(
+        document=document,
+        caption=f"""
+🔥 **PROFIL DE PERFORMANCE**
+
+⏱️ **Durée :** {result.seconds:.0f}s ({result.samples} échantillons)
+🔄 **Boucle asyncio occupée :** {result.loop_busy:.0%}
+
+**Fonctions les plus actives sur la boucle :**
+{hot}
+
+📊 Format « collapsed stacks » : ouvrez-le sur speedscope.app ou avec flamegraph.pl
+        """,
+        parse_mode='Markdown'
+    )
+    await status.delete()
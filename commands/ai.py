@@ -9,6 +9,7 @@ import aiohttp
 from telegram import Update
 from telegram.ext import ContextTypes
 from db import get_user, add_history
+from services.metrics import http_trace
 
 logger = logging.getLogger(__name__)
 
@@ -41,7 +42,7 @@ async def ai(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Send typing action
         await update.message.reply_chat_action("typing")
         
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(trace_configs=[http_trace()]) as session:
             # Use PrinceTech GPT API
             params = {
                 "apikey": PRINCETECH_API_KEY,
@@ -67,6 +68,9 @@ async def ai(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         """
                         
                         await update.message.reply_text(response_text, parse_mode='Markdown')
+                        
+                        # Kept for /pdf ia
+                        context.user_data['last_ai_answer'] = {'question': question, 'answer': ai_response}
                     else:
                         await update.message.reply_text(
                             "🤖 Désolé, je n'ai pas pu générer une réponse appropriée à votre question.\n"
@@ -107,7 +111,7 @@ async def resume(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Send typing action
         await update.message.reply_chat_action("typing")
         
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(trace_configs=[http_trace()]) as session:
             # Use PrinceTech GPT API with summarization prompt
             prompt = f"Résume ce texte de manière concise et claire: {text_to_summarize}"
             params = {
@@ -169,7 +173,7 @@ async def idee(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Send typing action
         await update.message.reply_chat_action("typing")
         
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(trace_configs=[http_trace()]) as session:
             # Use PrinceTech GPT API with idea generation prompt
             prompt = f"Donne-moi 5 idées créatives et originales pour: {topic}"
             params = {
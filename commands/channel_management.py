@@ -5,7 +5,6 @@ Professional management tools for groups and channels
 """
 
 import os
-import json
 import logging
 from pathlib import Path
 from datetime import datetime
@@ -13,6 +12,7 @@ from telegram import Update
 from telegram.ext import ContextTypes
 from telegram.constants import ChatType
 from db import get_user, add_history
+from services.store import JsonStore
 
 logger = logging.getLogger(__name__)
 
@@ -22,26 +22,7 @@ ADMIN_USER_ID = int(os.getenv("ADMIN_USER_ID", "0"))
 # Data file for managed groups
 MANAGED_GROUPS_FILE = Path(__file__).parent.parent / "data" / "managed_groups.json"
 
-def load_managed_groups():
-    """Load managed groups data"""
-    try:
-        MANAGED_GROUPS_FILE.parent.mkdir(exist_ok=True)
-        if MANAGED_GROUPS_FILE.exists():
-            with open(MANAGED_GROUPS_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {'groups': {}, 'channels': {}, 'stats': {}}
-    except Exception as e:
-        logger.error(f"Error loading managed groups: {e}")
-        return {'groups': {}, 'channels': {}, 'stats': {}}
-
-def save_managed_groups(data):
-    """Save managed groups data"""
-    try:
-        MANAGED_GROUPS_FILE.parent.mkdir(exist_ok=True)
-        with open(MANAGED_GROUPS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-    except Exception as e:
-        logger.error(f"Error saving managed groups: {e}")
+managed_groups = JsonStore("managed_groups", MANAGED_GROUPS_FILE, sections=('groups', 'channels', 'stats'))
 
 def is_admin(user_id: int) -> bool:
     """Check if user is bot admin"""
@@ -69,9 +50,8 @@ async def list_groups(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     try:
-        data = load_managed_groups()
-        groups = data.get('groups', {})
-        channels = data.get('channels', {})
+        groups = managed_groups.items('groups')
+        channels = managed_groups.items('channels')
         
         if not groups and not channels:
             await update.message.reply_text(
@@ -157,13 +137,12 @@ async def leave_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await context.bot.leave_chat(chat_id)
         
         # Remove from managed groups
-        data = load_managed_groups()
         chat_id_str = str(chat_id)
+        group = managed_groups.delete('groups', chat_id_str)
+        channel = managed_groups.delete('channels', chat_id_str) if group is None else None
         
-        if chat_id_str in data.get('groups', {}):
-            group_name = data['groups'][chat_id_str].get('name', 'N/A')
-            del data['groups'][chat_id_str]
-            save_managed_groups(data)
+        if group is not None:
+            group_name = group.get('name', 'N/A')
             
             await update.message.reply_text(
                 "╔════════════════════════════╗\n"
@@ -174,10 +153,8 @@ async def leave_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "Le bot a quitte le groupe avec succes.",
                 parse_mode='Markdown'
             )
-        elif chat_id_str in data.get('channels', {}):
-            channel_name = data['channels'][chat_id_str].get('name', 'N/A')
-            del data['channels'][chat_id_str]
-            save_managed_groups(data)
+        elif channel is not None:
+            channel_name = channel.get('name', 'N/A')
             
             await update.message.reply_text(
                 "╔════════════════════════════╗\n"
@@ -244,8 +221,7 @@ async def broadcast_to_groups(update: Update, context: ContextTypes.DEFAULT_TYPE
     message = ' '.join(context.args)
     
     try:
-        data = load_managed_groups()
-        groups = data.get('groups', {})
+        groups = managed_groups.items('groups')
         
         if not groups:
             await update.message.reply_text(
@@ -312,9 +288,8 @@ async def group_stats_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     try:
-        data = load_managed_groups()
-        groups = data.get('groups', {})
-        channels = data.get('channels', {})
+        groups = managed_groups.items('groups')
+        channels = managed_groups.items('channels')
         
         # Calculate stats
         total_members = sum(g.get('member_count', 0) for g in groups.values())
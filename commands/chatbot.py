@@ -5,7 +5,6 @@ AI chatbot that can be enabled/disabled in groups by admins
 """
 
 import os
-import json
 import logging
 import aiohttp
 import asyncio
@@ -15,43 +14,28 @@ from datetime import datetime
 from telegram import Update
 from telegram.ext import ContextTypes
 from db import get_user, add_history
+from services.store import JsonStore
+from services.metrics import http_trace
 
 logger = logging.getLogger(__name__)
 
 # Data file for chatbot settings
 CHATBOT_DATA_FILE = Path(__file__).parent.parent / "data" / "chatbot_settings.json"
 
+chatbot_settings = JsonStore("chatbot_settings", CHATBOT_DATA_FILE, sections=('enabled_chats',))
+
+# Messages (both sides) kept per user for /pdf discussion
+TRANSCRIPT_LENGTH = 40
+
 # In-memory storage for chat history
 chat_memory = {
     'messages': {},  # Stores last 20 messages per user
     'user_info': {}  # Stores user information
 }
 
-def load_chatbot_settings():
-    """Load chatbot settings from file"""
-    try:
-        CHATBOT_DATA_FILE.parent.mkdir(exist_ok=True)
-        if CHATBOT_DATA_FILE.exists():
-            with open(CHATBOT_DATA_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {'enabled_chats': {}}
-    except Exception as e:
-        logger.error(f"Error loading chatbot settings: {e}")
-        return {'enabled_chats': {}}
-
-def save_chatbot_settings(data):
-    """Save chatbot settings to file"""
-    try:
-        CHATBOT_DATA_FILE.parent.mkdir(exist_ok=True)
-        with open(CHATBOT_DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-    except Exception as e:
-        logger.error(f"Error saving chatbot settings: {e}")
-
 def is_chatbot_enabled(chat_id):
     """Check if chatbot is enabled for a chat"""
-    settings = load_chatbot_settings()
-    return str(chat_id) in settings.get('enabled_chats', {})
+    return chatbot_settings.contains('enabled_chats', chat_id)
 
 async def is_user_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
     """Check if user is admin in the group"""
@@ -115,7 +99,6 @@ async def chatbot_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
     
-    settings = load_chatbot_settings()
     chat_id_str = str(chat.id)
     
     if command == 'on':
@@ -126,12 +109,11 @@ async def chatbot_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
         
-        settings['enabled_chats'][chat_id_str] = {
+        chatbot_settings.set('enabled_chats', chat_id_str, {
             'enabled_at': datetime.now().isoformat(),
             'enabled_by': user.id,
             'chat_name': chat.title or chat.first_name or 'Unknown'
-        }
-        save_chatbot_settings(settings)
+        })
         
         await update.message.reply_text(
             "✅ **Chatbot activé !**\n\n"
@@ -149,9 +131,7 @@ async def chatbot_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
         
-        if chat_id_str in settings['enabled_chats']:
-            del settings['enabled_chats'][chat_id_str]
-        save_chatbot_settings(settings)
+        chatbot_settings.delete('enabled_chats', chat_id_str)
         
         await update.message.reply_text(
             "❌ **Chatbot désactivé**\n\n"
@@ -242,6 +222,11 @@ async def handle_chatbot_message(update: Update, context: ContextTypes.DEFAULT_T
             reply_to_message_id=update.message.message_id
         )
         
+        # Kept for /pdf discussion
+        transcript = context.user_data.setdefault('chat_transcript', [])
+        transcript.extend([(user.first_name or 'Vous', cleaned_message), ('NICE-BOT', response)])
+        del transcript[:-TRANSCRIPT_LENGTH]
+        
     except Exception as e:
         logger.error(f"Error in chatbot response: {e}")
         try:
@@ -278,7 +263,7 @@ Réponds naturellement:"""
         api_key = os.getenv("PRINCETECHN_API_KEY", "prince")
         url = f"https://api.princetechn.com/api/ai/gpt"
         
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(trace_configs=[http_trace()]) as session:
             params = {
                 "apikey": api_key,
                 "q": prompt
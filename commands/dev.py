@@ -6,10 +6,14 @@ NICE-BOT - Development Commands
 import os
 import logging
 import time
+import functools
 from datetime import datetime, timedelta
 from telegram import Update
-from telegram.ext import ContextTypes
+from telegram.ext import Application, ApplicationHandlerStop, CommandHandler, ContextTypes, TypeHandler
 from db import get_user, add_history, get_user_stats, get_recent_logs
+from services.metrics import COMMAND_RESULTS, HANDLER_ERRORS, HANDLER_SECONDS, UPDATES
+from services.watchdog import loop_watchdog
+from services.tracing import tracer
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +23,10 @@ BOT_START_TIME = datetime.now()
 # Admin user ID (set via environment variable)
 ADMIN_USER_ID = os.getenv("ADMIN_USER_ID", "")
 
+# Traces listed by /logs lents, and spans shown for each
+SLOW_TRACES_SHOWN = 5
+SPANS_PER_TRACE = 4
+
 async def ping(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /ping command - Response time measurement"""
     start_time = time.time()
@@ -95,6 +103,11 @@ async def logs(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
     
+    # /logs lents: slowest traced updates instead of the command history
+    if context.args and context.args[0].lower() in ('lents', 'traces'):
+        await update.message.reply_text(format_slow_traces(), parse_mode='Markdown')
+        return
+    
     try:
         # Get recent logs from database
         recent_logs = get_recent_logs(limit=10)
@@ -139,6 +152,23 @@ async def logs(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Logs error: {e}")
         await update.message.reply_text("❌ Erreur lors de la récupération des logs.")
 
+def format_slow_traces(count: int = SLOW_TRACES_SHOWN) -> str:
+    """Slowest recent traces, each with its longest spans"""
+    traces = tracer.slowest(count)
+    if not traces:
+        return "🐢 Aucune trace récente (les traces sont prises sur les mises à jour reçues par webhook)."
+    
+    text = f"🐢 **Traces les plus lentes** (sur les {len(tracer.recent)} dernières)\n\n"
+    for i, trace in enumerate(traces, 1):
+        started = datetime.fromtimestamp(trace.started_at).strftime('%d/%m %H:%M:%S')
+        text += f"**{i}.** `{trace.label}` — **{trace.duration:.2f}s** ({started})\n🔎 `{trace.id}`\n"
+        spans = sorted(trace.spans, key=lambda span: span[4], reverse=True)[:SPANS_PER_TRACE]
+        for _, _, name, offset, duration, error in spans:
+            text += f"   • `{name}` {duration * 1000:.1f} ms (+{offset * 1000:.0f} ms)"
+            text += f" ❌ {error}\n" if error else "\n"
+        text += "\n"
+    return text
+
 # Additional utility functions for monitoring
 
 def get_system_status():
@@ -157,4 +187,42 @@ def log_error(error_message: str, command: str = "", user_id: str = ""):
 def log_command_usage(command: str, user_id: str, success: bool = True):
     """Log command usage for analytics"""
     status = "SUCCESS" if success else "FAILED"
+    COMMAND_RESULTS.inc(command, status.lower())
     logger.info(f"Command {command} executed by user {user_id}: {status}")
+
+# Update kinds counted on /metrics, checked in this order
+UPDATE_KINDS = ('message', 'edited_message', 'callback_query', 'inline_query',
+                'my_chat_member', 'chat_member', 'channel_post', 'edited_channel_post')
+
+def timed_callback(callback, label: str):
+    """Wrap a handler callback so its duration and failures reach /metrics and the trace"""
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        start = time.perf_counter()
+        try:
+            with loop_watchdog.track(label), tracer.span(label, expected=(ApplicationHandlerStop,)):
+                return await callback(update, context)
+        except ApplicationHandlerStop:
+            raise
+        except Exception:
+            HANDLER_ERRORS.inc(label)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - start, label)
+    return wrapper
+
+def register_metrics(application: Application):
+    """Count incoming updates and time every registered handler (call last in setup)"""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            if isinstance(handler, CommandHandler):
+                label = f"/{sorted(handler.commands)[0]}"
+            else:
+                label = getattr(handler.callback, '__name__', type(handler).__name__)
+            handler.callback = timed_callback(handler.callback, label)
+    
+    async def count_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        kind = next((k for k in UPDATE_KINDS if getattr(update, k, None) is not None), 'other')
+        UPDATES.inc(kind)
+    
+    application.add_handler(TypeHandler(Update, count_update), group=-2)
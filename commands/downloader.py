@@ -4,465 +4,196 @@ NICE-BOT - Downloader Commands
 Video and APK download commands using PrinceTech APIs
 """
 
-import os
 import logging
-import aiohttp
+from datetime import timedelta
 from telegram import Update
 from telegram.ext import ContextTypes
 from db import get_user, add_history
+from services.download_jobs import DownloadJob, JobContext, QueueFull, download_queue
+from services.downloads import PLATFORMS, Platform, download_engine, normalize_url
+from services.media_cache import send_cached
+from services.media_relay import relay_media
 
 logger = logging.getLogger(__name__)
 
-# PrinceTech API configuration
-PRINCETECH_API_KEY = os.getenv("PRINCETECHN_API_KEY", "prince")
-PRINCETECH_BASE = "https://api.princetechn.com/api/download"
+# APKs get new versions, so their file_id is only reused for a while
+APK_CACHE_AGE = timedelta(days=7)
 
-async def tiktok_download(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /tiktok command - Download TikTok videos"""
-    user = update.effective_user
-    
-    # Log command
-    db_user = get_user(str(user.id))
-    if db_user:
-        add_history(db_user['id'], '/tiktok', ' '.join(context.args))
-    
-    if not context.args:
-        await update.message.reply_text(
-            "╔════════════════════════════╗\n"
-            "║   📱 TIKTOK DOWNLOADER    ║\n"
-            "╚════════════════════════════╝\n\n"
-            "**Usage :**\n"
-            "`/tiktok <url>`\n\n"
-            "**Exemple :**\n"
-            "`/tiktok https://vm.tiktok.com/ZMrgKWmVd`\n\n"
-            "✨ *Téléchargez vos vidéos TikTok préférées !*",
-            parse_mode='Markdown'
-        )
-        return
-    
-    url = context.args[0]
-    
-    try:
-        await update.message.reply_chat_action("upload_video")
-        
-        async with aiohttp.ClientSession() as session:
-            api_url = f"{PRINCETECH_BASE}/tiktokdlv3"
-            params = {
-                "apikey": PRINCETECH_API_KEY,
-                "url": url
-            }
-            
-            async with session.get(api_url, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    
-                    if data.get('success') and data.get('result'):
-                        result = data['result']
-                        video_url = result.get('video') or result.get('videoUrl')
-                        
-                        if video_url:
-                            # Send video info
-                            info_text = (
-                                "╔════════════════════════════╗\n"
-                                "║   📱 TIKTOK DOWNLOAD      ║\n"
-                                "╚════════════════════════════╝\n\n"
-                                f"**Titre :** {result.get('title', 'N/A')[:100]}\n"
-                                f"**Auteur :** {result.get('author', 'N/A')}\n"
-                                f"**Durée :** {result.get('duration', 'N/A')}\n\n"
-                                "⏳ *Téléchargement en cours...*"
-                            )
-                            await update.message.reply_text(info_text, parse_mode='Markdown')
-                            
-                            # Send video
-                            await update.message.reply_video(
-                                video=video_url,
-                                caption="✅ **Téléchargé par NICE-BOT**",
-                                parse_mode='Markdown'
-                            )
-                            return
-                
-                await update.message.reply_text(
-                    "❌ **Erreur de téléchargement**\n\n"
-                    "Impossible de télécharger cette vidéo.\n"
-                    "Vérifiez que l'URL est correcte.",
-                    parse_mode='Markdown'
-                )
-    
-    except Exception as e:
-        logger.error(f"TikTok download error: {e}")
-        await update.message.reply_text(
-            "❌ **Erreur**\n\n"
-            "Une erreur s'est produite lors du téléchargement.",
-            parse_mode='Markdown'
-        )
+DEFAULT_CAPTION = "✅ **Téléchargé par NICE-BOT**"
 
-async def facebook_download(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /facebook command - Download Facebook videos"""
-    user = update.effective_user
-    
-    # Log command
-    db_user = get_user(str(user.id))
-    if db_user:
-        add_history(db_user['id'], '/facebook', ' '.join(context.args))
-    
-    if not context.args:
-        await update.message.reply_text(
-            "╔════════════════════════════╗\n"
-            "║  📘 FACEBOOK DOWNLOADER   ║\n"
-            "╚════════════════════════════╝\n\n"
-            "**Usage :**\n"
-            "`/facebook <url>`\n\n"
-            "**Exemple :**\n"
-            "`/facebook https://www.facebook.com/reel/123456`\n\n"
-            "✨ *Téléchargez des vidéos Facebook !*",
-            parse_mode='Markdown'
-        )
-        return
-    
-    url = context.args[0]
-    
-    try:
-        await update.message.reply_chat_action("upload_video")
-        
-        async with aiohttp.ClientSession() as session:
-            api_url = f"{PRINCETECH_BASE}/facebook"
-            params = {
-                "apikey": PRINCETECH_API_KEY,
-                "url": url
-            }
-            
-            async with session.get(api_url, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    
-                    if data.get('success') and data.get('result'):
-                        result = data['result']
-                        video_url = result.get('hd') or result.get('sd') or result.get('video')
-                        
-                        if video_url:
-                            info_text = (
-                                "╔════════════════════════════╗\n"
-                                "║  📘 FACEBOOK DOWNLOAD     ║\n"
-                                "╚════════════════════════════╝\n\n"
-                                f"**Qualité :** {'HD' if result.get('hd') else 'SD'}\n\n"
-                                "⏳ *Téléchargement en cours...*"
-                            )
-                            await update.message.reply_text(info_text, parse_mode='Markdown')
-                            
-                            await update.message.reply_video(
-                                video=video_url,
-                                caption="✅ **Téléchargé par NICE-BOT**",
-                                parse_mode='Markdown'
-                            )
-                            return
-                
-                await update.message.reply_text(
-                    "❌ **Erreur de téléchargement**\n\n"
-                    "Impossible de télécharger cette vidéo.",
-                    parse_mode='Markdown'
-                )
-    
-    except Exception as e:
-        logger.error(f"Facebook download error: {e}")
-        await update.message.reply_text(
-            "❌ **Erreur**\n\n"
-            "Une erreur s'est produite lors du téléchargement.",
-            parse_mode='Markdown'
-        )
+def _box(title: str) -> str:
+    """ASCII header used by every downloader reply"""
+    return (
+        "╔════════════════════════════╗\n"
+        f"║  {title:<25} ║\n"
+        "╚════════════════════════════╝\n\n"
+    )
+
+async def send_usage(update: Update, platform: Platform):
+    """Usage help for a platform command"""
+    if platform.takes_url:
+        usage = f"`/{platform.name} <url>`"
+        example = f"`/{platform.name} {platform.example}`"
+    else:
+        usage = f"`/{platform.name} <nom_application>`"
+        example = f"`/{platform.name} {platform.example}`"
+
+    await update.message.reply_text(
+        _box(f"{platform.title} DOWNLOADER") +
+        f"**Usage :**\n{usage}\n\n"
+        f"**Exemple :**\n{example}\n\n"
+        "💡 *Vous pouvez aussi coller n'importe quel lien dans* `/dl <lien>`",
+        parse_mode='Markdown'
+    )
 
-async def instagram_download(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /instagram command - Download Instagram videos/reels"""
+async def download(update: Update, context: ContextTypes.DEFAULT_TYPE, platform: Platform = None):
+    """Shared flow for every download command"""
     user = update.effective_user
-    
+    chat_id = update.effective_chat.id
+    args = context.args or []
+    command = platform.name if platform else 'dl'
+
     # Log command
     db_user = get_user(str(user.id))
     if db_user:
-        add_history(db_user['id'], '/instagram', ' '.join(context.args))
-    
-    if not context.args:
-        await update.message.reply_text(
-            "╔════════════════════════════╗\n"
-            "║  📸 INSTAGRAM DOWNLOADER  ║\n"
-            "╚════════════════════════════╝\n\n"
-            "**Usage :**\n"
-            "`/instagram <url>`\n\n"
-            "**Exemple :**\n"
-            "`/instagram https://www.instagram.com/reel/ABC123`\n\n"
-            "✨ *Téléchargez des reels et vidéos Instagram !*",
-            parse_mode='Markdown'
-        )
+        add_history(db_user['id'], f'/{command}', ' '.join(args))
+
+    if not args:
+        if platform:
+            await send_usage(update, platform)
+        else:
+            names = ', '.join(p.name for p in PLATFORMS.values() if p.takes_url)
+            await update.message.reply_text(
+                _box("📥 DOWNLOADER") +
+                "**Usage :**\n`/dl <lien>`\n\n"
+                f"**Plateformes :** {names}",
+                parse_mode='Markdown'
+            )
         return
-    
-    url = context.args[0]
-    
-    try:
-        await update.message.reply_chat_action("upload_video")
-        
-        async with aiohttp.ClientSession() as session:
-            api_url = f"{PRINCETECH_BASE}/instadl"
-            params = {
-                "apikey": PRINCETECH_API_KEY,
-                "url": url
-            }
-            
-            async with session.get(api_url, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    
-                    if data.get('success') and data.get('result'):
-                        result = data['result']
-                        media_url = result.get('url') or result.get('video')
-                        
-                        if media_url:
-                            info_text = (
-                                "╔════════════════════════════╗\n"
-                                "║  📸 INSTAGRAM DOWNLOAD    ║\n"
-                                "╚════════════════════════════╝\n\n"
-                                "⏳ *Téléchargement en cours...*"
-                            )
-                            await update.message.reply_text(info_text, parse_mode='Markdown')
-                            
-                            await update.message.reply_video(
-                                video=media_url,
-                                caption="✅ **Téléchargé par NICE-BOT**",
-                                parse_mode='Markdown'
-                            )
-                            return
-                
-                await update.message.reply_text(
-                    "❌ **Erreur de téléchargement**\n\n"
-                    "Impossible de télécharger ce contenu.",
-                    parse_mode='Markdown'
-                )
-    
-    except Exception as e:
-        logger.error(f"Instagram download error: {e}")
-        await update.message.reply_text(
-            "❌ **Erreur**\n\n"
-            "Une erreur s'est produite lors du téléchargement.",
-            parse_mode='Markdown'
-        )
 
-async def twitter_download(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /twitter command - Download Twitter videos"""
-    user = update.effective_user
-    
-    # Log command
-    db_user = get_user(str(user.id))
-    if db_user:
-        add_history(db_user['id'], '/twitter', ' '.join(context.args))
-    
-    if not context.args:
-        await update.message.reply_text(
-            "╔════════════════════════════╗\n"
-            "║   🐦 TWITTER DOWNLOADER   ║\n"
-            "╚════════════════════════════╝\n\n"
-            "**Usage :**\n"
-            "`/twitter <url>`\n\n"
-            "**Exemple :**\n"
-            "`/twitter https://twitter.com/user/status/123`\n\n"
-            "✨ *Téléchargez des vidéos Twitter/X !*",
-            parse_mode='Markdown'
-        )
+    # Work out what to download and from where
+    if platform and not platform.takes_url:
+        query = ' '.join(args)
+        cache_key = f"{platform.name}:{query.lower()}"
+        max_age = APK_CACHE_AGE
+    else:
+        query = normalize_url(' '.join(args))
+        link = await download_engine.canonicalize(query) if query else None
+        platform = (link.platform if link else None) or platform
+        if not query or not platform:
+            await update.message.reply_text(
+                "❌ **Lien non reconnu**\n\n"
+                "Collez un lien TikTok, Facebook, Instagram, Twitter/X ou Pinterest.",
+                parse_mode='Markdown'
+            )
+            return
+        # Every share of the same post maps to one key
+        query = link.url
+        cache_key = link.key
+        max_age = None
+
+    # Already uploaded once: resend by file_id
+    if await send_cached(context.bot, chat_id, cache_key, max_age=max_age,
+                         caption=DEFAULT_CAPTION, parse_mode='Markdown'):
         return
-    
-    url = context.args[0]
-    
-    try:
-        await update.message.reply_chat_action("upload_video")
-        
-        async with aiohttp.ClientSession() as session:
-            api_url = f"{PRINCETECH_BASE}/twitter"
-            params = {
-                "apikey": PRINCETECH_API_KEY,
-                "url": url
-            }
-            
-            async with session.get(api_url, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    
-                    if data.get('success') and data.get('result'):
-                        result = data['result']
-                        video_url = result.get('video') or result.get('url')
-                        
-                        if video_url:
-                            info_text = (
-                                "╔════════════════════════════╗\n"
-                                "║   🐦 TWITTER DOWNLOAD     ║\n"
-                                "╚════════════════════════════╝\n\n"
-                                "⏳ *Téléchargement en cours...*"
-                            )
-                            await update.message.reply_text(info_text, parse_mode='Markdown')
-                            
-                            await update.message.reply_video(
-                                video=video_url,
-                                caption="✅ **Téléchargé par NICE-BOT**",
-                                parse_mode='Markdown'
-                            )
-                            return
-                
-                await update.message.reply_text(
-                    "❌ **Erreur de téléchargement**\n\n"
-                    "Impossible de télécharger cette vidéo.",
-                    parse_mode='Markdown'
-                )
-    
-    except Exception as e:
-        logger.error(f"Twitter download error: {e}")
-        await update.message.reply_text(
-            "❌ **Erreur**\n\n"
-            "Une erreur s'est produite lors du téléchargement.",
-            parse_mode='Markdown'
-        )
 
-async def pinterest_download(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /pinterest command - Download Pinterest videos"""
-    user = update.effective_user
-    
-    # Log command
-    db_user = get_user(str(user.id))
-    if db_user:
-        add_history(db_user['id'], '/pinterest', ' '.join(context.args))
-    
-    if not context.args:
-        await update.message.reply_text(
-            "╔════════════════════════════╗\n"
-            "║  📌 PINTEREST DOWNLOADER  ║\n"
-            "╚════════════════════════════╝\n\n"
-            "**Usage :**\n"
-            "`/pinterest <url>`\n\n"
-            "**Exemple :**\n"
-            "`/pinterest https://pin.it/ABC123`\n\n"
-            "✨ *Téléchargez des vidéos Pinterest !*",
+    # Queue the job; a worker edits this message as it progresses
+    status_message = await update.message.reply_text(
+        f"⏳ **{platform.title} - En file d'attente...**", parse_mode='Markdown'
+    )
+    try:
+        ahead = download_queue.submit(DownloadJob(
+            user.id, chat_id, platform.name, query, cache_key, status_message.message_id
+        ))
+        if ahead:
+            await status_message.edit_text(
+                f"⏳ **{platform.title} - En file d'attente**\n\n"
+                f"{ahead} téléchargement(s) avant le vôtre.",
+                parse_mode='Markdown'
+            )
+    except QueueFull:
+        await status_message.edit_text(
+            "⏳ **Patientez un instant**\n\n"
+            f"Vous avez déjà {download_queue.max_per_user} téléchargements en cours.",
             parse_mode='Markdown'
         )
-        return
-    
-    url = context.args[0]
-    
-    try:
-        await update.message.reply_chat_action("upload_video")
-        
-        async with aiohttp.ClientSession() as session:
-            api_url = f"{PRINCETECH_BASE}/pinterestdl"
-            params = {
-                "apikey": PRINCETECH_API_KEY,
-                "url": url
-            }
-            
-            async with session.get(api_url, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    
-                    if data.get('success') and data.get('result'):
-                        result = data['result']
-                        media_url = result.get('video') or result.get('url')
-                        
-                        if media_url:
-                            info_text = (
-                                "╔════════════════════════════╗\n"
-                                "║  📌 PINTEREST DOWNLOAD    ║\n"
-                                "╚════════════════════════════╝\n\n"
-                                "⏳ *Téléchargement en cours...*"
-                            )
-                            await update.message.reply_text(info_text, parse_mode='Markdown')
-                            
-                            await update.message.reply_video(
-                                video=media_url,
-                                caption="✅ **Téléchargé par NICE-BOT**",
-                                parse_mode='Markdown'
-                            )
-                            return
-                
-                await update.message.reply_text(
-                    "❌ **Erreur de téléchargement**\n\n"
-                    "Impossible de télécharger ce contenu.",
-                    parse_mode='Markdown'
-                )
-    
     except Exception as e:
-        logger.error(f"Pinterest download error: {e}")
-        await update.message.reply_text(
+        logger.error(f"{platform.name} download queue error: {e}")
+        await status_message.edit_text(
             "❌ **Erreur**\n\n"
             "Une erreur s'est produite lors du téléchargement.",
             parse_mode='Markdown'
         )
 
-async def apk_download(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /apk command - Download APK files"""
-    user = update.effective_user
-    
-    # Log command
-    db_user = get_user(str(user.id))
-    if db_user:
-        add_history(db_user['id'], '/apk', ' '.join(context.args))
-    
-    if not context.args:
-        await update.message.reply_text(
-            "╔════════════════════════════╗\n"
-            "║    📦 APK DOWNLOADER      ║\n"
-            "╚════════════════════════════╝\n\n"
-            "**Usage :**\n"
-            "`/apk <nom_application>`\n\n"
-            "**Exemples :**\n"
-            "`/apk WhatsApp`\n"
-            "`/apk Instagram`\n"
-            "`/apk TikTok`\n\n"
-            "✨ *Téléchargez des fichiers APK !*",
-            parse_mode='Markdown'
+async def run_download_job(job_context: JobContext):
+    """Worker side of a download: resolve, describe, then relay the media"""
+    job = job_context.job
+    platform = PLATFORMS[job.platform]
+
+    await job_context.status(f"🔎 **{platform.title} - Analyse du lien...**")
+    result = await download_engine.resolve(platform, job.query, job.cache_key)
+    media_url = platform.media_url(result) if result else None
+
+    if not media_url:
+        await job_context.status(
+            "❌ **Erreur de téléchargement**\n\n"
+            "Impossible de télécharger ce contenu.\n"
+            "Vérifiez que l'URL (ou le nom) est correct."
         )
         return
-    
-    app_name = ' '.join(context.args)
-    
+
+    # Media info replaces the status text
+    details = platform.details(result) if platform.details else []
+    info_text = _box(f"{platform.title} DOWNLOAD")
+    info_text += ''.join(f"**{label} :** {value}\n" for label, value in details)
+    await job_context.status(info_text + ("\n" if details else "") + "⏳ *Téléchargement en cours...*")
+
+    caption = DEFAULT_CAPTION
+    filename = None
+    if platform.kind == 'document':
+        name = result.get('name', job.query)
+        caption = f"✅ **{name}**\n📦 *Téléchargé par NICE-BOT*"
+        filename = f"{name}.apk"
+
     try:
-        await update.message.reply_chat_action("upload_document")
-        
-        async with aiohttp.ClientSession() as session:
-            api_url = f"{PRINCETECH_BASE}/apkdl"
-            params = {
-                "apikey": PRINCETECH_API_KEY,
-                "appName": app_name
-            }
-            
-            async with session.get(api_url, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    
-                    if data.get('success') and data.get('result'):
-                        result = data['result']
-                        apk_url = result.get('dllink') or result.get('download')
-                        
-                        if apk_url:
-                            info_text = (
-                                "╔════════════════════════════╗\n"
-                                "║    📦 APK DOWNLOAD        ║\n"
-                                "╚════════════════════════════╝\n\n"
-                                f"**Application :** {result.get('name', app_name)}\n"
-                                f"**Version :** {result.get('version', 'N/A')}\n"
-                                f"**Taille :** {result.get('size', 'N/A')}\n\n"
-                                "⏳ *Téléchargement en cours...*"
-                            )
-                            await update.message.reply_text(info_text, parse_mode='Markdown')
-                            
-                            await update.message.reply_document(
-                                document=apk_url,
-                                caption=f"✅ **{result.get('name', app_name)}**\n📦 *Téléchargé par NICE-BOT*",
-                                parse_mode='Markdown'
-                            )
-                            return
-                
-                await update.message.reply_text(
-                    "❌ **Application non trouvée**\n\n"
-                    "Vérifiez le nom de l'application et réessayez.",
-                    parse_mode='Markdown'
-                )
-    
-    except Exception as e:
-        logger.error(f"APK download error: {e}")
-        await update.message.reply_text(
+        delivery = await relay_media(
+            job_context.bot, job.chat_id, media_url, platform.kind,
+            caption=caption,
+            filename=filename,
+            cache_key=job.cache_key,
+            progress=job_context.progress
+        )
+    except Exception:
+        # The cached result may hold an expired CDN link
+        download_engine.forget(job.cache_key)
+        await job_context.status(
             "❌ **Erreur**\n\n"
-            "Une erreur s'est produite lors du téléchargement.",
-            parse_mode='Markdown'
+            "Une erreur s'est produite lors du téléchargement."
         )
+        raise
+
+    await job_context.status(info_text + ("\n" if details else "") + (
+        "🔗 *Lien envoyé (fichier trop volumineux)*" if delivery.method == 'link' else "✅ *Terminé !*"
+    ))
+
+def make_download_handler(name: str):
+    """Command handler bound to one registered platform"""
+    platform = PLATFORMS[name]
+
+    async def handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        await download(update, context, platform)
+
+    handler.__name__ = f"{name}_download"
+    handler.__doc__ = f"Handle /{name} command - Download from {name}"
+    return handler
+
+async def auto_download(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /dl command - Download from any supported link"""
+    await download(update, context)
+
+tiktok_download = make_download_handler('tiktok')
+facebook_download = make_download_handler('facebook')
+instagram_download = make_download_handler('instagram')
+twitter_download = make_download_handler('twitter')
+pinterest_download = make_download_handler('pinterest')
+apk_download = make_download_handler('apk')
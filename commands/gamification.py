@@ -6,10 +6,13 @@ XP points, levels, badges, and achievements
 
 import logging
 import sqlite3
-from datetime import datetime, date, timedelta
+from datetime import date, timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ContextTypes
+from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters
 from db import get_connection
+from services.badges import badge_engine
+from services.leaderboard import leaderboard_index
+from services.xp_accumulator import xp_accumulator
 
 logger = logging.getLogger(__name__)
 
@@ -22,11 +25,33 @@ XP_VALUES = {
     'special_command': 15
 }
 
+# Command -> counter category (used by the special badges)
+COMMAND_CATEGORIES = {
+    'ai': 'ai',
+    'resume': 'ai',
+    'idee': 'ai',
+    'chatbot': 'ai',
+    'traduire': 'translate',
+    'blague': 'fun',
+    'citation': 'fun',
+    'meme': 'fun',
+    'film': 'fun',
+    'profil': 'stats',
+    'classement': 'stats',
+    'stats': 'stats',
+    'gamestats': 'stats'
+}
+
 # Level thresholds
 LEVEL_THRESHOLDS = [0, 50, 150, 300, 500, 750, 1100, 1500, 2000, 2600, 3300, 4100, 5000]
 
 def get_user_stats(user_id: int):
     """Get user gamification stats"""
+    # Buffered stats are newer than the database
+    cached = xp_accumulator.peek(user_id)
+    if cached and cached['last_activity']:
+        return cached
+    
     conn = get_connection()
     cursor = conn.cursor()
     
@@ -62,54 +87,59 @@ def get_user_stats(user_id: int):
     finally:
         conn.close()
 
-def add_xp(user_id: int, xp_amount: int, command: str = None):
-    """Add XP to user and check for level up"""
-    conn = get_connection()
-    cursor = conn.cursor()
+def add_xp(user_id: int, xp_amount: int, command: str = None, chat_id: int = None):
+    """Add XP to user and check for level up (buffered by the XP accumulator)"""
+    today = date.today()
     
-    try:
-        stats = get_user_stats(user_id)
-        new_xp = stats['xp_points'] + xp_amount
-        new_level = calculate_level(new_xp)
+    with xp_accumulator.lock:
+        stats = xp_accumulator.load(user_id)
+        old_level = stats['level']
         
-        # Update streak
-        today = date.today()
-        last_activity = datetime.strptime(stats['last_activity'], '%Y-%m-%d').date()
+        stats['xp_points'] += xp_amount
+        stats['level'] = calculate_level(stats['xp_points'])
+        stats['total_commands'] += 1
+        stats['streak_days'] = next_streak(stats, today)
+        stats['last_activity'] = today.isoformat()
         
-        if today == last_activity:
-            # Same day, no streak change
-            new_streak = stats['streak_days']
-        elif today == last_activity + timedelta(days=1):
-            # Consecutive day
-            new_streak = stats['streak_days'] + 1
-        else:
-            # Streak broken
-            new_streak = 1
-        
-        # Update stats
-        cursor.execute('''
-            UPDATE user_stats 
-            SET xp_points = ?, level = ?, total_commands = total_commands + 1, 
-                streak_days = ?, last_activity = ?
-            WHERE user_id = ?
-        ''', (new_xp, new_level, new_streak, today.isoformat(), user_id))
+        # Count the command in its category
+        category = COMMAND_CATEGORIES.get(command)
+        if category:
+            badge_engine.increment(user_id, category)
         
-        conn.commit()
+        # Check for new badges (in memory)
+        new_badges = badge_engine.evaluate(user_id, stats)
         
-        # Check for new badges
-        check_and_award_badges(user_id, cursor)
-        conn.commit()
-        
-        return {
-            'old_level': stats['level'],
-            'new_level': new_level,
-            'xp_gained': xp_amount,
-            'total_xp': new_xp,
-            'level_up': new_level > stats['level']
-        }
-        
-    finally:
-        conn.close()
+        xp_accumulator.mark_dirty(user_id, category, [badge.badge_id for badge in new_badges])
+        new_xp = stats['xp_points']
+        new_level = stats['level']
+        total_commands = stats['total_commands']
+    
+    # Keep the rank index in sync
+    leaderboard_index.record(user_id, new_xp, total_commands, chat_id)
+    
+    return {
+        'old_level': old_level,
+        'new_level': new_level,
+        'xp_gained': xp_amount,
+        'total_xp': new_xp,
+        'level_up': new_level > old_level,
+        'new_badges': [badge.name for badge in new_badges]
+    }
+
+def next_streak(stats: dict, today: date) -> int:
+    """Streak after an activity today"""
+    if not stats['last_activity']:
+        return 1
+    
+    last_activity = date.fromisoformat(stats['last_activity'])
+    if today == last_activity:
+        # Same day, no streak change
+        return stats['streak_days']
+    elif today == last_activity + timedelta(days=1):
+        # Consecutive day
+        return stats['streak_days'] + 1
+    # Streak broken
+    return 1
 
 def calculate_level(xp: int) -> int:
     """Calculate level based on XP"""
@@ -118,43 +148,6 @@ def calculate_level(xp: int) -> int:
             return level - 1
     return len(LEVEL_THRESHOLDS)
 
-def check_and_award_badges(user_id: int, cursor):
-    """Check and award new badges to user"""
-    stats = get_user_stats(user_id)
-    
-    # Get all badges user doesn't have
-    cursor.execute('''
-        SELECT b.id, b.name, b.xp_required, b.special_condition
-        FROM badges b
-        WHERE b.id NOT IN (
-            SELECT badge_id FROM user_badges WHERE user_id = ?
-        )
-    ''', (user_id,))
-    
-    available_badges = cursor.fetchall()
-    new_badges = []
-    
-    for badge_id, name, xp_required, special_condition in available_badges:
-        earned = False
-        
-        if special_condition == "first_command" and stats['total_commands'] >= 1:
-            earned = True
-        elif special_condition == "streak_7" and stats['streak_days'] >= 7:
-            earned = True
-        elif special_condition == "streak_30" and stats['streak_days'] >= 30:
-            earned = True
-        elif not special_condition and stats['xp_points'] >= xp_required:
-            earned = True
-        
-        if earned:
-            cursor.execute('''
-                INSERT INTO user_badges (user_id, badge_id)
-                VALUES (?, ?)
-            ''', (user_id, badge_id))
-            new_badges.append(name)
-    
-    return new_badges
-
 async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /profil command - Show user profile with XP and badges"""
     user = update.effective_user
@@ -237,39 +230,69 @@ async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /classement command - Show XP leaderboard"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT u.first_name, u.username, us.xp_points, us.level, us.total_commands
-        FROM user_stats us
-        JOIN users u ON us.user_id = u.id
-        ORDER BY us.xp_points DESC
-        LIMIT 10
-    ''')
+    user = update.effective_user
+    chat = update.effective_chat
+    args = context.args or []
     
-    top_users = cursor.fetchall()
-    conn.close()
+    # /classement groupe -> ranking of the current group only
+    group_mode = bool(args) and args[0].lower() in ('groupe', 'group') and chat.id != user.id
+    board = leaderboard_index.board(chat.id if group_mode else None)
+    top_users = board.top(10)
     
     if not top_users:
         await update.message.reply_text("📭 **Aucun utilisateur dans le classement**")
         return
     
-    leaderboard_text = """
-🏆 **CLASSEMENT XP - TOP 10**
+    names = get_display_names([user_id for user_id, _ in top_users])
+    
+    title = "CLASSEMENT DU GROUPE" if group_mode else "CLASSEMENT XP"
+    leaderboard_text = f"""
+🏆 **{title} - TOP 10**
 
 """
     
     medals = ["🥇", "🥈", "🥉"] + ["🏅"] * 7
     
-    for i, (first_name, username, xp, level, commands) in enumerate(top_users):
+    for i, (user_id, xp) in enumerate(top_users):
         medal = medals[i]
-        name = first_name or username or "Utilisateur"
+        name = names.get(user_id, "Utilisateur")
+        commands = leaderboard_index.total_commands.get(user_id, 0)
         leaderboard_text += f"{medal} **{name}**\n"
-        leaderboard_text += f"   Niveau {level} • {xp} XP • {commands} cmd\n\n"
+        leaderboard_text += f"   Niveau {calculate_level(xp)} • {xp} XP • {commands} cmd\n\n"
+    
+    # Player's own position
+    rank = board.rank(user.id)
+    if rank:
+        leaderboard_text += f"📍 **Votre rang :** #{rank} / {len(board)}"
+        leaderboard_text += f" (mieux que {board.percentile(user.id):.0f}% des joueurs)\n"
+        if rank > 10:
+            neighbours = board.around(user.id, radius=1)
+            neighbour_names = get_display_names([user_id for _, user_id, _ in neighbours])
+            for position, user_id, xp in neighbours:
+                marker = "➡️" if user_id == user.id else "  "
+                leaderboard_text += f"{marker} #{position} {neighbour_names.get(user_id, 'Utilisateur')} • {xp} XP\n"
     
     await update.message.reply_text(leaderboard_text, parse_mode='Markdown')
 
+def get_display_names(user_ids):
+    """Get display names for a few Telegram user IDs"""
+    if not user_ids:
+        return {}
+    
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    placeholders = ','.join('?' * len(user_ids))
+    cursor.execute(f'''
+        SELECT telegram_id, first_name, username
+        FROM users WHERE telegram_id IN ({placeholders})
+    ''', [str(user_id) for user_id in user_ids])
+    
+    names = {int(telegram_id): first_name or username or "Utilisateur"
+             for telegram_id, first_name, username in cursor.fetchall()}
+    conn.close()
+    return names
+
 def create_progress_bar(percentage: float, length: int = 10) -> str:
     """Create a visual progress bar"""
     filled = int(percentage / 100 * length)
@@ -277,7 +300,7 @@ def create_progress_bar(percentage: float, length: int = 10) -> str:
     return f"{'█' * filled}{'░' * empty} {percentage:.1f}%"
 
 # Hook this into command execution
-def award_command_xp(user_id: int, command: str):
+def award_command_xp(user_id: int, command: str, chat_id: int = None):
     """Award XP for using a command"""
     xp_amount = XP_VALUES['command_use']
     
@@ -285,4 +308,30 @@ def award_command_xp(user_id: int, command: str):
     if command in ['ai', 'resume', 'idee']:
         xp_amount += XP_VALUES['special_command']
     
-    return add_xp(user_id, xp_amount, command)
+    return add_xp(user_id, xp_amount, command, chat_id)
+
+def register_xp_tracking(application: Application):
+    """Award XP for every registered command, before its handler runs"""
+    known_commands = {
+        command
+        for handler in application.handlers.get(0, [])
+        if isinstance(handler, CommandHandler)
+        for command in handler.commands
+    }
+    
+    async def track_command_xp(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        message = update.effective_message
+        user = update.effective_user
+        if not message or not message.text or not user:
+            return
+        
+        command = message.text.split()[0][1:].split('@')[0].lower()
+        if command not in known_commands:
+            return
+        
+        try:
+            award_command_xp(user.id, command, update.effective_chat.id)
+        except Exception as e:
+            logger.error(f"Error awarding XP for /{command}: {e}")
+    
+    application.add_handler(MessageHandler(filters.COMMAND, track_command_xp), group=-1)
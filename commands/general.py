@@ -99,7 +99,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 **🎮 Fun :**
 • /blague - Blague aléatoire
-• /citation - Citation inspirante
+• /citation [thème] - Citation inspirante
 
 Pour la liste complète : /imenu (menu interactif)
     """
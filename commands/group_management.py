@@ -5,7 +5,6 @@ Professional group and channel integration features
 """
 
 import os
-import json
 import logging
 from pathlib import Path
 from datetime import datetime
@@ -13,32 +12,14 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from telegram.constants import ChatType
 from db import get_user, add_history
+from services.store import JsonStore
 
 logger = logging.getLogger(__name__)
 
 # Data file for group settings
 GROUP_DATA_FILE = Path(__file__).parent.parent / "data" / "group_settings.json"
 
-def load_group_settings():
-    """Load group settings from file"""
-    try:
-        GROUP_DATA_FILE.parent.mkdir(exist_ok=True)
-        if GROUP_DATA_FILE.exists():
-            with open(GROUP_DATA_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {'groups': {}, 'channels': {}}
-    except Exception as e:
-        logger.error(f"Error loading group settings: {e}")
-        return {'groups': {}, 'channels': {}}
-
-def save_group_settings(data):
-    """Save group settings to file"""
-    try:
-        GROUP_DATA_FILE.parent.mkdir(exist_ok=True)
-        with open(GROUP_DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-    except Exception as e:
-        logger.error(f"Error saving group settings: {e}")
+group_settings = JsonStore("group_settings", GROUP_DATA_FILE, sections=('groups', 'channels'))
 
 async def welcome_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Welcome message when bot is added to a group"""
@@ -46,16 +27,12 @@ async def welcome_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if chat.type in [ChatType.GROUP, ChatType.SUPERGROUP]:
         # Save group info
-        settings = load_group_settings()
-        chat_id_str = str(chat.id)
-        
-        settings['groups'][chat_id_str] = {
+        group_settings.set('groups', str(chat.id), {
             'name': chat.title,
             'type': chat.type,
             'added_at': datetime.now().isoformat(),
             'member_count': await context.bot.get_chat_member_count(chat.id)
-        }
-        save_group_settings(settings)
+        })
         
         # Create welcome keyboard
         keyboard = [
@@ -339,9 +316,7 @@ async def group_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
         admin_count = len(admins)
         
         # Load settings
-        settings = load_group_settings()
-        chat_id_str = str(chat.id)
-        group_data = settings.get('groups', {}).get(chat_id_str, {})
+        group_data = group_settings.get('groups', str(chat.id), {})
         
         # Check features status
         from commands.chatbot import is_chatbot_enabled
@@ -3,59 +3,81 @@ NICE-BOT - Info & Fun Commands
 /citation, /blague, /film, /news, /wiki commands
 """
 
-import os
 import logging
 import aiohttp
 import random
-import json
 from pathlib import Path
-from telegram import Update
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, LinkPreviewOptions, Update
 from telegram.ext import ContextTypes
 from db import get_user, add_history
+from services.content_pool import ContentPool
+from services.media_cache import remember_sent, send_cached, url_key
+from services.memes import meme_buffer
+from services.metrics import http_trace
+from services.news import news_feed
+from services.movies import FILM_PREFETCH, movie_client, query_token
+from services.wiki import split_language, wiki_client
 
 logger = logging.getLogger(__name__)
 
-# Load local citations database
+# Used when neither the local database nor the API answers
+FALLBACK_QUOTES = [
+    ("La seule façon de faire du bon travail est d'aimer ce que vous faites.", "Steve Jobs"),
+    ("L'innovation distingue un leader d'un suiveur.", "Steve Jobs"),
+    ("La vie, c'est comme une bicyclette, il faut avancer pour ne pas perdre l'équilibre.", "Albert Einstein"),
+    ("Le succès, c'est d'aller d'échec en échec sans perdre son enthousiasme.", "Winston Churchill"),
+    ("Il n'y a qu'une façon d'échouer, c'est d'abandonner avant d'avoir réussi.", "Georges Clemenceau")
+]
+
+FALLBACK_JOKES = [
+    "Pourquoi les plongeurs plongent-ils toujours en arrière et jamais en avant ? Parce que sinon, ils tombent dans le bateau !",
+    "Que dit un escargot quand il croise une limace ? 'Regarde, un nudiste !'",
+    "Comment appelle-t-on un chat tombé dans un pot de peinture le jour de Noël ? Un chat-mallow !",
+    "Pourquoi les poissons n'aiment pas jouer au tennis ? Parce qu'ils ont peur du filet !",
+    "Que dit un informaticien quand il se noie ? F1 ! F1 !",
+    "Comment appelle-t-on un boomerang qui ne revient pas ? Un bâton !",
+    "Pourquoi les développeurs préfèrent-ils le mode sombre ? Parce que la lumière attire les bugs !"
+]
+
+# Local databases, reloaded when the JSON files change
 CITATIONS_FILE = Path(__file__).parent.parent / "data" / "citations.json"
-LOCAL_CITATIONS = []
-
-try:
-    if CITATIONS_FILE.exists():
-        with open(CITATIONS_FILE, 'r', encoding='utf-8') as f:
-            LOCAL_CITATIONS = json.load(f)
-        logger.info(f"Loaded {len(LOCAL_CITATIONS)} local citations")
-except Exception as e:
-    logger.error(f"Error loading local citations: {e}")
-    LOCAL_CITATIONS = []
-
-# Load local jokes database
 BLAGUES_FILE = Path(__file__).parent.parent / "data" / "blagues.json"
-LOCAL_BLAGUES = []
 
-try:
-    if BLAGUES_FILE.exists():
-        with open(BLAGUES_FILE, 'r', encoding='utf-8') as f:
-            LOCAL_BLAGUES = json.load(f)
-        logger.info(f"Loaded {len(LOCAL_BLAGUES)} local jokes")
-except Exception as e:
-    logger.error(f"Error loading local jokes: {e}")
-    LOCAL_BLAGUES = []
+citation_pool = ContentPool(
+    'citations', CITATIONS_FILE,
+    text_of=lambda entry: entry.get('quote', '') if isinstance(entry, dict) else '',
+    author_of=lambda entry: entry.get('author') if isinstance(entry, dict) else None
+)
+blague_pool = ContentPool(
+    'blagues', BLAGUES_FILE,
+    text_of=lambda entry: entry.get('joke', '') if isinstance(entry, dict) else str(entry)
+)
 
 async def citation(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /citation command - Inspirational quotes from local database"""
+    """Handle /citation [thème|auteur] - Inspirational quotes from local database"""
     user = update.effective_user
+    theme = ' '.join(context.args) if context.args else None
     
     # Log command
     db_user = get_user(str(user.id))
     if db_user:
-        add_history(db_user['id'], '/citation')
+        add_history(db_user['id'], '/citation', theme or '')
     
     try:
-        # Use local citations database first
-        if LOCAL_CITATIONS:
-            citation_data = random.choice(LOCAL_CITATIONS)
+        # Use local citations database first, without repeats per chat
+        if len(citation_pool):
+            citation_data = citation_pool.next(update.effective_chat.id, theme)
+            if citation_data is None:
+                await update.message.reply_text(
+                    f"❌ Aucune citation pour '{theme}'.\n\n"
+                    "**Exemples :** /citation succès, /citation vie, /citation Einstein",
+                    parse_mode='Markdown'
+                )
+                return
             quote = citation_data['quote']
             author = citation_data['author']
+            source = (f"{citation_pool.count(theme)} citations « {theme} »" if theme
+                      else f"{len(citation_pool)} citations")
             
             response_text = f"""
 ✨ **Citation inspirante**
@@ -65,14 +87,14 @@ async def citation(update: Update, context: ContextTypes.DEFAULT_TYPE):
 **— {author}**
 
 🌟 Partagez cette inspiration !
-🐍 *Base locale Python - {len(LOCAL_CITATIONS)} citations*
+🐍 *Base locale Python - {source}*
             """
             
             await update.message.reply_text(response_text, parse_mode='Markdown')
             return
         
         # Fallback to API if local database not available
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(trace_configs=[http_trace()]) as session:
             async with session.get("https://api.quotable.io/random") as response:
                 if response.status == 200:
                     data = await response.json()
@@ -100,15 +122,7 @@ async def citation(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def send_fallback_quote(update):
     """Send a fallback quote when API is unavailable"""
-    fallback_quotes = [
-        ("La seule façon de faire du bon travail est d'aimer ce que vous faites.", "Steve Jobs"),
-        ("L'innovation distingue un leader d'un suiveur.", "Steve Jobs"),
-        ("La vie, c'est comme une bicyclette, il faut avancer pour ne pas perdre l'équilibre.", "Albert Einstein"),
-        ("Le succès, c'est d'aller d'échec en échec sans perdre son enthousiasme.", "Winston Churchill"),
-        ("Il n'y a qu'une façon d'échouer, c'est d'abandonner avant d'avoir réussi.", "Georges Clemenceau")
-    ]
-    
-    quote, author = random.choice(fallback_quotes)
+    quote, author = random.choice(FALLBACK_QUOTES)
     
     response_text = f"""
 ✨ **Citation inspirante**
@@ -123,18 +137,26 @@ async def send_fallback_quote(update):
     await update.message.reply_text(response_text, parse_mode='Markdown')
 
 async def blague(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /blague command - Random jokes from local database"""
+    """Handle /blague [thème] - Random jokes from local database"""
     user = update.effective_user
+    theme = ' '.join(context.args) if context.args else None
     
     # Log command
     db_user = get_user(str(user.id))
     if db_user:
-        add_history(db_user['id'], '/blague')
+        add_history(db_user['id'], '/blague', theme or '')
     
     try:
-        # Use local jokes database first
-        if LOCAL_BLAGUES:
-            joke = random.choice(LOCAL_BLAGUES)
+        # Use local jokes database first, without repeats per chat
+        if len(blague_pool):
+            joke = blague_pool.next(update.effective_chat.id, theme)
+            if joke is None:
+                await update.message.reply_text(f"❌ Aucune blague pour '{theme}'.")
+                return
+            if isinstance(joke, dict):
+                joke = joke['joke']
+            source = (f"{blague_pool.count(theme)} blagues « {theme} »" if theme
+                      else f"{len(blague_pool)} blagues")
             
             response_text = f"""
 😂 **Blague du jour**
@@ -142,14 +164,14 @@ async def blague(update: Update, context: ContextTypes.DEFAULT_TYPE):
 {joke}
 
 🎭 Bonne humeur garantie !
-🐍 *Base locale Python - {len(LOCAL_BLAGUES)} blagues*
+🐍 *Base locale Python - {source}*
             """
             
             await update.message.reply_text(response_text, parse_mode='Markdown')
             return
         
         # Fallback to API if local database not available
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(trace_configs=[http_trace()]) as session:
             # Get a safe joke in French if possible, otherwise English
             url = "https://v2.jokeapi.dev/joke/Any?blacklistFlags=nsfw,religious,political,racist,sexist,explicit&type=single"
             
@@ -180,17 +202,7 @@ async def blague(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def send_fallback_joke(update):
     """Send a fallback joke when API is unavailable"""
-    fallback_jokes = [
-        "Pourquoi les plongeurs plongent-ils toujours en arrière et jamais en avant ? Parce que sinon, ils tombent dans le bateau !",
-        "Que dit un escargot quand il croise une limace ? 'Regarde, un nudiste !'",
-        "Comment appelle-t-on un chat tombé dans un pot de peinture le jour de Noël ? Un chat-mallow !",
-        "Pourquoi les poissons n'aiment pas jouer au tennis ? Parce qu'ils ont peur du filet !",
-        "Que dit un informaticien quand il se noie ? F1 ! F1 !",
-        "Comment appelle-t-on un boomerang qui ne revient pas ? Un bâton !",
-        "Pourquoi les développeurs préfèrent-ils le mode sombre ? Parce que la lumière attire les bugs !"
-    ]
-    
-    joke = random.choice(fallback_jokes)
+    joke = random.choice(FALLBACK_JOKES)
     
     response_text = f"""
 😂 **Blague du jour**
@@ -202,6 +214,68 @@ async def send_fallback_joke(update):
     
     await update.message.reply_text(response_text, parse_mode='Markdown')
 
+def film_card(hits, index: int, token: str, details=None):
+    """Text and carousel keyboard of one search result"""
+    movie = hits[index]
+    
+    # Format rating stars
+    stars = "⭐" * int(movie.vote_average / 2) if movie.vote_average > 0 else "❓"
+    
+    extra = ""
+    if details:
+        facts = []
+        if details.genres:
+            facts.append(f"**Genres :** {', '.join(details.genres)}")
+        if details.runtime:
+            facts.append(f"**Durée :** {details.runtime // 60}h{details.runtime % 60:02d}")
+        if details.directors:
+            facts.append(f"**Réalisation :** {', '.join(details.directors)}")
+        if details.cast:
+            facts.append(f"**Avec :** {', '.join(details.cast)}")
+        if details.tagline:
+            facts.append(f"_{details.tagline}_")
+        extra = '\n'.join(facts)
+    
+    overview = movie.overview
+    text = f"""
+🎬 **Informations sur le film** ({index + 1}/{len(hits)})
+
+**Titre :** {movie.title}
+{f"**Titre original :** {movie.original_title}" if movie.original_title and movie.original_title != movie.title else ""}
+{extra}
+
+**Synopsis :**
+{overview[:300]}{'...' if len(overview) > 300 else ''}
+
+**Date de sortie :** {movie.release_date}
+**Note :** {movie.vote_average}/10 {stars} ({movie.vote_count} votes)
+
+*Données fournies par TMDB*
+    """
+    
+    buttons = []
+    if index > 0:
+        buttons.append(InlineKeyboardButton("◀️ Précédent", callback_data=f"film:{token}:{index - 1}"))
+    if index < len(hits) - 1:
+        buttons.append(InlineKeyboardButton("Suivant ▶️", callback_data=f"film:{token}:{index + 1}"))
+    reply_markup = InlineKeyboardMarkup([buttons]) if buttons else None
+    
+    # The poster shows as a large preview above the card
+    if movie.poster_url:
+        preview = LinkPreviewOptions(url=movie.poster_url, prefer_large_media=True, show_above_text=True)
+    else:
+        preview = LinkPreviewOptions(is_disabled=True)
+    return text, reply_markup, preview
+
+async def film_details(hits, index: int):
+    """Details of a card (cached), and the next cards warmed in the background"""
+    movie_client.prefetch(hits[index + 1:index + 1 + FILM_PREFETCH])
+    try:
+        return await movie_client.details(hits[index].id)
+    except Exception as e:
+        logger.error(f"Movie details error: {e}")
+        return None
+
 async def film(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /film command - Movie search using TMDB"""
     user = update.effective_user
@@ -221,61 +295,61 @@ async def film(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     movie_name = ' '.join(context.args)
-    tmdb_api_key = os.getenv("TMDB_API_KEY")
     
-    if not tmdb_api_key:
+    if not movie_client.key:
         await update.message.reply_text("❌ Service de recherche de films temporairement indisponible.")
         return
     
     try:
-        async with aiohttp.ClientSession() as session:
-            # Search for movie
-            search_url = f"https://api.themoviedb.org/3/search/movie?api_key={tmdb_api_key}&query={movie_name}&language=fr-FR"
-            
-            async with session.get(search_url) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    
-                    if data['results']:
-                        movie = data['results'][0]  # Get first result
-                        
-                        title = movie.get('title', 'N/A')
-                        original_title = movie.get('original_title', '')
-                        overview = movie.get('overview', 'Pas de description disponible.')
-                        release_date = movie.get('release_date', 'N/A')
-                        vote_average = movie.get('vote_average', 0)
-                        vote_count = movie.get('vote_count', 0)
-                        
-                        # Format rating stars
-                        stars = "⭐" * int(vote_average / 2) if vote_average > 0 else "❓"
-                        
-                        response_text = f"""
-🎬 **Informations sur le film**
-
-**Titre :** {title}
-{f"**Titre original :** {original_title}" if original_title != title else ""}
-
-**Synopsis :**
-{overview[:300]}{'...' if len(overview) > 300 else ''}
-
-**Date de sortie :** {release_date}
-**Note :** {vote_average}/10 {stars} ({vote_count} votes)
-
-*Données fournies par TMDB*
-                        """
-                        
-                        await update.message.reply_text(response_text, parse_mode='Markdown')
-                    else:
-                        await update.message.reply_text(f"❌ Aucun film trouvé pour '{movie_name}'.")
-                else:
-                    await update.message.reply_text("❌ Erreur lors de la recherche de films.")
+        # Cached per normalized query; the top results become a carousel
+        hits = await movie_client.search(movie_name)
+        
+        if not hits:
+            await update.message.reply_text(f"❌ Aucun film trouvé pour '{movie_name}'.")
+            return
+        
+        details = await film_details(hits, 0)
+        text, reply_markup, preview = film_card(hits, 0, query_token(movie_name), details)
+        await update.message.reply_text(
+            text,
+            parse_mode='Markdown',
+            reply_markup=reply_markup,
+            link_preview_options=preview
+        )
     
     except Exception as e:
         logger.error(f"Movie search error: {e}")
         await update.message.reply_text("❌ Erreur lors de la recherche de films.")
 
+async def film_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle the /film carousel buttons (callback data film:<token>:<index>)"""
+    query = update.callback_query
+    _, token, index = query.data.split(':')
+    movie_name = movie_client.query_for(token)
+    
+    if movie_name is None:
+        await query.answer("⌛ Recherche expirée, relancez /film", show_alert=True)
+        return
+    
+    try:
+        hits = await movie_client.search(movie_name)
+        index = min(int(index), len(hits) - 1)
+        details = await film_details(hits, index)
+        text, reply_markup, preview = film_card(hits, index, token, details)
+        await query.answer()
+        await query.edit_message_text(
+            text,
+            parse_mode='Markdown',
+            reply_markup=reply_markup,
+            link_preview_options=preview
+        )
+    
+    except Exception as e:
+        logger.error(f"Movie carousel error: {e}")
+        await query.answer("❌ Erreur lors de la recherche de films.", show_alert=True)
+
 async def news(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /news command - Latest news using PrinceTech Wikimedia"""
+    """Handle /news command - Latest news from the background-refreshed feed"""
     user = update.effective_user
     
     # Log command
@@ -283,9 +357,6 @@ async def news(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if db_user:
         add_history(db_user['id'], '/news', ' '.join(context.args) if context.args else '')
     
-    # Default topics if no argument provided
-    default_topics = ["Technology", "Science", "World News", "Business", "Sports"]
-    
     if not context.args:
         await update.message.reply_text(
             "📰 **Actualités**\n\n"
@@ -303,50 +374,39 @@ async def news(update: Update, context: ContextTypes.DEFAULT_TYPE):
     topic = ' '.join(context.args)
     
     try:
-        # Send typing action
-        await update.message.reply_chat_action("typing")
+        # Indexed topics answer from memory; new ones are fetched once, then kept fresh
+        articles = await news_feed.lookup(topic)
         
-        async with aiohttp.ClientSession() as session:
-            # Use PrinceTech Wikimedia API
-            princetechn_api_key = os.getenv("PRINCETECHN_API_KEY", "prince")
-            url = f"https://api.princetechn.com/api/search/wikimedia"
-            params = {
-                "apikey": princetechn_api_key,
-                "title": topic
-            }
-            
-            async with session.get(url, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    
-                    if data.get('success') and data.get('result'):
-                        result = data['result']
-                        
-                        # Extract information
-                        title = result.get('title', topic)
-                        extract = result.get('extract', 'Aucune information disponible.')
-                        thumbnail = result.get('thumbnail', {}).get('source', '')
-                        page_url = result.get('content_urls', {}).get('desktop', {}).get('page', '')
-                        
-                        response_text = f"""
-📰 **Actualités - {title}**
-
-{extract[:500]}{'...' if len(extract) > 500 else ''}
+        if not articles:
+            await update.message.reply_text(
+                f"❌ Aucune actualité trouvée pour '{topic}'.\n\n"
+                "Essayez avec un autre sujet ou un nom plus précis.",
+                parse_mode='Markdown'
+            )
+            return
+        
+        # A lone article gets the full-size extract
+        length = 500 if len(articles) == 1 else 250
+        blocks = []
+        for article in articles:
+            summary = article.summary or 'Aucune information disponible.'
+            source = f" _({article.source})_" if article.source else ""
+            blocks.append(
+                f"**{article.title}**{source}\n"
+                f"{summary[:length]}{'...' if len(summary) > length else ''}\n"
+                f"🔗 {article.url}"
+            )
+        separator = '\n\n'
+        
+        response_text = f"""
+📰 **Actualités - {topic}**
 
-🔗 **Plus d'infos :** {page_url if page_url else 'Non disponible'}
+{separator.join(blocks)}
 
 ✨ *Propulsé par NICE-BOT*
-                        """
-                        
-                        await update.message.reply_text(response_text, parse_mode='Markdown')
-                    else:
-                        await update.message.reply_text(
-                            f"❌ Aucune actualité trouvée pour '{topic}'.\n\n"
-                            "Essayez avec un autre sujet ou un nom plus précis.",
-                            parse_mode='Markdown'
-                        )
-                else:
-                    await update.message.reply_text("❌ Erreur lors de la récupération des actualités.")
+        """
+        
+        await update.message.reply_text(response_text, parse_mode='Markdown')
     
     except Exception as e:
         logger.error(f"News error: {e}")
@@ -365,74 +425,34 @@ async def wiki(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(
             "❌ **Usage :** /wiki <terme de recherche>\n\n"
             "**Exemple :** /wiki Intelligence artificielle\n"
-            "**Exemple :** /wiki Python programmation",
+            "**Exemple :** /wiki Python programmation\n"
+            "**Autre langue :** /wiki en:Machine learning",
             parse_mode='Markdown'
         )
         return
     
-    search_term = ' '.join(context.args)
+    lang, search_term = split_language(' '.join(context.args))
     
     try:
-        async with aiohttp.ClientSession() as session:
-            # Search Wikipedia in French
-            search_url = f"https://fr.wikipedia.org/api/rest_v1/page/summary/{search_term}"
-            
-            async with session.get(search_url) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    
-                    title = data.get('title', search_term)
-                    extract = data.get('extract', 'Aucun résumé disponible.')
-                    page_url = data.get('content_urls', {}).get('desktop', {}).get('page', '')
-                    
-                    # Get thumbnail if available
-                    thumbnail = data.get('thumbnail', {}).get('source', '')
-                    
-                    response_text = f"""
-📖 **Wikipédia - {title}**
-
-{extract}
+        # Summary and search run together, across the language chain, cached
+        page = await wiki_client.lookup(search_term, lang)
+        
+        if page is None:
+            await update.message.reply_text(f"❌ Aucun article trouvé pour '{search_term}' sur Wikipédia.")
+            return
+        
+        language = f" ({page.lang.upper()})" if page.lang != 'fr' else ""
+        response_text = f"""
+📖 **Wikipédia{language} - {page.title}**
 
-🔗 **Lien complet :** {page_url}
+{page.extract}
 
-*Source : Wikipédia*
-                    """
-                    
-                    await update.message.reply_text(response_text, parse_mode='Markdown')
-                    
-                elif response.status == 404:
-                    # Try search API if direct page not found
-                    search_api_url = f"https://fr.wikipedia.org/w/api.php?action=query&format=json&list=search&srsearch={search_term}&srlimit=1"
-                    
-                    async with session.get(search_api_url) as search_response:
-                        if search_response.status == 200:
-                            search_data = await search_response.json()
-                            
-                            if search_data.get('query', {}).get('search'):
-                                page_title = search_data['query']['search'][0]['title']
-                                snippet = search_data['query']['search'][0]['snippet']
-                                
-                                # Remove HTML tags from snippet
-                                import re
-                                clean_snippet = re.sub('<.*?>', '', snippet)
-                                
-                                response_text = f"""
-📖 **Wikipédia - {page_title}**
-
-{clean_snippet}...
-
-🔗 **Lien :** https://fr.wikipedia.org/wiki/{page_title.replace(' ', '_')}
+🔗 **Lien complet :** {page.url}
 
 *Source : Wikipédia*
-                                """
-                                
-                                await update.message.reply_text(response_text, parse_mode='Markdown')
-                            else:
-                                await update.message.reply_text(f"❌ Aucun article trouvé pour '{search_term}' sur Wikipédia.")
-                        else:
-                            await update.message.reply_text("❌ Erreur lors de la recherche sur Wikipédia.")
-                else:
-                    await update.message.reply_text("❌ Erreur lors de la recherche sur Wikipédia.")
+        """
+        
+        await update.message.reply_text(response_text, parse_mode='Markdown')
     
     except Exception as e:
         logger.error(f"Wikipedia error: {e}")
@@ -448,71 +468,51 @@ async def meme(update: Update, context: ContextTypes.DEFAULT_TYPE):
         add_history(db_user['id'], '/meme')
     
     try:
-        # Send typing action
-        await update.message.reply_chat_action("upload_photo")
+        # Prefetched and already filtered (no NSFW, sendable media); live fetch if empty
+        item = await meme_buffer.get()
+        if item is None:
+            await update.message.reply_text(
+                "❌ **Erreur API Meme**\n\n"
+                "Impossible de récupérer un meme pour le moment. Réessayez plus tard !",
+                parse_mode='Markdown'
+            )
+            return
         
-        async with aiohttp.ClientSession() as session:
-            # Get random meme from Reddit API
-            api_url = "https://meme-api.com/gimme"
-            
-            async with session.get(api_url) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    
-                    # Extract meme data
-                    title = data.get('title', 'Meme sans titre')
-                    url = data.get('url', '')
-                    subreddit = data.get('subreddit', 'unknown')
-                    author = data.get('author', 'unknown')
-                    ups = data.get('ups', 0)
-                    post_link = data.get('postLink', '')
-                    nsfw = data.get('nsfw', False)
-                    spoiler = data.get('spoiler', False)
-                    
-                    # Check if content is appropriate
-                    if nsfw:
-                        await update.message.reply_text(
-                            "🔞 **Contenu NSFW détecté**\n\n"
-                            "Ce meme contient du contenu pour adultes et ne peut pas être affiché.\n"
-                            "Réessayez pour obtenir un autre meme !",
-                            parse_mode='Markdown'
-                        )
-                        return
-                    
-                    # Prepare caption
-                    caption = f"""
-😂 **{title}**
+        # Prepare caption
+        caption = f"""
+😂 **{item.title}**
 
-📱 **Subreddit :** r/{subreddit}
-👤 **Auteur :** u/{author}
-⬆️ **Upvotes :** {ups:,}
-{'⚠️ **Spoiler**' if spoiler else ''}
+📱 **Subreddit :** r/{item.subreddit}
+👤 **Auteur :** u/{item.author}
+⬆️ **Upvotes :** {item.ups:,}
+{'⚠️ **Spoiler**' if item.spoiler else ''}
 
-🔗 [Voir sur Reddit]({post_link})
-                    """
-                    
-                    # Send meme
-                    if url.endswith(('.gif', '.mp4', '.webm')):
-                        # Send as animation/video
-                        await update.message.reply_animation(
-                            animation=url,
-                            caption=caption,
-                            parse_mode='Markdown'
-                        )
-                    else:
-                        # Send as photo
-                        await update.message.reply_photo(
-                            photo=url,
-                            caption=caption,
-                            parse_mode='Markdown'
-                        )
-                        
-                else:
-                    await update.message.reply_text(
-                        "❌ **Erreur API Meme**\n\n"
-                        "Impossible de récupérer un meme pour le moment. Réessayez plus tard !",
-                        parse_mode='Markdown'
-                    )
+🔗 [Voir sur Reddit]({item.post_link})
+        """
+        
+        # Already uploaded once: resend by file_id
+        if await send_cached(context.bot, update.effective_chat.id, url_key(item.url),
+                             caption=caption, parse_mode='Markdown'):
+            return
+        
+        await update.message.reply_chat_action("upload_photo")
+        
+        # Send meme
+        if item.is_animation:
+            # Send as animation/video
+            sent = await update.message.reply_animation(
+                animation=item.url,
+                caption=caption,
+                parse_mode='Markdown'
+            )
+        else:
+            # Send as photo
+            sent = await update.message.reply_photo(
+                photo=item.url,
+                caption=caption,
+                parse_mode='Markdown'
+            )
+        remember_sent(url_key(item.url), sent)
     
     except Exception as e:
         logger.error(f"Meme API error: {e}")
@@ -8,6 +8,7 @@ import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
 from telegram.ext import ContextTypes, CallbackQueryHandler
 from datetime import datetime
+from services.media_cache import asset_key, remember_sent, send_cached
 
 logger = logging.getLogger(__name__)
 
@@ -66,14 +67,21 @@ Cliquez sur les boutons ci-dessous pour explorer toutes les fonctionnalités de
         image_path = Path(__file__).parent.parent / "assets" / "menu.png"
         
         if image_path.exists():
+            # Menu image already uploaded: reuse its file_id
+            key = asset_key(image_path)
+            if await send_cached(context.bot, update.effective_chat.id, key, caption=menu_text,
+                                 reply_markup=reply_markup, parse_mode='Markdown'):
+                return
+            
             # Send photo with caption and buttons
             with open(image_path, 'rb') as photo:
-                await update.message.reply_photo(
+                sent = await update.message.reply_photo(
                     photo=photo,
                     caption=menu_text,
                     reply_markup=reply_markup,
                     parse_mode='Markdown'
                 )
+            remember_sent(key, sent)
         else:
             # Fallback: send text only if image not found
             await update.message.reply_text(
@@ -5,16 +5,106 @@ Push notifications, reminders, and alerts
 """
 
 import logging
-import asyncio
 from datetime import datetime, timedelta
 from telegram import Update
 from telegram.ext import ContextTypes
+from telegram.helpers import escape_markdown
 import re
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from services.reminders import (
+    MAX_REMINDERS_PER_USER, WEEKDAYS, get_zone, next_fire, reminder_scheduler
+)
+from services.weather_alerts import (
+    MAX_PLACES_PER_CHAT, RULES, WEATHER_ALERT_INTERVAL, parse_rules, weather_alert_engine
+)
 
 logger = logging.getLogger(__name__)
 
-# Store active reminders (in production, use Redis or database)
-active_reminders = {}
+# Longest relative delay accepted by /rappel (absolute and recurring times have no limit)
+MAX_RELATIVE_DELAY = 30 * 86400
+
+CLOCK_PATTERN = re.compile(r'^(\d{1,2}):(\d{2})$')
+DATE_PATTERN = re.compile(r'^(\d{1,2})/(\d{1,2})(?:/(\d{4}))?$')
+ISO_DATE_PATTERN = re.compile(r'^(\d{4})-(\d{2})-(\d{2})$')
+
+def parse_clock(token: str):
+    """'08:30' -> (8, 30), None if not a valid time of day"""
+    match = CLOCK_PATTERN.match(token)
+    if not match:
+        return None
+    hour, minute = int(match.group(1)), int(match.group(2))
+    return (hour, minute) if hour < 24 and minute < 60 else None
+
+def parse_schedule(args, timezone: str):
+    """(fire time, cron recurrence or None, words used) from the start of /rappel args.
+
+    Accepted forms, in the user's timezone:
+    5min | 18:30 | demain 08:00 | 25/12 09:00 | 2025-12-25 09:00 |
+    chaque jour 08:00 | chaque lundi 09:00 | cron 0 9 * * 1-5
+    Returns None if the args do not start with a schedule.
+    """
+    zone = get_zone(timezone)
+    now = datetime.now(zone)
+    first = args[0].lower()
+    
+    if first == "cron" and len(args) >= 6:
+        recurrence = " ".join(args[1:6])
+        return next_fire(recurrence, timezone, now.timestamp()), recurrence, 6
+    
+    if first == "chaque" and len(args) >= 3:
+        clock = parse_clock(args[2])
+        if clock is None:
+            return None
+        day = args[1].lower()
+        if day == "jour":
+            recurrence = f"{clock[1]} {clock[0]} * * *"
+        elif day in WEEKDAYS:
+            recurrence = f"{clock[1]} {clock[0]} * * {WEEKDAYS[day]}"
+        else:
+            return None
+        return next_fire(recurrence, timezone, now.timestamp()), recurrence, 3
+    
+    clock = parse_clock(first)
+    if clock:
+        target = now.replace(hour=clock[0], minute=clock[1], second=0, microsecond=0)
+        if target <= now:
+            target += timedelta(days=1)
+        return target.timestamp(), None, 1
+    
+    if len(args) >= 2 and parse_clock(args[1]):
+        hour, minute = parse_clock(args[1])
+        date_match = DATE_PATTERN.match(first)
+        iso_match = ISO_DATE_PATTERN.match(first)
+        if first == "demain":
+            day = (now + timedelta(days=1)).date()
+        elif date_match:
+            year = int(date_match.group(3) or now.year)
+            day = datetime(year, int(date_match.group(2)), int(date_match.group(1))).date()
+            if not date_match.group(3) and day < now.date():
+                day = day.replace(year=year + 1)
+        elif iso_match:
+            day = datetime(*(int(x) for x in iso_match.groups())).date()
+        else:
+            return None
+        target = datetime(day.year, day.month, day.day, hour, minute, tzinfo=zone)
+        return target.timestamp(), None, 2
+    
+    seconds = parse_time_string(first)
+    if seconds is None:
+        return None
+    return now.timestamp() + seconds, None, 1
+
+def describe_recurrence(recurrence: str) -> str:
+    """Readable form of the recurrences /rappel creates"""
+    minute, hour, day, month, weekday = recurrence.split()
+    if day == month == "*" and minute.isdigit() and hour.isdigit():
+        clock = f"{int(hour):02d}:{int(minute):02d}"
+        if weekday == "*":
+            return f"chaque jour à {clock}"
+        names = {str(number): name for name, number in WEEKDAYS.items()}
+        if weekday in names:
+            return f"chaque {names[weekday]} à {clock}"
+    return f"cron `{recurrence}`"
 
 async def set_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /rappel command - Set personal reminders"""
@@ -23,119 +113,104 @@ async def set_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE):
         help_text = """
 ⏰ **SYSTÈME DE RAPPELS**
 
-**Usage :** `/rappel <temps> <message>`
+**Usage :** `/rappel <quand> <message>`
 
-**Exemples :**
+**Dans un moment :**
 • `/rappel 5min Réunion équipe`
-• `/rappel 1h Appeler maman`
-• `/rappel 30s Test rapide`
 • `/rappel 2h30min Pause déjeuner`
 
-**Formats supportés :**
-• `Xs` → secondes
-• `Xmin` → minutes  
-• `Xh` → heures
-• `XhYmin` → heures et minutes
+**À une heure précise :**
+• `/rappel 18:30 Appeler maman`
+• `/rappel demain 08:00 Dentiste`
+• `/rappel 25/12 09:00 Joyeux Noël`
 
-🎯 **Astuce :** Le bot vous enverra une notification privée !
+**Récurrents :**
+• `/rappel chaque jour 08:00 Sport`
+• `/rappel chaque lundi 09:00 Réunion`
+• `/rappel cron 0 9 * * 1-5 Stand-up`
+
+🌍 **Fuseau horaire :** `/fuseau Europe/Paris`
+📋 **Gérer :** `/rappels`, `/rappels annuler <n°>`
         """
         
         await update.message.reply_text(help_text, parse_mode='Markdown')
         return
     
-    # Parse time and message
-    time_str = context.args[0]
-    message = " ".join(context.args[1:]) if len(context.args) > 1 else "Rappel !"
+    user_id = update.effective_user.id
+    timezone = reminder_scheduler.timezone(user_id)
     
-    # Parse time format
-    total_seconds = parse_time_string(time_str)
+    try:
+        schedule = parse_schedule(context.args, timezone)
+    except ValueError:
+        schedule = None
     
-    if total_seconds is None:
+    if schedule is None:
         await update.message.reply_text(
             "❌ **Format de temps invalide**\n\n"
-            "Utilisez : `5min`, `1h`, `30s`, `2h30min`",
+            "Utilisez : `5min`, `18:30`, `demain 08:00`, `chaque jour 08:00`\n"
+            "Tapez `/rappel` pour tous les exemples.",
             parse_mode='Markdown'
         )
         return
     
-    if total_seconds > 86400:  # Max 24h
+    fire_at, recurrence, used = schedule
+    message = " ".join(context.args[used:]) or "Rappel !"
+    delay = fire_at - datetime.now().timestamp()
+    
+    if delay <= 0:
+        await update.message.reply_text("❌ **Cette date est déjà passée**", parse_mode='Markdown')
+        return
+    
+    if not recurrence and delay > MAX_RELATIVE_DELAY and used == 1 and parse_clock(context.args[0]) is None:
         await update.message.reply_text(
-            "❌ **Durée trop longue**\n\nMaximum : 24 heures",
+            "❌ **Durée trop longue**\n\nMaximum : 30 jours (utilisez une date pour plus loin)",
             parse_mode='Markdown'
         )
         return
     
-    user_id = update.effective_user.id
-    reminder_time = datetime.now() + timedelta(seconds=total_seconds)
-    
-    # Create reminder
-    reminder_id = f"{user_id}_{int(datetime.now().timestamp())}"
-    active_reminders[reminder_id] = {
-        'user_id': user_id,
-        'message': message,
-        'time': reminder_time,
-        'chat_id': update.effective_chat.id
-    }
-    
-    # Schedule the reminder
-    asyncio.create_task(send_reminder(context.bot, reminder_id, total_seconds))
+    reminder_id = reminder_scheduler.add(
+        user_id, update.effective_chat.id, message, fire_at, recurrence, timezone
+    )
+    if reminder_id is None:
+        await update.message.reply_text(
+            f"❌ **Limite atteinte** : {MAX_REMINDERS_PER_USER} rappels maximum.\n\n"
+            "Supprimez-en un avec `/rappels annuler <n°>`.",
+            parse_mode='Markdown'
+        )
+        return
     
     # Confirmation message
-    time_formatted = format_duration(total_seconds)
+    when = datetime.fromtimestamp(fire_at, get_zone(timezone))
+    repeat = f"\n🔁 **Récurrence :** {describe_recurrence(recurrence)}" if recurrence else ""
     confirmation_text = f"""
-✅ **RAPPEL PROGRAMMÉ**
+✅ **RAPPEL PROGRAMMÉ** (n°{reminder_id})
 
-⏰ **Dans :** {time_formatted}
-📝 **Message :** {message}
-🕐 **Heure :** {reminder_time.strftime('%H:%M:%S')}
+⏰ **Dans :** {format_duration(int(delay))}
+📝 **Message :** {escape_markdown(message)}
+🕐 **Heure :** {when.strftime('%d/%m/%Y %H:%M')} ({timezone}){repeat}
 
-🔔 **Je vous préviendrai en privé !**
+🔔 **Je vous préviendrai ici !**
     """
     
     await update.message.reply_text(confirmation_text, parse_mode='Markdown')
 
-async def send_reminder(bot, reminder_id: str, delay_seconds: int):
-    """Send reminder after delay"""
-    try:
-        # Wait for the specified time
-        await asyncio.sleep(delay_seconds)
-        
-        # Check if reminder still exists (could be cancelled)
-        if reminder_id not in active_reminders:
-            return
-        
-        reminder = active_reminders[reminder_id]
-        
-        # Send reminder message
-        reminder_text = f"""
-🔔 **RAPPEL !**
-
-📝 **Message :** {reminder['message']}
-🕐 **Programmé à :** {reminder['time'].strftime('%H:%M:%S')}
-
-✅ **C'est maintenant !**
-        """
-        
-        await bot.send_message(
-            chat_id=reminder['chat_id'],
-            text=reminder_text,
-            parse_mode='Markdown'
-        )
-        
-        # Remove from active reminders
-        del active_reminders[reminder_id]
-        
-    except Exception as e:
-        logger.error(f"Error sending reminder {reminder_id}: {e}")
-
 async def list_reminders(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /rappels command - List active reminders"""
+    """Handle /rappels command - List or cancel the user's reminders"""
     
     user_id = update.effective_user.id
-    user_reminders = [
-        r for r in active_reminders.values() 
-        if r['user_id'] == user_id
-    ]
+    
+    if context.args and context.args[0].lower() in ("annuler", "stop", "supprimer"):
+        if len(context.args) < 2 or not context.args[1].lstrip('n°#').isdigit():
+            await update.message.reply_text("❌ **Usage :** `/rappels annuler <n°>`", parse_mode='Markdown')
+            return
+        reminder_id = int(context.args[1].lstrip('n°#'))
+        if reminder_scheduler.cancel(user_id, reminder_id):
+            await update.message.reply_text(f"🗑️ **Rappel n°{reminder_id} annulé**", parse_mode='Markdown')
+        else:
+            await update.message.reply_text("❌ Aucun de vos rappels ne porte ce numéro.")
+        return
+    
+    user_reminders = reminder_scheduler.list(user_id)
     
     if not user_reminders:
         await update.message.reply_text(
@@ -145,57 +220,158 @@ async def list_reminders(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     reminders_text = "⏰ **VOS RAPPELS ACTIFS**\n\n"
+    now = datetime.now().timestamp()
     
-    for i, reminder in enumerate(user_reminders, 1):
-        time_left = reminder['time'] - datetime.now()
-        if time_left.total_seconds() > 0:
-            time_str = format_duration(int(time_left.total_seconds()))
-            reminders_text += f"**{i}.** {reminder['message']}\n"
-            reminders_text += f"   ⏱️ Dans {time_str}\n\n"
+    for reminder in user_reminders:
+        when = datetime.fromtimestamp(reminder.next_fire, get_zone(reminder.timezone))
+        time_str = format_duration(max(0, int(reminder.next_fire - now)))
+        reminders_text += f"**n°{reminder.id}** {escape_markdown(reminder.message)}\n"
+        reminders_text += f"   ⏱️ Dans {time_str} ({when.strftime('%d/%m %H:%M')})\n"
+        if reminder.recurrence:
+            reminders_text += f"   🔁 {describe_recurrence(reminder.recurrence)}\n"
+        reminders_text += "\n"
     
+    reminders_text += "🗑️ `/rappels annuler <n°>` pour supprimer"
     await update.message.reply_text(reminders_text, parse_mode='Markdown')
 
+async def set_timezone(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /fuseau command - Timezone used for the user's reminders"""
+    
+    user_id = update.effective_user.id
+    
+    if not context.args:
+        await update.message.reply_text(
+            f"🌍 **Fuseau horaire actuel :** `{reminder_scheduler.timezone(user_id)}`\n\n"
+            "**Changer :** `/fuseau <zone>`\n"
+            "**Exemples :** `/fuseau Europe/Paris`, `/fuseau Africa/Abidjan`, `/fuseau America/Montreal`",
+            parse_mode='Markdown'
+        )
+        return
+    
+    timezone = context.args[0]
+    try:
+        zone = ZoneInfo(timezone)
+    except (ZoneInfoNotFoundError, ValueError):
+        await update.message.reply_text(
+            f"❌ Fuseau horaire inconnu : `{timezone}`\n\nFormat : `Continent/Ville`, ex. `Europe/Paris`",
+            parse_mode='Markdown'
+        )
+        return
+    
+    reminder_scheduler.set_timezone(user_id, timezone)
+    await update.message.reply_text(
+        f"✅ **Fuseau horaire :** `{timezone}`\n"
+        f"🕐 Il est {datetime.now(zone).strftime('%H:%M')} chez vous.\n\n"
+        "Les nouveaux rappels utiliseront ce fuseau.",
+        parse_mode='Markdown'
+    )
+
+def format_rule(rule: str, threshold: float) -> str:
+    """'vent>' 60 -> '💨 Vent fort (≥ 60 km/h)'"""
+    spec = RULES.get(rule)
+    if spec is None:
+        # Stored before parse_rules rejected it: shown as is, never evaluated
+        return f"❔ `{rule}` {threshold:g}"
+    if not spec.unit:
+        return spec.label
+    return f"{spec.label} ({'≥' if spec.above else '≤'} {threshold:g} {spec.unit})"
+
 async def weather_alerts(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /alertes command - Weather alert system"""
+    """Handle /alertes command - Weather alert subscriptions"""
     
     if not context.args:
         help_text = """
 🌦️ **ALERTES MÉTÉO**
 
-**Usage :** `/alertes <ville>`
+**Usage :** `/alertes <ville> [règles]`
 
-**Exemple :** `/alertes Paris`
+**Exemples :**
+• `/alertes Paris` → toutes les alertes, seuils par défaut
+• `/alertes Lyon vent>50 temp>30`
+• `/alertes Montréal temp<-15 neige`
 
-🎯 **Fonctionnalités :**
-• Alerte orage automatique
-• Notification pluie/neige
-• Températures extrêmes
-• Vent fort
+🎯 **Règles :**
+• `temp>X` / `temp<X` → températures extrêmes (°C)
+• `vent>X` → vent fort (km/h)
+• `pluie>X` → pluie intense (mm)
+• `orage`, `neige`
 
-⚠️ **Note :** Notifications envoyées en temps réel
+⚙️ **Gérer :** `/alertes liste`, `/alertes stop [ville]`
         """
         
         await update.message.reply_text(help_text, parse_mode='Markdown')
         return
     
-    city = " ".join(context.args)
-    user_id = update.effective_user.id
+    chat_id = update.effective_chat.id
+    action = context.args[0].lower()
+    
+    if action in ("liste", "list"):
+        places = weather_alert_engine.subscriptions(chat_id)
+        if not places:
+            await update.message.reply_text(
+                "📭 **Aucune alerte météo**\n\nUtilisez `/alertes <ville>` pour en créer une !",
+                parse_mode='Markdown'
+            )
+            return
+        
+        lines = ["🌦️ **VOS ALERTES MÉTÉO**\n"]
+        for name, rules in places.items():
+            lines.append(f"📍 **{name}**")
+            lines.extend(f"   • {format_rule(rule, threshold)}" for rule, threshold in rules)
+            lines.append("")
+        await update.message.reply_text('\n'.join(lines), parse_mode='Markdown')
+        return
+    
+    if action == "stop":
+        city = " ".join(context.args[1:])
+        removed = weather_alert_engine.unsubscribe(chat_id, city or None)
+        if removed:
+            await update.message.reply_text(
+                f"🔕 **Alertes désactivées**{f' pour {city}' if city else ''}",
+                parse_mode='Markdown'
+            )
+        else:
+            await update.message.reply_text("📭 Aucune alerte météo correspondante.")
+        return
+    
+    # Trailing tokens that read as rules are rules, the rest is the city
+    args = list(context.args)
+    rule_tokens = []
+    while len(args) > 1 and parse_rules([args[-1]]) is not None:
+        rule_tokens.insert(0, args.pop())
+    city = " ".join(args)
+    rules = parse_rules(rule_tokens) or {name: spec.default for name, spec in RULES.items()}
+    
+    try:
+        place = await weather_alert_engine.geocode(city)
+    except Exception as e:
+        logger.error(f"Weather alert geocoding error: {e}")
+        await update.message.reply_text("❌ Erreur lors de la géolocalisation.")
+        return
+    
+    if place is None:
+        await update.message.reply_text(f"❌ Ville '{city}' non trouvée.")
+        return
+    
+    if not weather_alert_engine.subscribe(update.effective_user.id, chat_id, place, rules):
+        await update.message.reply_text(
+            f"❌ **Limite atteinte** : {MAX_PLACES_PER_CHAT} villes maximum.\n\n"
+            "Retirez-en une avec `/alertes stop <ville>`.",
+            parse_mode='Markdown'
+        )
+        return
     
-    # Simulate weather alert setup (in production, integrate with weather API)
+    rule_lines = '\n'.join(f"• {format_rule(rule, threshold)}" for rule, threshold in rules.items())
     alert_text = f"""
 ✅ **ALERTES MÉTÉO ACTIVÉES**
 
-📍 **Ville :** {city}
+📍 **Ville :** {place.name}
 👤 **Utilisateur :** {update.effective_user.first_name}
 
 🔔 **Vous recevrez des alertes pour :**
-• ⛈️ Orages et tempêtes
-• 🌧️ Pluie intense
-• ❄️ Neige et verglas
-• 🌡️ Températures extrêmes
-• 💨 Vents forts
+{rule_lines}
 
-📱 **Notifications :** Temps réel
+📱 **Vérification :** toutes les {WEATHER_ALERT_INTERVAL // 60} min
 ⚙️ **Gérer :** `/alertes stop` pour désactiver
     """
     
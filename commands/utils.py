@@ -5,14 +5,18 @@ NICE-BOT - Utility Commands
 
 import os
 import io
+import re
 import logging
 import aiohttp
 import qrcode
-from fpdf import FPDF
-from telegram import Update
+from telegram import InputMediaDocument, InputMediaPhoto, Update
 from telegram.ext import ContextTypes
 from datetime import datetime
 from db import get_user, add_history
+from services.pdf import PDFTooLarge, pdf_renderer
+from services.rates import rate_engine
+from services.metrics import http_trace
+from services.qr import DEFAULT_SIZE, MAX_BATCH, MAX_SIZE, MIN_SIZE, QRSpec, qr_engine, render_remote
 
 logger = logging.getLogger(__name__)
 
@@ -83,7 +87,7 @@ async def traduire(update: Update, context: ContextTypes.DEFAULT_TYPE):
         translated_text = None
         api_used = None
         
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(trace_configs=[http_trace()]) as session:
             # Try API 1: Google Translate (unofficial)
             try:
                 url = f"https://translate.googleapis.com/translate_a/single?client=gtx&sl=auto&tl={target_lang}&dt=t&q={quote(text_to_translate)}"
@@ -158,6 +162,13 @@ async def traduire(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         
         await update.message.reply_text(response_text, parse_mode='Markdown')
+        
+        # Kept for /pdf traduction
+        context.user_data['last_translation'] = {
+            'original': text_to_translate,
+            'translated': translated_text,
+            'target_lang': target_lang,
+        }
     
     except Exception as e:
         logger.error(f"Translation error: {e}")
@@ -187,7 +198,7 @@ async def meteo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Send typing action
         await update.message.reply_chat_action("typing")
         
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(trace_configs=[http_trace()]) as session:
             # Try PrinceTech API first (more detailed data)
             try:
                 princetechn_api_key = os.getenv("PRINCETECHN_API_KEY", "prince")
@@ -307,8 +318,17 @@ async def meteo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Weather error: {e}")
         await update.message.reply_text("❌ Erreur lors de la récupération de la météo. Service temporairement indisponible.")
 
+CURRENCY_SYMBOLS = {
+    'USD': '$', 'EUR': '€', 'GBP': '£', 'JPY': '¥',
+    'CNY': '¥', 'INR': '₹', 'RUB': '₽', 'BTC': '₿',
+    'XOF': 'CFA', 'XAF': 'CFA', 'MAD': 'DH', 'DZD': 'DA', 'TND': 'DT'
+}
+
+# Target currencies accepted in one /devise
+MAX_CONVERSIONS = 15
+
 async def devise(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /devise command - Currency conversion with built-in rates"""
+    """Handle /devise command - Currency conversion with live rates"""
     user = update.effective_user
     
     # Log command
@@ -323,105 +343,80 @@ async def devise(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "║        DEVISES            ║\n"
             "╚════════════════════════════╝\n\n"
             "**Usage :**\n"
-            "`/devise <montant> <de> <vers>`\n\n"
+            "`/devise <montant> <de> <vers>`\n"
+            "`/devise <montant> <de> <vers1>,<vers2>,...`\n\n"
             "**Exemples :**\n"
             "`/devise 100 USD EUR`\n"
             "`/devise 50 EUR GBP`\n"
-            "`/devise 1000 XOF EUR`\n\n"
+            "`/devise 100 EUR USD,GBP,XOF`\n\n"
             "**Devises supportées :**\n"
             "💵 USD, EUR, GBP, JPY, CNY\n"
             "💰 CAD, AUD, CHF, INR, RUB\n"
             "🌍 XOF, XAF, MAD, DZD, TND\n"
-            "🏦 BTC, ETH (crypto)",
+            "🏦 BTC, ETH (crypto)\n"
+            f"… et {len(rate_engine.table.codes)} au total",
             parse_mode='Markdown'
         )
         return
     
     try:
-        amount = float(context.args[0])
+        amount = float(context.args[0].replace(',', '.'))
         from_currency = context.args[1].upper()
-        to_currency = context.args[2].upper()
+        targets = [
+            code for code in re.split(r'[,\s]+', ' '.join(context.args[2:]).upper()) if code
+        ]
+        targets = list(dict.fromkeys(targets))[:MAX_CONVERSIONS]
         
-        # Taux de change par rapport à l'EUR (base)
-        exchange_rates = {
-            'EUR': 1.0,
-            'USD': 1.09,      # Dollar américain
-            'GBP': 0.86,      # Livre sterling
-            'JPY': 161.50,    # Yen japonais
-            'CNY': 7.85,      # Yuan chinois
-            'CAD': 1.48,      # Dollar canadien
-            'AUD': 1.66,      # Dollar australien
-            'CHF': 0.94,      # Franc suisse
-            'INR': 90.50,     # Roupie indienne
-            'RUB': 100.00,    # Rouble russe
-            'XOF': 655.96,    # Franc CFA (BCEAO)
-            'XAF': 655.96,    # Franc CFA (BEAC)
-            'MAD': 10.80,     # Dirham marocain
-            'DZD': 146.50,    # Dinar algérien
-            'TND': 3.38,      # Dinar tunisien
-            'BRL': 5.42,      # Real brésilien
-            'MXN': 18.60,     # Peso mexicain
-            'ZAR': 20.30,     # Rand sud-africain
-            'KRW': 1450.00,   # Won sud-coréen
-            'SGD': 1.45,      # Dollar singapourien
-            'HKD': 8.50,      # Dollar de Hong Kong
-            'NOK': 11.70,     # Couronne norvégienne
-            'SEK': 11.40,     # Couronne suédoise
-            'DKK': 7.46,      # Couronne danoise
-            'PLN': 4.35,      # Zloty polonais
-            'THB': 38.50,     # Baht thaïlandais
-            'IDR': 17000.00,  # Roupie indonésienne
-            'MYR': 5.10,      # Ringgit malaisien
-            'PHP': 61.50,     # Peso philippin
-            'BTC': 0.000016,  # Bitcoin
-            'ETH': 0.00045,   # Ethereum
-        }
+        # One snapshot for the whole reply, even if a refresh lands meanwhile
+        table = rate_engine.table
         
         # Vérifier si les devises sont supportées
-        if from_currency not in exchange_rates:
+        unknown = [code for code in [from_currency] + targets if code not in table]
+        if unknown:
             await update.message.reply_text(
-                f"❌ **Devise non supportée : {from_currency}**\n\n"
+                f"❌ **Devise non supportée : {', '.join(unknown)}**\n\n"
                 "Utilisez `/devise` sans arguments pour voir la liste des devises.",
                 parse_mode='Markdown'
             )
             return
         
-        if to_currency not in exchange_rates:
-            await update.message.reply_text(
-                f"❌ **Devise non supportée : {to_currency}**\n\n"
-                "Utilisez `/devise` sans arguments pour voir la liste des devises.",
-                parse_mode='Markdown'
-            )
-            return
+        from_symbol = CURRENCY_SYMBOLS.get(from_currency, from_currency)
+        updated = datetime.fromisoformat(table.updated_at).strftime('%d/%m/%Y %H:%M')
         
-        # Conversion : montant -> EUR -> devise cible
-        amount_in_eur = amount / exchange_rates[from_currency]
-        converted_amount = amount_in_eur * exchange_rates[to_currency]
-        rate = exchange_rates[to_currency] / exchange_rates[from_currency]
-        
-        # Déterminer les symboles de devises
-        currency_symbols = {
-            'USD': '$', 'EUR': '€', 'GBP': '£', 'JPY': '¥',
-            'CNY': '¥', 'INR': '₹', 'RUB': '₽', 'BTC': '₿',
-            'XOF': 'CFA', 'XAF': 'CFA', 'MAD': 'DH', 'DZD': 'DA', 'TND': 'DT'
-        }
-        
-        from_symbol = currency_symbols.get(from_currency, from_currency)
-        to_symbol = currency_symbols.get(to_currency, to_currency)
-        
-        response_text = f"""
+        if len(targets) == 1:
+            to_currency = targets[0]
+            rate = table.rate(from_currency, to_currency)
+            to_symbol = CURRENCY_SYMBOLS.get(to_currency, to_currency)
+            response_text = f"""
 ╔════════════════════════════╗
 ║   💱 CONVERSION DEVISE    ║
 ╚════════════════════════════╝
 
 💰 **{amount:,.2f} {from_currency}** ({from_symbol})
         ⬇️
-💵 **{converted_amount:,.2f} {to_currency}** ({to_symbol})
+💵 **{amount * rate:,.2f} {to_currency}** ({to_symbol})
 
 📊 **Taux :** 1 {from_currency} = {rate:.4f} {to_currency}
+🕒 **Taux du :** {updated}
 
 ✨ *Conversion par NICE-BOT*
-        """
+            """
+        else:
+            lines = []
+            for to_currency in targets:
+                rate = table.rate(from_currency, to_currency)
+                lines.append(
+                    f"💵 **{amount * rate:,.2f} {to_currency}**  _(1 {from_currency} = {rate:.4f})_"
+                )
+            response_text = (
+                "╔════════════════════════════╗\n"
+                "║   💱 CONVERSION DEVISES   ║\n"
+                "╚════════════════════════════╝\n\n"
+                f"💰 **{amount:,.2f} {from_currency}** ({from_symbol})\n\n"
+                + '\n'.join(lines) +
+                f"\n\n🕒 **Taux du :** {updated}\n\n"
+                "✨ *Conversion par NICE-BOT*"
+            )
         
         await update.message.reply_text(response_text, parse_mode='Markdown')
     
@@ -440,106 +435,115 @@ async def devise(update: Update, context: ContextTypes.DEFAULT_TYPE):
             parse_mode='Markdown'
         )
 
+QR_OPTION_HELP = (
+    "**Options :**\n"
+    "`--svg` : fichier vectoriel SVG\n"
+    "`--taille=500` : taille en pixels (100-1000)\n"
+    "`--couleur=ff0000` / `--fond=ffffff` : couleurs (hex)\n"
+    "Séparez plusieurs textes par `|` pour un album."
+)
+
+def parse_qr_args(args):
+    """Split /qr arguments into payloads and a render spec (size, colors, format)"""
+    options = {'size': DEFAULT_SIZE, 'fill': '000000', 'back': 'ffffff', 'fmt': 'png'}
+    words = []
+    for arg in args:
+        name, _, value = arg.partition('=')
+        if name == '--svg':
+            options['fmt'] = 'svg'
+        elif name == '--taille' and value.isdigit():
+            options['size'] = min(max(int(value), MIN_SIZE), MAX_SIZE)
+        elif name in ('--couleur', '--fond') and re.fullmatch(r'#?[0-9a-fA-F]{6}', value):
+            options['fill' if name == '--couleur' else 'back'] = value.lstrip('#').lower()
+        else:
+            words.append(arg)
+
+    payloads = [part.strip() for part in ' '.join(words).split('|') if part.strip()]
+    return payloads, options
+
 async def qr(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /qr command - QR code generation using QR Server API"""
+    """Handle /qr command - Local QR code generation (PNG, SVG or album)"""
     user = update.effective_user
     
-    # ... (reste du code inchangé)
     # Log command
     db_user = get_user(str(user.id))
     if db_user:
         add_history(db_user['id'], '/qr', ' '.join(context.args))
     
-    if not context.args:
+    payloads, options = parse_qr_args(context.args or [])
+    if not payloads:
         await update.message.reply_text(
             "❌ **Usage :** /qr <texte ou URL>\n\n"
             "**Exemple :** /qr https://google.com\n"
             "**Exemple :** /qr Bonjour le monde !\n"
-            "**Exemple :** /qr Contactez-moi: +33123456789",
+            "**Exemple :** /qr --svg https://site.fr | https://autre.fr\n\n"
+            + QR_OPTION_HELP,
+            parse_mode='Markdown'
+        )
+        return
+    
+    if len(payloads) > MAX_BATCH:
+        await update.message.reply_text(
+            f"❌ **Maximum {MAX_BATCH} QR codes par album.**",
             parse_mode='Markdown'
         )
         return
     
-    text_to_encode = ' '.join(context.args)
+    specs = [QRSpec(payload, **options) for payload in payloads]
+    size_text = f"{options['size']}x{options['size']} pixels"
     
     try:
-        # Send typing action
-        await update.message.reply_chat_action("upload_photo")
+        await update.message.reply_chat_action(
+            "upload_document" if options['fmt'] == 'svg' else "upload_photo"
+        )
         
-        async with aiohttp.ClientSession() as session:
-            # Try QR Server API first (100% free, no limits)
-            try:
-                qr_api_url = "https://api.qrserver.com/v1/create-qr-code/"
-                params = {
-                    "size": "300x300",
-                    "data": text_to_encode,
-                    "format": "png",
-                    "bgcolor": "ffffff",
-                    "color": "000000",
-                    "qzone": "1",
-                    "margin": "10"
-                }
-                
-                async with session.get(qr_api_url, params=params) as response:
-                    if response.status == 200:
-                        # Get QR code image bytes
-                        qr_bytes = await response.read()
-                        
-                        # Create BytesIO object
-                        bio = io.BytesIO(qr_bytes)
-                        bio.name = f"qrcode_{user.id}_{int(datetime.now().timestamp())}.png"
-                        
-                        # Send QR code
-                        await update.message.reply_photo(
-                            photo=bio,
-                            caption=f"""
+        try:
+            images = await qr_engine.render_many(specs)
+        except qrcode.exceptions.DataOverflowError:
+            await update.message.reply_text(
+                "❌ **Texte trop long pour un QR code**\n\n"
+                "Limitez-vous à environ 2 000 caractères.",
+                parse_mode='Markdown'
+            )
+            return
+        except Exception as render_error:
+            # Local rendering should not fail; keep the remote API as a last resort
+            logger.warning(f"Local QR rendering failed, trying QR Server API: {render_error}")
+            images = [await render_remote(spec) for spec in specs]
+            if not all(images):
+                raise RuntimeError("QR Server API fallback failed") from render_error
+        
+        stamp = int(datetime.now().timestamp())
+        files = []
+        for index, data in enumerate(images, 1):
+            bio = io.BytesIO(data)
+            bio.name = f"qrcode_{user.id}_{stamp}_{index}.{options['fmt']}"
+            files.append(bio)
+        
+        if len(files) == 1:
+            text_to_encode = payloads[0]
+            caption = f"""
 📱 **QR Code généré avec succès !**
 
 📝 **Contenu :** {text_to_encode[:100]}{'...' if len(text_to_encode) > 100 else ''}
-📊 **Taille :** 300x300 pixels
-🎨 **Format :** PNG haute qualité
-🤖 **Généré par :** NICE-BOT via QR Server API
+📊 **Taille :** {size_text}
+🎨 **Format :** {options['fmt'].upper()}
 
 💡 *Scannez avec votre téléphone !*
-                            """,
-                            parse_mode='Markdown'
-                        )
-                        return
-                        
-            except Exception as api_error:
-                logger.warning(f"QR Server API failed, trying local generation: {api_error}")
-            
-            # Fallback to local QR code generation
-            qr_code = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=10,
-                border=4,
-            )
-            qr_code.add_data(text_to_encode)
-            qr_code.make(fit=True)
-            
-            # Create image
-            img = qr_code.make_image(fill_color="black", back_color="white")
-            
-            # Save to BytesIO
-            bio = io.BytesIO()
-            img.save(bio, format='PNG')
-            bio.seek(0)
-            bio.name = 'qrcode_local.png'
-            
-            # Send QR code
-            await update.message.reply_photo(
-                photo=bio,
-                caption=f"""
-📱 **QR Code généré (Local)**
-
-📝 **Contenu :** {text_to_encode[:100]}{'...' if len(text_to_encode) > 100 else ''}
-🔄 **Méthode :** Génération locale de secours
-💡 *Scannez avec votre téléphone !*
-                """,
-                parse_mode='Markdown'
-            )
+            """
+            if options['fmt'] == 'svg':
+                await update.message.reply_document(document=files[0], caption=caption, parse_mode='Markdown')
+            else:
+                await update.message.reply_photo(photo=files[0], caption=caption, parse_mode='Markdown')
+            return
+        
+        # Several payloads: one album, captions carry each content
+        media_type = InputMediaDocument if options['fmt'] == 'svg' else InputMediaPhoto
+        album = [
+            media_type(media=bio, caption=f"{index}. {payload[:100]}")
+            for index, (bio, payload) in enumerate(zip(files, payloads), 1)
+        ]
+        await update.message.reply_media_group(media=album)
     
     except Exception as e:
         logger.error(f"QR code generation error: {e}")
@@ -549,8 +553,14 @@ async def qr(update: Update, context: ContextTypes.DEFAULT_TYPE):
             parse_mode='Markdown'
         )
 
+PDF_SOURCES = {
+    'traduction': 'last_translation',
+    'ia': 'last_ai_answer',
+    'discussion': 'chat_transcript',
+}
+
 async def pdf(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /pdf command - PDF generation using local FPDF library"""
+    """Handle /pdf command - PDF generation from text or a previous result"""
     user = update.effective_user
     
     # Log command
@@ -563,58 +573,48 @@ async def pdf(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "❌ **Usage :** /pdf <texte>\n\n"
             "**Exemple :** /pdf Voici le contenu de mon PDF\n"
             "**Exemple :** /pdf Bonjour, ceci est un test de génération PDF avec NICE-BOT !\n\n"
+            "**Exporter un résultat :**\n"
+            "`/pdf traduction` - dernière traduction\n"
+            "`/pdf ia` - dernière réponse IA\n"
+            "`/pdf discussion` - conversation avec le chatbot\n\n"
             "💡 **Astuce :** Génération 100% locale, rapide et gratuite !",
             parse_mode='Markdown'
         )
         return
     
-    text_content = ' '.join(context.args)
+    author = user.first_name or 'N/A'
+    source = context.args[0].lower() if len(context.args) == 1 else None
+    
+    if source in PDF_SOURCES:
+        saved = context.user_data.get(PDF_SOURCES[source])
+        if not saved:
+            await update.message.reply_text(
+                f"❌ **Rien à exporter**\n\n"
+                f"Aucun(e) {source} récent(e) trouvé(e) pour vous.",
+                parse_mode='Markdown'
+            )
+            return
+        if source == 'traduction':
+            template, fields = 'translation', dict(saved)
+            summary = saved['translated']
+        elif source == 'ia':
+            template, fields = 'ai_answer', dict(saved)
+            summary = saved['question']
+        else:
+            template, fields = 'transcript', {'messages': list(saved)}
+            summary = f"{len(saved)} messages"
+    else:
+        template, fields = 'text', {'text': ' '.join(context.args)}
+        summary = fields['text']
     
     try:
         # Send typing action
         await update.message.reply_chat_action("upload_document")
         
-        # Create PDF using FPDF
-        pdf = FPDF()
-        pdf.add_page()
-        
-        # Add title
-        pdf.set_font("Arial", 'B', 16)
-        pdf.cell(0, 10, "Document NICE-BOT", ln=True, align='C')
-        pdf.ln(5)
-        
-        # Add metadata
-        pdf.set_font("Arial", 'I', 10)
-        pdf.cell(0, 5, f"Genere le: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}", ln=True)
-        pdf.cell(0, 5, f"Utilisateur: {user.first_name or 'N/A'}", ln=True)
-        pdf.ln(10)
-        
-        # Add content
-        pdf.set_font("Arial", size=12)
+        pdf_bytes = await pdf_renderer.render(template, author=author, **fields)
         
-        # Handle long text with proper encoding
-        try:
-            # Try to encode in latin-1 (FPDF default)
-            text_encoded = text_content.encode('latin-1', errors='replace').decode('latin-1')
-        except:
-            # Fallback: remove non-latin characters
-            text_encoded = text_content.encode('ascii', errors='ignore').decode('ascii')
-        
-        # Add text with word wrap
-        pdf.multi_cell(0, 10, text_encoded)
-        
-        # Add footer
-        pdf.ln(10)
-        pdf.set_font("Arial", 'I', 8)
-        pdf.cell(0, 5, "Powered by NICE-BOT - Generation locale Python", ln=True, align='C')
-        
-        # Generate PDF bytes (FPDF2 returns bytes directly)
-        pdf_bytes = pdf.output()
-        
-        # Create BytesIO object
         bio = io.BytesIO(pdf_bytes)
         bio.name = f"document_{user.id}_{int(datetime.now().timestamp())}.pdf"
-        bio.seek(0)
         
         # Send PDF document
         await update.message.reply_document(
@@ -622,7 +622,7 @@ async def pdf(update: Update, context: ContextTypes.DEFAULT_TYPE):
             caption=f"""
 📄 **PDF généré avec succès !**
 
-📝 **Contenu :** {text_content[:50]}{'...' if len(text_content) > 50 else ''}
+📝 **Contenu :** {summary[:50]}{'...' if len(summary) > 50 else ''}
 📊 **Taille :** {len(pdf_bytes):,} bytes
 🐍 **Méthode :** Génération locale Python (FPDF)
 ⚡ **Avantage :** 100% gratuit, rapide, sans API !
@@ -632,11 +632,17 @@ async def pdf(update: Update, context: ContextTypes.DEFAULT_TYPE):
             parse_mode='Markdown'
         )
     
+    except PDFTooLarge:
+        await update.message.reply_text(
+            "❌ **Texte trop long**\n\n"
+            f"Un PDF peut contenir au maximum {pdf_renderer.max_chars:,} caractères.",
+            parse_mode='Markdown'
+        )
+    
     except Exception as e:
         logger.error(f"PDF generation error: {e}")
         await update.message.reply_text(
             "❌ **Erreur lors de la génération du PDF**\n\n"
-            f"Détails: {str(e)}\n\n"
-            "Réessayez avec un texte plus court ou sans caractères spéciaux.",
+            "Réessayez avec un texte plus court.",
             parse_mode='Markdown'
         )
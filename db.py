@@ -3,11 +3,17 @@ NICE-BOT - Database Management
 SQLite database setup and operations
 """
 
+import re
 import sqlite3
 import os
+import time
 import logging
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from functools import lru_cache
+from typing import Optional, List, Dict, Any, Tuple
+
+from services.metrics import SQLITE_SECONDS
+from services.tracing import tracer
 
 logger = logging.getLogger(__name__)
 
@@ -19,7 +25,7 @@ def init_database():
     # Create data directory if it doesn't exist
     os.makedirs("data", exist_ok=True)
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     
     # Create users table
@@ -85,6 +91,128 @@ def init_database():
         )
     ''')
     
+    # Per-category command counters for special badges
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_counters (
+            user_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            count INTEGER DEFAULT 0,
+            PRIMARY KEY (user_id, category)
+        )
+    ''')
+    
+    # Group membership for per-group leaderboards
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chat_members (
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (chat_id, user_id)
+        )
+    ''')
+    
+    # Telegram file_id cache for already uploaded media
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS media_cache (
+            cache_key TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Background download jobs
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS download_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            platform TEXT NOT NULL,
+            query TEXT NOT NULL,
+            cache_key TEXT,
+            status_message_id INTEGER,
+            status TEXT NOT NULL DEFAULT 'queued',
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_download_jobs_status ON download_jobs (status)
+    ''')
+    
+    # Weather alert subscriptions: one row per chat, place and rule
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS weather_subscriptions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            place_key TEXT NOT NULL,
+            place_name TEXT NOT NULL,
+            latitude REAL NOT NULL,
+            longitude REAL NOT NULL,
+            rule TEXT NOT NULL,
+            threshold REAL NOT NULL,
+            last_alert_at REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (chat_id, place_key, rule)
+        )
+    ''')
+    
+    # Reminders: next_fire is a UNIX time, recurrence a cron expression (NULL = one-shot)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reminders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            message TEXT NOT NULL,
+            next_fire REAL NOT NULL,
+            recurrence TEXT,
+            timezone TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_reminders_user ON reminders (user_id, next_fire)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_reminders_next_fire ON reminders (next_fire)
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_timezones (
+            user_id INTEGER PRIMARY KEY,
+            timezone TEXT NOT NULL
+        )
+    ''')
+    
+    # Dashboard rollups: commands per hour, and who was active each day
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS activity_hourly (
+            hour TEXT NOT NULL,
+            command TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (hour, command)
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS activity_users (
+            day TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (day, user_id)
+        )
+    ''')
+    
+    # Shared settings store (used when SETTINGS_BACKEND=sqlite)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS kv_store (
+            store TEXT NOT NULL,
+            section TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            PRIMARY KEY (store, section, key)
+        )
+    ''')
+    
     conn.commit()
     
     # Initialize default badges
@@ -117,9 +245,53 @@ def init_default_badges(cursor):
             VALUES (?, ?, ?, ?, ?)
         ''', badge)
 
+TABLE_PATTERN = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE|ON)\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)', re.IGNORECASE)
+
+@lru_cache(maxsize=512)
+def statement_labels(sql: str) -> Tuple[str, str]:
+    """('SELECT', 'users') for a query, used to label its timing"""
+    words = sql.split(None, 1)
+    table = TABLE_PATTERN.search(sql)
+    return (words[0].upper() if words else ''), (table.group(1) if table else '')
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor recording how long each statement takes (and a span when a trace is active)"""
+    
+    def _observe(self, sql, start):
+        elapsed = time.perf_counter() - start
+        labels = statement_labels(sql)
+        SQLITE_SECONDS.observe(elapsed, *labels)
+        tracer.record(f"sqlite {' '.join(labels)}", start, elapsed)
+    
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._observe(sql, start)
+    
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._observe(sql, start)
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors (and execute shortcuts) are timed"""
+    
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+    
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
 def get_connection():
     """Get database connection"""
-    return sqlite3.connect(DB_PATH)
+    return sqlite3.connect(DB_PATH, factory=TimedConnection)
 
 def add_user(telegram_id: str, username: Optional[str] = None, first_name: Optional[str] = None) -> bool:
     """Add a new user to the database"""
@@ -187,7 +359,7 @@ def add_history(user_id: int, command: str, input_text: str = "", output_text: s
 
 def get_user_stats() -> Dict[str, int]:
     """Get user and command statistics"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     
     try:
@@ -208,7 +380,7 @@ def get_user_stats() -> Dict[str, int]:
 
 def get_all_users():
     """Get all users from database"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     
     try:
@@ -234,7 +406,7 @@ def get_all_users():
 
 def get_recent_history(limit=20):
     """Get recent command history"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     
     try:
@@ -6,14 +6,35 @@ Main entry point for the Telegram bot with FastAPI webhook handling
 import os
 import logging
 from datetime import datetime
+from pathlib import Path
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response
 from telegram import Update
 from telegram.ext import Application
 import uvicorn
 
 from bot import setup_bot, setup_menu_button
 from db import init_database
+from services.store import flush_all_stores
+from services.xp_accumulator import xp_accumulator
+from services.downloads import download_engine
+from services.download_jobs import download_queue
+from services.qr import qr_engine
+from services.pdf import pdf_renderer
+from services.rates import rate_engine
+from services.memes import meme_buffer
+from services.wiki import wiki_client
+from services.movies import movie_client
+from services.news import news_feed
+from services.reminders import reminder_scheduler
+from services.weather_alerts import weather_alert_engine
+from services.metrics import metrics
+from services.watchdog import loop_watchdog
+from services.tracing import tracer
+from services.profiler import PROFILE_DEFAULT_SECONDS, ProfilerBusy, profiler
+from services.dashboard import DASHBOARD_REFRESH, dashboard_stats
+from commands.downloader import run_download_job
 
 # Configure logging
 logging.basicConfig(
@@ -26,6 +47,8 @@ logger = logging.getLogger(__name__)
 bot_application = None
 start_time = datetime.now()
 
+DASHBOARD_TEMPLATE = Path(__file__).parent / "templates" / "dashboard.html"
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Handle application lifespan events"""
@@ -37,6 +60,19 @@ async def lifespan(app: FastAPI):
         init_database()
         logger.info("Database initialized")
         
+        # Loop lag, blocked-loop stacks and slow handlers
+        loop_watchdog.start()
+        
+        # JSON-lines export of webhook traces, when TRACE_EXPORT_FILE is set
+        tracer.start()
+        
+        # Batch XP writes
+        xp_accumulator.start()
+        rate_engine.start()
+        meme_buffer.start()
+        news_feed.start()
+        dashboard_stats.start()
+        
         # Setup bot
         bot_application = setup_bot()
         
@@ -47,12 +83,37 @@ async def lifespan(app: FastAPI):
         # Setup menu button with commands
         await setup_menu_button(bot_application)
         
+        # Background download workers
+        download_queue.start(bot_application.bot, run_download_job)
+        weather_alert_engine.start(bot_application.bot)
+        reminder_scheduler.start(bot_application.bot)
+        
+        # PDF workers parse their fonts now rather than on the first /pdf
+        await pdf_renderer.warm_up()
+        
         logger.info("Bot application started")
         
         yield
         
     finally:
         # Shutdown
+        await download_queue.stop()
+        await weather_alert_engine.stop()
+        await reminder_scheduler.stop()
+        await xp_accumulator.stop()
+        await rate_engine.stop()
+        await meme_buffer.stop()
+        await news_feed.stop()
+        await dashboard_stats.stop()
+        await loop_watchdog.stop()
+        await tracer.stop()
+        flush_all_stores()
+        await download_engine.close()
+        await wiki_client.close()
+        await movie_client.close()
+        qr_engine.shutdown()
+        pdf_renderer.shutdown()
+        
         if bot_application:
             await bot_application.stop()
             await bot_application.shutdown()
@@ -80,9 +141,65 @@ async def health_check():
         "timestamp": datetime.now().isoformat()
     }
 
+def require_token(request: Request, variable: str, required: bool = False):
+    """When the variable is set, require its value as a bearer token or ?token=.
+
+    With required, the route does not exist (404) while the variable is empty.
+    """
+    token = os.getenv(variable)
+    if not token:
+        if required:
+            raise HTTPException(status_code=404, detail="Not Found")
+        return
+    if request.headers.get("authorization") != f"Bearer {token}" and request.query_params.get("token") != token:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint(request: Request):
+    """Prometheus metrics (send METRICS_TOKEN as a bearer token when it is set)"""
+    require_token(request, "METRICS_TOKEN")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/profile", response_class=PlainTextResponse)
+async def profile_endpoint(request: Request, seconds: float = PROFILE_DEFAULT_SECONDS):
+    """Collapsed-stack profile of the running process (disabled unless PROFILE_TOKEN is set)"""
+    require_token(request, "PROFILE_TOKEN", required=True)
+    try:
+        result = await profiler.profile(seconds)
+    except ProfilerBusy:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    filename = f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.folded"
+    return PlainTextResponse(result.folded, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@app.get("/dashboard", response_class=HTMLResponse)
+async def dashboard(request: Request):
+    """Admin dashboard page, opened with ?token=DASHBOARD_TOKEN (disabled unless it is set)"""
+    require_token(request, "DASHBOARD_TOKEN", required=True)
+    return HTMLResponse(DASHBOARD_TEMPLATE.read_text(encoding="utf-8"))
+
+async def dashboard_response(request: Request, name: str) -> Response:
+    """Precomputed dashboard JSON; 304 when the client already has this version"""
+    require_token(request, "DASHBOARD_TOKEN", required=True)
+    snapshot = await dashboard_stats.get(name)
+    headers = {"ETag": snapshot.etag, "Cache-Control": f"private, max-age={DASHBOARD_REFRESH // 2}"}
+    if snapshot.etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(snapshot.body, media_type="application/json", headers=headers)
+
+@app.get("/api/stats")
+async def api_stats(request: Request):
+    """Totals, daily activity and top commands for the dashboard"""
+    return await dashboard_response(request, "stats")
+
+@app.get("/api/activity")
+async def api_activity(request: Request):
+    """Recent commands and the hourly series for the dashboard"""
+    return await dashboard_response(request, "activity")
+
 @app.post("/webhook")
 async def webhook(request: Request):
     """Handle Telegram webhook"""
+    trace = None
     try:
         # Get the raw body
         body = await request.body()
@@ -90,13 +207,14 @@ async def webhook(request: Request):
         # Parse the update
         update = Update.de_json(data=await request.json(), bot=bot_application.bot)
         
-        # Process the update
-        await bot_application.process_update(update)
+        # Process the update; handlers, SQLite and upstream calls record spans into its trace
+        with tracer.trace("webhook", update_id=update.update_id) as trace:
+            await bot_application.process_update(update)
         
         return {"status": "ok"}
     
     except Exception as e:
-        logger.error(f"Error processing webhook: {e}")
+        logger.error(f"Error processing webhook [trace {trace.id if trace else '-'}]: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 if __name__ == "__main__":
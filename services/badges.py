@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+NICE-BOT - Badge Rule Engine
+Badge definitions compiled once into in-memory rules
+"""
+
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from db import get_connection
+
+logger = logging.getLogger(__name__)
+
+# special_condition -> (source, field, minimum)
+# source is 'stats' (user_stats columns) or 'counter' (user_counters categories)
+BADGE_CONDITIONS: Dict[str, Tuple[str, str, int]] = {
+    'first_command': ('stats', 'total_commands', 1),
+    'streak_7': ('stats', 'streak_days', 7),
+    'streak_30': ('stats', 'streak_days', 30),
+    'ai_commands': ('counter', 'ai', 10),
+    'translate_commands': ('counter', 'translate', 20),
+    'fun_commands': ('counter', 'fun', 15),
+    'stats_commands': ('counter', 'stats', 5),
+}
+
+
+class BadgeRule:
+    """One compiled badge definition"""
+
+    __slots__ = ('badge_id', 'name', 'icon', 'check')
+
+    def __init__(self, badge_id: int, name: str, icon: str, check: Callable[[dict, dict], bool]):
+        self.badge_id = badge_id
+        self.name = name
+        self.icon = icon
+        self.check = check
+
+
+def compile_rule(badge_id: int, name: str, icon: str, xp_required: int,
+                 special_condition: Optional[str]) -> Optional[BadgeRule]:
+    """Turn a badges row into a rule, None if the condition is not supported"""
+    if not special_condition:
+        return BadgeRule(badge_id, name, icon, lambda stats, counters: stats['xp_points'] >= xp_required)
+
+    condition = BADGE_CONDITIONS.get(special_condition)
+    if condition is None:
+        logger.warning(f"Unknown badge condition '{special_condition}' for {name}")
+        return None
+
+    source, field, minimum = condition
+    if source == 'counter':
+        check = lambda stats, counters: counters.get(field, 0) >= minimum
+    else:
+        check = lambda stats, counters: stats.get(field, 0) >= minimum
+    return BadgeRule(badge_id, name, icon, check)
+
+
+class BadgeEngine:
+    """Evaluates compiled rules against stats and per-category counters,
+    caching each user's earned set and counters"""
+
+    def __init__(self):
+        self._rules: Optional[List[BadgeRule]] = None
+        self._earned: Dict[int, Set[int]] = {}
+        self._counters: Dict[int, Dict[str, int]] = {}
+        self._lock = threading.RLock()
+
+    def _fetch(self, query: str, params: tuple = ()) -> list:
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            return cursor.fetchall()
+        finally:
+            conn.close()
+
+    def _load_rules(self) -> List[BadgeRule]:
+        if self._rules is None:
+            rows = self._fetch('''
+                SELECT id, name, icon, xp_required, special_condition FROM badges
+            ''')
+            rules = [compile_rule(*row) for row in rows]
+            self._rules = [rule for rule in rules if rule is not None]
+        return self._rules
+
+    def _load_earned(self, user_id: int) -> Set[int]:
+        earned = self._earned.get(user_id)
+        if earned is None:
+            rows = self._fetch("SELECT badge_id FROM user_badges WHERE user_id = ?", (user_id,))
+            earned = {row[0] for row in rows}
+            self._earned[user_id] = earned
+        return earned
+
+    def _load_counters(self, user_id: int) -> Dict[str, int]:
+        counters = self._counters.get(user_id)
+        if counters is None:
+            rows = self._fetch("SELECT category, count FROM user_counters WHERE user_id = ?", (user_id,))
+            counters = dict(rows)
+            self._counters[user_id] = counters
+        return counters
+
+    def increment(self, user_id: int, category: str) -> int:
+        """Bump a category counter in memory (persisted by the XP accumulator)"""
+        with self._lock:
+            counters = self._load_counters(user_id)
+            counters[category] = counters.get(category, 0) + 1
+            return counters[category]
+
+    def evaluate(self, user_id: int, stats: dict) -> List[BadgeRule]:
+        """Return every newly satisfied badge and mark it earned in memory.
+
+        Only the first evaluation of a user reads the database; persisting
+        the awards is left to the caller.
+        """
+        with self._lock:
+            rules = self._load_rules()
+            earned = self._load_earned(user_id)
+            counters = self._load_counters(user_id)
+
+            new_badges = []
+            for rule in rules:
+                if rule.badge_id in earned or not rule.check(stats, counters):
+                    continue
+                earned.add(rule.badge_id)
+                new_badges.append(rule)
+
+            return new_badges
+
+    def forget(self, user_id: int):
+        """Drop a user's cached badges and counters (e.g. after a reset)"""
+        with self._lock:
+            self._earned.pop(user_id, None)
+            self._counters.pop(user_id, None)
+
+    def reload(self):
+        """Recompile rules on next evaluation (after editing the badges table)"""
+        with self._lock:
+            self._rules = None
+
+
+# Shared instance used by the gamification engine
+badge_engine = BadgeEngine()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+NICE-BOT - Content Pools
+Local quote/joke collections with no-repeat shuffling, indexes and hot reload
+"""
+
+import re
+import json
+import time
+import random
+import logging
+import unicodedata
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two checks of the source file's mtime
+RELOAD_CHECK_INTERVAL = 10.0
+
+# Shuffled cursors kept in memory (one per chat and selection)
+MAX_CURSORS = 10000
+
+# Words too common to be a theme
+STOPWORDS = {
+    'a', 'au', 'aux', 'avec', 'ce', 'ces', 'c', 'd', 'dans', 'de', 'des', 'du', 'elle', 'en',
+    'est', 'et', 'il', 'ils', 'j', 'je', 'l', 'la', 'le', 'les', 'leur', 'lui', 'm', 'ma',
+    'mais', 'me', 'mes', 'moi', 'mon', 'n', 'ne', 'ni', 'nous', 'on', 'ou', 'par', 'pas',
+    'pour', 'qu', 'que', 'qui', 's', 'sa', 'se', 'ses', 'si', 'son', 'sont', 'sur', 't',
+    'ta', 'te', 'tes', 'toi', 'ton', 'tu', 'un', 'une', 'vous', 'vos', 'votre', 'y', 'c\'est',
+    'faire', 'fait', 'faites', 'etre', 'avoir', 'avez', 'plus', 'tout', 'tous', 'comme', 'cela',
+    'ca', 'sans', 'entre', 'meme', 'chose', 'quelque',
+}
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text: str) -> str:
+    """Lowercase without accents, so 'Succès' and 'succes' match"""
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def keywords(text: str) -> List[str]:
+    return [w for w in WORD_PATTERN.findall(normalize(text)) if len(w) > 2 and w not in STOPWORDS]
+
+
+class Cursor:
+    """Position in a shuffled permutation of entry indexes"""
+
+    __slots__ = ('version', 'order', 'position')
+
+    def __init__(self, version: int, indexes: Sequence[int]):
+        self.version = version
+        self.order = array('I', indexes)
+        random.shuffle(self.order)
+        self.position = 0
+
+
+class ContentPool:
+    """Entries from a JSON file, drawn without repeats per scope.
+
+    Each scope (a chat) and selection (everything, a theme or an author)
+    gets its own shuffled permutation of indexes; every entry comes out once
+    before the permutation is reshuffled. Theme and author lookups are
+    dictionary hits on indexes built when the file is (re)loaded.
+    """
+
+    def __init__(self, name: str, path: Path,
+                 text_of: Callable[[Any], str] = str,
+                 author_of: Callable[[Any], Optional[str]] = lambda entry: None):
+        self.name = name
+        self.path = path
+        self.text_of = text_of
+        self.author_of = author_of
+        self.entries: List[Any] = []
+        self.version = 0
+        self._by_tag: Dict[str, array] = {}
+        self._by_author: Dict[str, array] = {}
+        self._cursors: "OrderedDict[Tuple[Hashable, str], Cursor]" = OrderedDict()
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+
+    def __len__(self) -> int:
+        self._maybe_reload()
+        return len(self.entries)
+
+    # ---------------------------------------------------------------- loading
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if self.version and now - self._checked_at < RELOAD_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        try:
+            mtime = self.path.stat().st_mtime
+        except OSError:
+            mtime = None
+        if self.version and mtime == self._mtime:
+            return
+        self._mtime = mtime
+        self._load()
+
+    def _load(self):
+        entries = []
+        try:
+            if self.path.exists():
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+        except Exception as e:
+            # Keep serving the previous content if an edit left the file invalid
+            logger.error(f"Error loading {self.name}: {e}")
+            if self.entries:
+                return
+        entries = [entry for entry in entries if self.text_of(entry)]
+
+        by_tag: Dict[str, List[int]] = {}
+        by_author: Dict[str, List[int]] = {}
+        for i, entry in enumerate(entries):
+            tags = set(keywords(self.text_of(entry)))
+            if isinstance(entry, dict):
+                tags.update(normalize(tag) for tag in entry.get('tags', ()))
+            for tag in tags:
+                by_tag.setdefault(tag, []).append(i)
+
+            author = self.author_of(entry)
+            if author:
+                names = {normalize(author)} | set(WORD_PATTERN.findall(normalize(author)))
+                for name in names:
+                    by_author.setdefault(name, []).append(i)
+
+        self.entries = entries
+        self._by_tag = {tag: array('I', ids) for tag, ids in by_tag.items()}
+        self._by_author = {name: array('I', ids) for name, ids in by_author.items()}
+        self.version += 1
+        logger.info(f"Loaded {len(entries)} {self.name}")
+
+    # ---------------------------------------------------------------- drawing
+
+    def select(self, query: Optional[str] = None) -> Tuple[str, Optional[Sequence[int]]]:
+        """Selection key and matching indexes (None = no match) for a theme or author"""
+        if not query:
+            return '*', range(len(self.entries))
+        key = normalize(query.strip())
+        if key in self._by_author:
+            return f"author:{key}", self._by_author[key]
+        words = keywords(query)
+        if len(words) == 1 and words[0] in self._by_tag:
+            return f"tag:{words[0]}", self._by_tag[words[0]]
+        return key, None
+
+    def next(self, scope: Hashable, query: Optional[str] = None) -> Optional[Any]:
+        """Next entry for a scope, never repeating until the selection is exhausted"""
+        self._maybe_reload()
+        selection, indexes = self.select(query)
+        if not indexes:
+            return None
+
+        key = (scope, selection)
+        cursor = self._cursors.get(key)
+        if cursor is None or cursor.version != self.version or cursor.position >= len(cursor.order):
+            last = cursor.order[-1] if cursor is not None and cursor.version == self.version else None
+            cursor = Cursor(self.version, indexes)
+            # Avoid serving the same entry twice across a reshuffle
+            if last is not None and len(cursor.order) > 1 and cursor.order[0] == last:
+                cursor.order[0], cursor.order[-1] = cursor.order[-1], cursor.order[0]
+            self._cursors[key] = cursor
+        self._cursors.move_to_end(key)
+        while len(self._cursors) > MAX_CURSORS:
+            self._cursors.popitem(last=False)
+
+        entry = self.entries[cursor.order[cursor.position]]
+        cursor.position += 1
+        return entry
+
+    def count(self, query: Optional[str] = None) -> int:
+        """Entries matching a theme or author"""
+        self._maybe_reload()
+        _, indexes = self.select(query)
+        return len(indexes) if indexes else 0
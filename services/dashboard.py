@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+NICE-BOT - Dashboard Stats
+Precomputed /api/stats and /api/activity bodies, built from incremental history rollups
+"""
+
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from collections import Counter, deque
+from datetime import datetime, timedelta, timezone
+from typing import Deque, Dict, NamedTuple, Optional
+
+from db import get_connection
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two snapshot refreshes (also the browser cache lifetime)
+DASHBOARD_REFRESH = int(os.getenv("DASHBOARD_REFRESH", "30"))
+
+# Days shown in the daily chart, days counted as "active", hours in the hourly series
+DASHBOARD_DAYS = 30
+ACTIVE_DAYS = 7
+ACTIVITY_HOURS = 24
+
+# Entries in the recent activity feed, commands in the top list
+FEED_SIZE = 20
+TOP_COMMANDS = 10
+
+# History rows folded into the rollups per transaction
+ROLLUP_BATCH = 5000
+
+
+class Snapshot(NamedTuple):
+    body: bytes
+    etag: str
+
+
+def make_snapshot(data: dict) -> Snapshot:
+    body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return Snapshot(body, f'"{hashlib.sha1(body).hexdigest()[:20]}"')
+
+
+class DashboardStats:
+    """Serves the dashboard from memory; only the background refresh touches SQLite.
+
+    Each refresh folds the history rows added since the last one into hourly
+    per-command counts and per-day active users, then renders both endpoint
+    bodies once. Any number of viewers polling share those bytes.
+    """
+
+    def __init__(self, interval: int = DASHBOARD_REFRESH):
+        self.interval = interval
+        self._last_id: Optional[int] = None
+        self._totals: Counter = Counter()
+        self._feed: Deque[dict] = deque(maxlen=FEED_SIZE)
+        self._snapshots: Dict[str, Snapshot] = {}
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    # ---------------------------------------------------------------- rollups
+
+    def _load_state(self, cursor):
+        cursor.execute(
+            "SELECT value FROM kv_store WHERE store = 'dashboard' AND section = 'rollup' AND key = 'last_history_id'"
+        )
+        row = cursor.fetchone()
+        self._last_id = int(row[0]) if row else 0
+        cursor.execute("SELECT command, SUM(count) FROM activity_hourly GROUP BY command")
+        self._totals = Counter(dict(cursor.fetchall()))
+        cursor.execute('''
+            SELECT h.command, h.created_at, u.first_name, u.username
+            FROM history h LEFT JOIN users u ON h.user_id = u.id
+            WHERE h.id <= ? ORDER BY h.id DESC LIMIT ?
+        ''', (self._last_id, FEED_SIZE))
+        for command, created_at, first_name, username in reversed(cursor.fetchall()):
+            self._feed.appendleft(self._feed_item(command, created_at, first_name, username))
+
+    @staticmethod
+    def _feed_item(command, created_at, first_name, username) -> dict:
+        return {
+            'user': first_name or username or 'Anonyme',
+            'command': command,
+            # SQLite CURRENT_TIMESTAMP is UTC
+            'timestamp': f"{created_at.replace(' ', 'T')}Z" if created_at else None,
+        }
+
+    def _roll_up(self) -> int:
+        """Fold new history rows into the rollup tables; returns how many were read"""
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            if self._last_id is None:
+                self._load_state(cursor)
+
+            folded = 0
+            while True:
+                cursor.execute('''
+                    SELECT h.id, h.user_id, h.command, h.created_at, u.first_name, u.username
+                    FROM history h LEFT JOIN users u ON h.user_id = u.id
+                    WHERE h.id > ? ORDER BY h.id LIMIT ?
+                ''', (self._last_id, ROLLUP_BATCH))
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+
+                hourly: Counter = Counter()
+                active = set()
+                for _, user_id, command, created_at, first_name, username in rows:
+                    created_at = created_at or ''
+                    hourly[(created_at[:13], command)] += 1
+                    active.add((created_at[:10], user_id))
+                    self._feed.appendleft(self._feed_item(command, created_at, first_name, username))
+
+                cursor.executemany('''
+                    INSERT INTO activity_hourly (hour, command, count) VALUES (?, ?, ?)
+                    ON CONFLICT (hour, command) DO UPDATE SET count = count + excluded.count
+                ''', [(hour, command, count) for (hour, command), count in hourly.items()])
+                cursor.executemany(
+                    "INSERT OR IGNORE INTO activity_users (day, user_id) VALUES (?, ?)", list(active)
+                )
+                last_id = rows[-1][0]
+                cursor.execute('''
+                    INSERT OR REPLACE INTO kv_store (store, section, key, value)
+                    VALUES ('dashboard', 'rollup', 'last_history_id', ?)
+                ''', (str(last_id),))
+                conn.commit()
+
+                self._last_id = last_id
+                for (_, command), count in hourly.items():
+                    self._totals[command] += count
+                folded += len(rows)
+                if len(rows) < ROLLUP_BATCH:
+                    break
+
+            # Active-user rows are only needed for the ACTIVE_DAYS window
+            cutoff = (datetime.now(timezone.utc) - timedelta(days=ACTIVE_DAYS + 1)).strftime('%Y-%m-%d')
+            cursor.execute("DELETE FROM activity_users WHERE day < ?", (cutoff,))
+            conn.commit()
+            return folded
+        finally:
+            conn.close()
+
+    # -------------------------------------------------------------- snapshots
+
+    def _build(self) -> Dict[str, Snapshot]:
+        self._roll_up()
+        now = datetime.now(timezone.utc)
+        first_day = now - timedelta(days=DASHBOARD_DAYS - 1)
+        first_hour = now - timedelta(hours=ACTIVITY_HOURS - 1)
+
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM users")
+            total_users = cursor.fetchone()[0]
+            cursor.execute(
+                "SELECT COUNT(DISTINCT user_id) FROM activity_users WHERE day >= ?",
+                ((now - timedelta(days=ACTIVE_DAYS - 1)).strftime('%Y-%m-%d'),)
+            )
+            active_users = cursor.fetchone()[0]
+            cursor.execute('''
+                SELECT substr(hour, 1, 10), SUM(count) FROM activity_hourly
+                WHERE hour >= ? GROUP BY 1
+            ''', (first_day.strftime('%Y-%m-%d'),))
+            per_day = dict(cursor.fetchall())
+            cursor.execute('''
+                SELECT hour, SUM(count) FROM activity_hourly WHERE hour >= ? GROUP BY hour
+            ''', (first_hour.strftime('%Y-%m-%d %H'),))
+            per_hour = dict(cursor.fetchall())
+        finally:
+            conn.close()
+
+        days = [(first_day + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(DASHBOARD_DAYS)]
+        hours = [(first_hour + timedelta(hours=i)).strftime('%Y-%m-%d %H') for i in range(ACTIVITY_HOURS)]
+        updated = now.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+        stats = {
+            'total_users': total_users,
+            'total_commands': sum(self._totals.values()),
+            'active_users': active_users,
+            'daily_activity': [{'date': day, 'count': per_day.get(day, 0)} for day in days],
+            'top_commands': [{'command': command, 'count': count}
+                             for command, count in self._totals.most_common(TOP_COMMANDS)],
+            'last_updated': updated,
+        }
+        activity = {
+            'activity': list(self._feed),
+            'hourly_activity': [{'hour': f"{hour}:00", 'count': per_hour.get(hour, 0)} for hour in hours],
+            'last_updated': updated,
+        }
+        return {'stats': make_snapshot(stats), 'activity': make_snapshot(activity)}
+
+    async def refresh(self):
+        async with self._lock:
+            self._snapshots = await asyncio.to_thread(self._build)
+
+    async def get(self, name: str) -> Snapshot:
+        """Current body of 'stats' or 'activity' (built on first use if the task has not yet)"""
+        if name not in self._snapshots:
+            await self.refresh()
+        return self._snapshots[name]
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Error refreshing dashboard stats: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Refresh now, then every interval (call from the running loop)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+# Shared instance behind /api/stats and /api/activity
+dashboard_stats = DashboardStats()
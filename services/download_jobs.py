@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+NICE-BOT - Download Job Queue
+Background download jobs with a fixed worker pool and per-user fairness
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+from db import get_connection
+from services.metrics import track_queue
+from services.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Jobs running at the same time, whoever they belong to
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "3"))
+
+# Queued + running jobs allowed per user
+MAX_JOBS_PER_USER = int(os.getenv("MAX_JOBS_PER_USER", "3"))
+
+# Minimum seconds between two edits of a status message
+PROGRESS_EDIT_INTERVAL = 2.0
+
+
+class QueueFull(Exception):
+    """The user already has the maximum number of jobs queued or running"""
+
+
+class DownloadJob:
+    """One queued download, mirrored in the download_jobs table"""
+
+    __slots__ = ('id', 'user_id', 'chat_id', 'platform', 'query', 'cache_key',
+                 'status_message_id', '_last_edit', 'trace', 'queued_at')
+
+    def __init__(self, user_id: int, chat_id: int, platform: str, query: str,
+                 cache_key: str, status_message_id: Optional[int] = None, job_id: Optional[int] = None):
+        self.id = job_id
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.platform = platform
+        self.query = query
+        self.cache_key = cache_key
+        self.status_message_id = status_message_id
+        self._last_edit = 0.0
+        # Span of the command that queued it (None for jobs recovered after a restart)
+        self.trace = None
+        self.queued_at = time.perf_counter()
+
+
+class JobContext:
+    """Handed to the runner: edits the job's single status message"""
+
+    def __init__(self, bot, job: DownloadJob):
+        self.bot = bot
+        self.job = job
+
+    async def status(self, text: str, force: bool = True):
+        """Replace the status message text (throttled unless forced)"""
+        now = time.monotonic()
+        if not self.job.status_message_id or (not force and now - self.job._last_edit < PROGRESS_EDIT_INTERVAL):
+            return
+        self.job._last_edit = now
+        try:
+            await self.bot.edit_message_text(
+                text, chat_id=self.job.chat_id, message_id=self.job.status_message_id,
+                parse_mode='Markdown'
+            )
+        except Exception as e:
+            # "message is not modified" and deleted messages are harmless
+            logger.debug(f"Status edit failed for job {self.job.id}: {e}")
+
+    async def progress(self, done: int, total: Optional[int]):
+        """Progress callback for relay_media"""
+        if total:
+            bar_length = 10
+            filled = int(done / total * bar_length)
+            text = (f"📥 **Téléchargement...**\n\n"
+                    f"{'█' * filled}{'░' * (bar_length - filled)} {done / total * 100:.0f}%")
+        else:
+            text = f"📥 **Téléchargement...** {done / (1024 * 1024):.1f} Mo"
+        await self.status(text, force=False)
+
+
+JobRunner = Callable[[JobContext], Awaitable[None]]
+
+
+class DownloadJobQueue:
+    """Round-robin queue across users, drained by a fixed pool of workers"""
+
+    def __init__(self, workers: int = DOWNLOAD_WORKERS, max_per_user: int = MAX_JOBS_PER_USER):
+        self.workers = workers
+        self.max_per_user = max_per_user
+        self._pending: "OrderedDict[int, Deque[DownloadJob]]" = OrderedDict()
+        self._active: Dict[int, int] = {}
+        self._tokens: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._bot = None
+        self._runner: Optional[JobRunner] = None
+
+    @property
+    def queued(self) -> int:
+        return sum(len(jobs) for jobs in self._pending.values())
+
+    @property
+    def running(self) -> int:
+        return sum(self._active.values()) - self.queued
+
+    # --------------------------------------------------------------- database
+
+    def _insert(self, job: DownloadJob):
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO download_jobs (user_id, chat_id, platform, query, cache_key, status_message_id, status)
+                VALUES (?, ?, ?, ?, ?, ?, 'queued')
+            ''', (job.user_id, job.chat_id, job.platform, job.query, job.cache_key, job.status_message_id))
+            conn.commit()
+            job.id = cursor.lastrowid
+        finally:
+            conn.close()
+
+    def _set_status(self, job: DownloadJob, status: str, error: Optional[str] = None):
+        try:
+            conn = get_connection()
+            conn.execute('''
+                UPDATE download_jobs SET status = ?, error = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (status, error, job.id))
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f"Error updating download job {job.id}: {e}")
+
+    def _recover(self) -> List[DownloadJob]:
+        """Jobs interrupted by a restart go back to the queue"""
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, user_id, chat_id, platform, query, cache_key, status_message_id
+                FROM download_jobs WHERE status IN ('queued', 'running')
+                ORDER BY id
+            ''')
+            rows = cursor.fetchall()
+            cursor.execute("UPDATE download_jobs SET status = 'queued' WHERE status = 'running'")
+            conn.commit()
+        finally:
+            conn.close()
+        return [
+            DownloadJob(user_id, chat_id, platform, query, cache_key, message_id, job_id)
+            for job_id, user_id, chat_id, platform, query, cache_key, message_id in rows
+        ]
+
+    # ------------------------------------------------------------------ queue
+
+    def _push(self, job: DownloadJob):
+        self._pending.setdefault(job.user_id, deque()).append(job)
+        self._active[job.user_id] = self._active.get(job.user_id, 0) + 1
+        self._tokens.put_nowait(None)
+
+    def _pop(self) -> DownloadJob:
+        """Next job, taking users in turn"""
+        user_id, jobs = next(iter(self._pending.items()))
+        job = jobs.popleft()
+        if jobs:
+            self._pending.move_to_end(user_id)
+        else:
+            del self._pending[user_id]
+        return job
+
+    def submit(self, job: DownloadJob) -> int:
+        """Queue a job; returns the number of jobs ahead of it"""
+        if self._tokens is None:
+            raise RuntimeError("Download queue is not running")
+        if self._active.get(job.user_id, 0) >= self.max_per_user:
+            raise QueueFull()
+
+        ahead = self.queued
+        self._insert(job)
+        job.trace = tracer.handoff()
+        self._push(job)
+        return ahead
+
+    async def _worker(self):
+        while True:
+            await self._tokens.get()
+            job = self._pop()
+            try:
+                # The job's spans (resolve, relay, SQLite, HTTP) join the trace of its command
+                with tracer.resume(job.trace, f"download {job.platform}"):
+                    tracer.record("download queue wait", job.queued_at, time.perf_counter() - job.queued_at)
+                    self._set_status(job, 'running')
+                    await self._runner(JobContext(self._bot, job))
+                    self._set_status(job, 'done')
+            except asyncio.CancelledError:
+                # Left as 'running' so it is recovered on the next start
+                raise
+            except Exception as e:
+                logger.error(f"Download job {job.id} failed: {e}")
+                self._set_status(job, 'failed', str(e)[:200])
+            finally:
+                self._active[job.user_id] -= 1
+                if not self._active[job.user_id]:
+                    del self._active[job.user_id]
+
+    def start(self, bot, runner: JobRunner):
+        """Start the worker pool (call from the running event loop)"""
+        if self._tasks:
+            return
+        self._bot = bot
+        self._runner = runner
+        self._tokens = asyncio.Queue()
+
+        recovered = self._recover()
+        for job in recovered:
+            self._push(job)
+
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Download queue started ({self.workers} workers, {len(recovered)} recovered jobs)")
+
+    async def stop(self):
+        """Cancel the workers; unfinished jobs resume on the next start"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._tokens = None
+        self._pending.clear()
+        self._active.clear()
+
+
+# Shared instance used by the downloader commands
+download_queue = DownloadJobQueue()
+track_queue("downloads", lambda: download_queue.queued)
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+NICE-BOT - Download Engine
+Platform registry, URL detection and shared PrinceTech request handling
+"""
+
+import os
+import re
+import asyncio
+import logging
+from typing import Callable, Dict, List, NamedTuple, Optional, Pattern, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import aiohttp
+
+from services.ttl_cache import TTLCache
+from services.metrics import http_trace
+
+logger = logging.getLogger(__name__)
+
+# PrinceTech API configuration
+PRINCETECH_API_KEY = os.getenv("PRINCETECHN_API_KEY", "prince")
+PRINCETECH_BASE = "https://api.princetechn.com/api/download"
+
+# Shared limits for every platform
+API_TIMEOUT = aiohttp.ClientTimeout(total=30, sock_connect=10)
+API_RETRIES = 2
+MAX_CONCURRENT_RESOLVES = int(os.getenv("MAX_CONCURRENT_RESOLVES", "4"))
+
+URL_PATTERN = re.compile(r'(?:https?://)?(?:[\w-]+\.)+[a-z]{2,}(?:/\S*)?', re.IGNORECASE)
+
+# Resolved API results expire with the CDN links they contain
+RESOLVE_CACHE_TTL = int(os.getenv("RESOLVE_CACHE_TTL", "1800"))
+RESOLVE_CACHE_ENTRIES = 4096
+
+# Short links always point to the same post
+SHORT_LINK_TTL = 24 * 3600
+SHORT_LINK_TIMEOUT = aiohttp.ClientTimeout(total=10, sock_connect=5)
+
+# Query parameters that only identify who shared a link
+TRACKING_PARAMS = {
+    'igshid', 'igsh', 'fbclid', 'gclid', 'si', 's', 't', 'ref', 'ref_src', 'ref_url',
+    'is_from_webapp', 'sender_device', 'sender_web_id', 'share_app_id', 'share_item_id',
+    'share_link_id', 'social_sharing', 'timestamp', 'u_code', 'user_id', 'tt_from',
+    'mibextid', 'rdid', 'sfnsn', 'invite_code', 'checksum', 'sec_uid', 'utm_source',
+    'utm_medium', 'utm_campaign', 'utm_term', 'utm_content', 'web_id', 'lang', '_r', '_t',
+}
+
+
+class Platform:
+    """One downloadable source and how to read its PrinceTech response"""
+
+    __slots__ = ('name', 'endpoint', 'title', 'kind', 'hosts', 'media_fields',
+                 'query_param', 'example', 'details', 'short_hosts', 'id_patterns')
+
+    def __init__(self, name: str, endpoint: str, title: str, kind: str = 'video',
+                 hosts: Tuple[str, ...] = (), media_fields: Tuple[str, ...] = ('video', 'url'),
+                 query_param: str = 'url', example: str = '',
+                 details: Optional[Callable[[dict], List[Tuple[str, str]]]] = None,
+                 short_hosts: Tuple[str, ...] = (), id_patterns: Tuple[str, ...] = ()):
+        self.name = name
+        self.endpoint = endpoint
+        self.title = title
+        self.kind = kind
+        self.hosts = hosts
+        self.media_fields = media_fields
+        self.query_param = query_param
+        self.example = example
+        self.details = details
+        self.short_hosts = short_hosts
+        self.id_patterns: Tuple[Pattern, ...] = tuple(re.compile(p) for p in id_patterns)
+
+    @property
+    def takes_url(self) -> bool:
+        return self.query_param == 'url'
+
+    def post_id(self, url: str) -> Optional[str]:
+        """Stable ID of the post a canonical URL points to"""
+        for pattern in self.id_patterns:
+            match = pattern.search(url)
+            if match:
+                return match.group(1)
+        return None
+
+    def media_url(self, result: dict) -> Optional[str]:
+        """First non-empty media field of an API result"""
+        for field in self.media_fields:
+            if result.get(field):
+                return result[field]
+        return None
+
+
+PLATFORMS: Dict[str, Platform] = {}
+
+
+def register(platform: Platform) -> Platform:
+    """Add a platform to the registry (one entry per supported source)"""
+    PLATFORMS[platform.name] = platform
+    return platform
+
+
+register(Platform(
+    'tiktok', 'tiktokdlv3', '📱 TIKTOK',
+    hosts=('tiktok.com',),
+    short_hosts=('vm.tiktok.com', 'vt.tiktok.com'),
+    id_patterns=(r'/(?:video|photo|v)/(\d+)', r'[?&]item_id=(\d+)'),
+    media_fields=('video', 'videoUrl'),
+    example='https://vm.tiktok.com/ZMrgKWmVd',
+    details=lambda r: [
+        ("Titre", str(r.get('title', 'N/A'))[:100]),
+        ("Auteur", r.get('author', 'N/A')),
+        ("Durée", r.get('duration', 'N/A')),
+    ]
+))
+register(Platform(
+    'facebook', 'facebook', '📘 FACEBOOK',
+    hosts=('facebook.com', 'fb.watch', 'fb.com'),
+    short_hosts=('fb.watch',),
+    id_patterns=(r'/(?:reel|videos)/(\d+)', r'[?&]v=(\d+)', r'/share/[rv]/(\w+)'),
+    media_fields=('hd', 'sd', 'video'),
+    example='https://www.facebook.com/reel/123456',
+    details=lambda r: [("Qualité", 'HD' if r.get('hd') else 'SD')]
+))
+register(Platform(
+    'instagram', 'instadl', '📸 INSTAGRAM',
+    hosts=('instagram.com', 'instagr.am'),
+    id_patterns=(r'/(?:p|reels?|tv)/([\w-]+)',),
+    media_fields=('url', 'video'),
+    example='https://www.instagram.com/reel/ABC123'
+))
+register(Platform(
+    'twitter', 'twitter', '🐦 TWITTER',
+    hosts=('twitter.com', 'x.com', 't.co'),
+    short_hosts=('t.co',),
+    id_patterns=(r'/status(?:es)?/(\d+)',),
+    media_fields=('video', 'url'),
+    example='https://twitter.com/user/status/123'
+))
+register(Platform(
+    'pinterest', 'pinterestdl', '📌 PINTEREST',
+    hosts=('pinterest.com', 'pin.it'),
+    short_hosts=('pin.it',),
+    id_patterns=(r'/pin/(?:[\w-]*--)?(\d+)',),
+    media_fields=('video', 'url'),
+    example='https://pin.it/ABC123'
+))
+register(Platform(
+    'apk', 'apkdl', '📦 APK', kind='document',
+    media_fields=('dllink', 'download'),
+    query_param='appName',
+    example='WhatsApp',
+    details=lambda r: [
+        ("Application", r.get('name', 'N/A')),
+        ("Version", r.get('version', 'N/A')),
+        ("Taille", r.get('size', 'N/A')),
+    ]
+))
+
+
+def normalize_url(text: str) -> Optional[str]:
+    """Extract the first link from pasted text and give it a scheme"""
+    match = URL_PATTERN.search(text or '')
+    if not match:
+        return None
+    url = match.group(0).rstrip(').,;!?>"\'')
+    if not url.lower().startswith(('http://', 'https://')):
+        url = 'https://' + url
+    return url
+
+
+def _host_matches(host: str, known: str) -> bool:
+    return host == known or host.endswith('.' + known)
+
+
+def detect_platform(url: str) -> Optional[Platform]:
+    """Platform whose hosts match the URL, if any"""
+    host = (urlsplit(url).hostname or '').lower()
+    for platform in PLATFORMS.values():
+        for known in platform.hosts:
+            if _host_matches(host, known):
+                return platform
+    return None
+
+
+def is_short_link(url: str) -> bool:
+    """Whether the URL is a redirecting share link (vm.tiktok.com, pin.it...)"""
+    host = (urlsplit(url).hostname or '').lower()
+    return any(
+        _host_matches(host, known)
+        for platform in PLATFORMS.values() for known in platform.short_hosts
+    )
+
+
+def clean_url(url: str) -> str:
+    """Drop tracking parameters, fragment, mobile/www prefixes and trailing slash"""
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    for prefix in ('www.', 'm.', 'mobile.', 'web.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith('utm_')
+    ]
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit(('https', host, path, urlencode(query), ''))
+
+
+class CanonicalLink(NamedTuple):
+    """A pasted link reduced to the post it designates"""
+    url: str
+    platform: Optional[Platform]
+    key: str  # "<platform>:<post id>", or the cleaned URL when no ID is found
+
+
+def canonical_link(url: str) -> CanonicalLink:
+    """Canonical form of an already expanded URL"""
+    cleaned = clean_url(url)
+    platform = detect_platform(cleaned)
+    post_id = platform.post_id(cleaned) if platform else None
+    key = f"{platform.name}:{post_id}" if post_id else f"url:{cleaned}"
+    return CanonicalLink(cleaned, platform, key)
+
+
+class DownloadEngine:
+    """Shared session, retries and global concurrency for API lookups"""
+
+    def __init__(self, retries: int = API_RETRIES, max_concurrent: int = MAX_CONCURRENT_RESOLVES):
+        self.retries = retries
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._results = TTLCache(RESOLVE_CACHE_TTL, RESOLVE_CACHE_ENTRIES, name="download_resolve")
+        self._short_links = TTLCache(SHORT_LINK_TTL, RESOLVE_CACHE_ENTRIES)
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=API_TIMEOUT, trace_configs=[http_trace()])
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def expand(self, url: str) -> str:
+        """Follow a share link to the post URL (once per link, then cached)"""
+        if not is_short_link(url):
+            return url
+        cleaned = clean_url(url)
+        expanded = self._short_links.get(cleaned)
+        if expanded:
+            return expanded
+        try:
+            async with self.session().head(cleaned, allow_redirects=True,
+                                           timeout=SHORT_LINK_TIMEOUT) as response:
+                expanded = str(response.url)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Could not expand {cleaned}: {e}")
+            return url
+        self._short_links.set(cleaned, expanded)
+        return expanded
+
+    async def canonicalize(self, url: str) -> CanonicalLink:
+        """Expand short links, then reduce to the canonical post key"""
+        return canonical_link(await self.expand(url))
+
+    async def resolve(self, platform: Platform, query: str, key: Optional[str] = None) -> Optional[dict]:
+        """API result for a link (or app name), shared by every request for the same key
+
+        Results are cached for RESOLVE_CACHE_TTL and concurrent lookups of the
+        same key wait for the first one instead of calling the API again.
+        """
+        key = key or f"{platform.name}:{query.lower()}"
+        cached = self._results.get(key)
+        if cached is not None:
+            return cached
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._fetch(platform, query)
+            if result:
+                self._results.set(key, result)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters get the error; nobody may be waiting, so mark it retrieved
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def forget(self, key: str):
+        """Drop a cached result whose media link turned out to be dead"""
+        self._results.pop(key)
+
+    async def _fetch(self, platform: Platform, query: str) -> Optional[dict]:
+        """Ask PrinceTech for the media of a link (or app name)"""
+        params = {"apikey": PRINCETECH_API_KEY, platform.query_param: query}
+        url = f"{PRINCETECH_BASE}/{platform.endpoint}"
+
+        async with self._slots:
+            for attempt in range(self.retries + 1):
+                try:
+                    async with self.session().get(url, params=params) as response:
+                        if response.status == 200:
+                            data = await response.json(content_type=None)
+                            if data.get('success') and data.get('result'):
+                                return data['result']
+                            return None
+                        if response.status < 500:
+                            return None
+                        logger.warning(f"{platform.name} API returned {response.status}")
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logger.warning(f"{platform.name} API error (attempt {attempt + 1}): {e}")
+
+                if attempt < self.retries:
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+        return None
+
+
+# Shared instance used by the downloader commands
+download_engine = DownloadEngine()
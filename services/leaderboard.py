@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+NICE-BOT - Leaderboard Rank Index
+In-memory XP ranking kept in sync by the gamification engine
+"""
+
+import logging
+import threading
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, List, Optional, Set, Tuple
+
+from db import get_connection
+
+logger = logging.getLogger(__name__)
+
+# Sort key: highest XP first, ties broken by user id
+RankKey = Tuple[int, int]
+
+
+class RankIndex:
+    """Order-statistic index of users ordered by XP (highest first).
+
+    Keys live in sorted chunks (the sortedcontainers layout): lookups are a
+    bisect over chunk maxima plus a bisect inside one chunk, and inserts only
+    shift a single chunk.
+    """
+
+    CHUNK_SIZE = 256
+
+    def __init__(self):
+        self._chunks: List[List[RankKey]] = []
+        self._maxes: List[RankKey] = []
+        self._offsets: List[int] = []
+        self._offsets_dirty = False
+        self._xp: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._xp)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._xp
+
+    # ------------------------------------------------------------- internals
+
+    def _insert(self, key: RankKey):
+        if not self._chunks:
+            self._chunks.append([key])
+            self._maxes.append(key)
+            self._offsets_dirty = True
+            return
+
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            i -= 1
+        chunk = self._chunks[i]
+        insort(chunk, key)
+        self._maxes[i] = chunk[-1]
+
+        if len(chunk) > 2 * self.CHUNK_SIZE:
+            half = chunk[self.CHUNK_SIZE:]
+            del chunk[self.CHUNK_SIZE:]
+            self._chunks.insert(i + 1, half)
+            self._maxes[i] = chunk[-1]
+            self._maxes.insert(i + 1, half[-1])
+        self._offsets_dirty = True
+
+    def _remove(self, key: RankKey):
+        i = bisect_left(self._maxes, key)
+        chunk = self._chunks[i]
+        del chunk[bisect_left(chunk, key)]
+        if chunk:
+            self._maxes[i] = chunk[-1]
+        else:
+            del self._chunks[i]
+            del self._maxes[i]
+        self._offsets_dirty = True
+
+    def _refresh_offsets(self):
+        if self._offsets_dirty:
+            offsets = []
+            total = 0
+            for chunk in self._chunks:
+                offsets.append(total)
+                total += len(chunk)
+            self._offsets = offsets
+            self._offsets_dirty = False
+
+    def _position(self, key: RankKey) -> int:
+        self._refresh_offsets()
+        i = bisect_left(self._maxes, key)
+        return self._offsets[i] + bisect_left(self._chunks[i], key)
+
+    def _slice(self, start: int, stop: int) -> List[RankKey]:
+        self._refresh_offsets()
+        start = max(0, start)
+        stop = min(len(self._xp), stop)
+        if start >= stop:
+            return []
+
+        result = []
+        i = bisect_right(self._offsets, start) - 1
+        j = start - self._offsets[i]
+        while len(result) < stop - start and i < len(self._chunks):
+            chunk = self._chunks[i]
+            result.extend(chunk[j:j + (stop - start - len(result))])
+            i += 1
+            j = 0
+        return result
+
+    # ----------------------------------------------------------------- public
+
+    def update(self, user_id: int, xp: int):
+        """Insert or move a user"""
+        old_xp = self._xp.get(user_id)
+        if old_xp == xp:
+            return
+        if old_xp is not None:
+            self._remove((-old_xp, user_id))
+        self._xp[user_id] = xp
+        self._insert((-xp, user_id))
+
+    def remove(self, user_id: int):
+        """Drop a user from the index"""
+        old_xp = self._xp.pop(user_id, None)
+        if old_xp is not None:
+            self._remove((-old_xp, user_id))
+
+    def xp(self, user_id: int) -> Optional[int]:
+        return self._xp.get(user_id)
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """1-based rank of a user, None if unranked"""
+        xp = self._xp.get(user_id)
+        if xp is None:
+            return None
+        return self._position((-xp, user_id)) + 1
+
+    def percentile(self, user_id: int) -> Optional[float]:
+        """Share of ranked players strictly behind this user (0-100)"""
+        rank = self.rank(user_id)
+        if rank is None:
+            return None
+        return (len(self) - rank) / len(self) * 100
+
+    def top(self, n: int = 10) -> List[Tuple[int, int]]:
+        """Best n players as (user_id, xp)"""
+        return [(user_id, -neg_xp) for neg_xp, user_id in self._slice(0, n)]
+
+    def around(self, user_id: int, radius: int = 2) -> List[Tuple[int, int, int]]:
+        """Players ranked just above and below a user as (rank, user_id, xp)"""
+        rank = self.rank(user_id)
+        if rank is None:
+            return []
+        start = max(0, rank - 1 - radius)
+        return [
+            (start + offset + 1, uid, -neg_xp)
+            for offset, (neg_xp, uid) in enumerate(self._slice(start, rank + radius))
+        ]
+
+
+class Leaderboard:
+    """Global and per-group rank indexes, loaded once from SQLite"""
+
+    def __init__(self):
+        self.global_index = RankIndex()
+        self.groups: Dict[int, RankIndex] = {}
+        self.total_commands: Dict[int, int] = {}
+        self._user_groups: Dict[int, Set[int]] = {}
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            conn = get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT user_id, xp_points, total_commands FROM user_stats")
+                for user_id, xp, commands in cursor.fetchall():
+                    self.global_index.update(user_id, xp or 0)
+                    self.total_commands[user_id] = commands or 0
+
+                cursor.execute("SELECT chat_id, user_id FROM chat_members")
+                for chat_id, user_id in cursor.fetchall():
+                    self._user_groups.setdefault(user_id, set()).add(chat_id)
+                    xp = self.global_index.xp(user_id)
+                    if xp is not None:
+                        self.groups.setdefault(chat_id, RankIndex()).update(user_id, xp)
+            except Exception as e:
+                logger.error(f"Error loading leaderboard: {e}")
+            finally:
+                conn.close()
+            self._loaded = True
+
+    def record(self, user_id: int, xp: int, total_commands: Optional[int] = None, chat_id: Optional[int] = None):
+        """Sync a user's XP after it changed in the database"""
+        self._ensure_loaded()
+        with self._lock:
+            self.global_index.update(user_id, xp)
+            if total_commands is not None:
+                self.total_commands[user_id] = total_commands
+
+            # Group boards only track chats other than the private one
+            user_groups = self._user_groups.setdefault(user_id, set())
+            if chat_id is not None and chat_id != user_id and chat_id not in user_groups:
+                user_groups.add(chat_id)
+                self._save_member(chat_id, user_id)
+
+            for group_chat_id in user_groups:
+                self.groups.setdefault(group_chat_id, RankIndex()).update(user_id, xp)
+
+    def _save_member(self, chat_id: int, user_id: int):
+        try:
+            conn = get_connection()
+            conn.execute(
+                "INSERT OR IGNORE INTO chat_members (chat_id, user_id) VALUES (?, ?)",
+                (chat_id, user_id)
+            )
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f"Error saving chat member: {e}")
+
+    def board(self, chat_id: Optional[int] = None) -> RankIndex:
+        """Global index, or the index of one group"""
+        self._ensure_loaded()
+        if chat_id is None:
+            return self.global_index
+        return self.groups.get(chat_id, RankIndex())
+
+
+# Shared instance used by the gamification commands
+leaderboard_index = Leaderboard()
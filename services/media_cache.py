@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+NICE-BOT - Telegram file_id Cache
+Remembers uploaded media so repeat requests are resent by file_id
+"""
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from db import get_connection
+
+logger = logging.getLogger(__name__)
+
+# Entries kept in memory in front of the media_cache table
+MEMORY_ENTRIES = 2048
+
+# Media kinds in the order they are looked up on a sent Message
+MEDIA_KINDS = ('video', 'animation', 'document', 'photo')
+
+
+class CachedMedia(NamedTuple):
+    kind: str
+    file_id: str
+    created_at: str
+
+
+class MediaCache:
+    """LRU in memory, SQLite on disk: cache key -> Telegram file_id"""
+
+    def __init__(self, max_entries: int = MEMORY_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CachedMedia]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, max_age: Optional[timedelta] = None) -> Optional[CachedMedia]:
+        """Cached media for a key, None if unknown or older than max_age"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        if entry is None:
+            entry = self._read(key)
+            if entry is None:
+                return None
+            self._remember(key, entry)
+
+        if max_age and datetime.fromisoformat(entry.created_at) < datetime.now() - max_age:
+            return None
+        return entry
+
+    def put(self, key: str, kind: str, file_id: str):
+        """Store a file_id after a successful send"""
+        entry = CachedMedia(kind, file_id, datetime.now().isoformat(timespec='seconds'))
+        self._remember(key, entry)
+        try:
+            conn = get_connection()
+            conn.execute('''
+                INSERT OR REPLACE INTO media_cache (cache_key, kind, file_id, created_at)
+                VALUES (?, ?, ?, ?)
+            ''', (key, kind, file_id, entry.created_at))
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f"Error saving media cache entry: {e}")
+
+    def forget(self, key: str):
+        """Drop a key whose file_id Telegram no longer accepts"""
+        with self._lock:
+            self._entries.pop(key, None)
+        try:
+            conn = get_connection()
+            conn.execute("DELETE FROM media_cache WHERE cache_key = ?", (key,))
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f"Error deleting media cache entry: {e}")
+
+    def _remember(self, key: str, entry: CachedMedia):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _read(self, key: str) -> Optional[CachedMedia]:
+        try:
+            conn = get_connection()
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT kind, file_id, created_at FROM media_cache WHERE cache_key = ?", (key,)
+            )
+            row = cursor.fetchone()
+            conn.close()
+            return CachedMedia(*row) if row else None
+        except Exception as e:
+            logger.error(f"Error reading media cache: {e}")
+            return None
+
+
+def url_key(url: str) -> str:
+    """Cache key for a remote source"""
+    return "url:" + url.strip().split('#', 1)[0]
+
+
+_asset_hashes: Dict[Tuple[str, int, float], str] = {}
+
+
+def asset_key(path: Path) -> str:
+    """Cache key for a local file: its content hash (recomputed only when it changes)"""
+    stat = path.stat()
+    signature = (str(path), stat.st_size, stat.st_mtime)
+    digest = _asset_hashes.get(signature)
+    if digest is None:
+        digest = hashlib.sha256(path.read_bytes()).hexdigest()
+        _asset_hashes[signature] = digest
+    return "asset:" + digest
+
+
+def file_id_of(message) -> Optional[Tuple[str, str]]:
+    """(kind, file_id) of the media in a sent Message"""
+    for kind in MEDIA_KINDS:
+        media = getattr(message, kind, None)
+        if isinstance(media, (list, tuple)):
+            # Photos come as a list of sizes, the last one is the largest
+            media = media[-1] if media else None
+        if media:
+            return kind, media.file_id
+    return None
+
+
+def remember_sent(key: str, message) -> None:
+    """Cache the media of a message that was just sent"""
+    found = file_id_of(message)
+    if found:
+        media_cache.put(key, *found)
+
+
+async def send_cached(bot, chat_id: int, key: str, max_age: Optional[timedelta] = None, **kwargs):
+    """Resend cached media by file_id; returns the Message, or None on a miss"""
+    entry = media_cache.get(key, max_age)
+    if entry is None:
+        return None
+    try:
+        return await getattr(bot, f"send_{entry.kind}")(chat_id, entry.file_id, **kwargs)
+    except Exception as e:
+        logger.info(f"Cached file_id for {key} rejected ({e}), dropping it")
+        media_cache.forget(key)
+        return None
+
+
+# Shared instance
+media_cache = MediaCache()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+NICE-BOT - Media Relay
+Size-aware delivery of remote media to Telegram with fixed memory per transfer
+"""
+
+import os
+import asyncio
+import logging
+import tempfile
+from typing import Awaitable, Callable, Optional
+
+import aiohttp
+
+from services.media_cache import file_id_of, media_cache
+from services.metrics import http_trace
+
+logger = logging.getLogger(__name__)
+
+# Telegram fetches URLs itself up to 20 MB; bots may upload up to 50 MB
+URL_SEND_LIMIT = 20 * 1024 * 1024
+UPLOAD_LIMIT = 50 * 1024 * 1024
+
+# Bytes read from upstream per iteration (the only buffer held in RAM)
+CHUNK_SIZE = 64 * 1024
+
+# Concurrent relayed uploads (each one holds a temp file and a socket)
+MAX_CONCURRENT_TRANSFERS = int(os.getenv("MAX_CONCURRENT_TRANSFERS", "3"))
+
+RELAY_TIMEOUT = aiohttp.ClientTimeout(total=300, sock_connect=10, sock_read=60)
+
+_transfer_slots = asyncio.Semaphore(MAX_CONCURRENT_TRANSFERS)
+
+# progress(bytes_done, bytes_total_or_None), awaited after each chunk
+ProgressCallback = Callable[[int, Optional[int]], Awaitable[None]]
+
+# kind -> (Bot API method, form field)
+SEND_METHODS = {
+    'video': ('sendVideo', 'video'),
+    'document': ('sendDocument', 'document'),
+    'photo': ('sendPhoto', 'photo'),
+}
+
+
+class MediaInfo:
+    """Result of probing a remote file"""
+
+    __slots__ = ('url', 'size', 'content_type')
+
+    def __init__(self, url: str, size: Optional[int], content_type: Optional[str]):
+        self.url = url
+        self.size = size
+        self.content_type = content_type
+
+
+class RelayResult:
+    """How a media was delivered"""
+
+    __slots__ = ('method', 'file_id', 'size')
+
+    def __init__(self, method: str, file_id: Optional[str] = None, size: Optional[int] = None):
+        self.method = method  # 'url', 'upload' or 'link'
+        self.file_id = file_id
+        self.size = size
+
+
+class MediaTooLarge(Exception):
+    """Raised while streaming when the file exceeds the upload limit"""
+
+
+async def probe(session: aiohttp.ClientSession, url: str) -> MediaInfo:
+    """Find size and type with a HEAD request, falling back to a 1-byte range GET"""
+    try:
+        async with session.head(url, allow_redirects=True) as response:
+            if response.status < 400 and response.content_length:
+                return MediaInfo(str(response.url), response.content_length, response.content_type)
+    except Exception as e:
+        logger.debug(f"HEAD probe failed for {url}: {e}")
+
+    try:
+        async with session.get(url, headers={'Range': 'bytes=0-0'}, allow_redirects=True) as response:
+            size = None
+            content_range = response.headers.get('Content-Range', '')
+            if '/' in content_range and not content_range.endswith('*'):
+                size = int(content_range.rsplit('/', 1)[1])
+            elif response.status == 200:
+                size = response.content_length
+            return MediaInfo(str(response.url), size, response.content_type)
+    except Exception as e:
+        logger.debug(f"Range probe failed for {url}: {e}")
+
+    return MediaInfo(url, None, None)
+
+
+def _file_id_from_message(message: dict, kind: str) -> Optional[str]:
+    media = message.get(kind)
+    if isinstance(media, list):
+        # Photos come as a list of sizes, the last one is the largest
+        media = media[-1] if media else None
+    return media.get('file_id') if media else None
+
+
+async def _stream_to_file(session: aiohttp.ClientSession, url: str, target,
+                          progress: Optional[ProgressCallback] = None) -> int:
+    """Copy the remote body to a file chunk by chunk"""
+    written = 0
+    async with session.get(url) as response:
+        response.raise_for_status()
+        total = response.content_length
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            written += len(chunk)
+            if written > UPLOAD_LIMIT:
+                raise MediaTooLarge(url)
+            target.write(chunk)
+            if progress:
+                await progress(written, total)
+    target.flush()
+    target.seek(0)
+    return written
+
+
+async def _upload_file(session: aiohttp.ClientSession, bot, chat_id: int, kind: str, fileobj,
+                       filename: str, caption: Optional[str], parse_mode: Optional[str]) -> dict:
+    """Multipart upload to the Bot API; aiohttp streams the file from disk"""
+    method, field = SEND_METHODS[kind]
+    form = aiohttp.FormData()
+    form.add_field('chat_id', str(chat_id))
+    if caption:
+        form.add_field('caption', caption)
+    if parse_mode:
+        form.add_field('parse_mode', parse_mode)
+    if kind == 'video':
+        form.add_field('supports_streaming', 'true')
+    form.add_field(field, fileobj, filename=filename)
+
+    async with session.post(f"{bot.base_url}/{method}", data=form) as response:
+        data = await response.json()
+        if not data.get('ok'):
+            raise RuntimeError(data.get('description', f"HTTP {response.status}"))
+        return data['result']
+
+
+async def relay_media(bot, chat_id: int, url: str, kind: str = 'video', caption: Optional[str] = None,
+                      parse_mode: Optional[str] = 'Markdown', filename: Optional[str] = None,
+                      cache_key: Optional[str] = None,
+                      progress: Optional[ProgressCallback] = None) -> RelayResult:
+    """Deliver a remote file to a chat.
+
+    Small files are sent by URL (Telegram downloads them), larger or
+    unreachable ones are streamed through the bot via a temp file, and files
+    over the upload limit are sent as a link. With a cache_key, the
+    resulting file_id is remembered for send_cached(); progress is called
+    while a relayed file is being downloaded.
+    """
+    result = await _deliver(bot, chat_id, url, kind, caption, parse_mode, filename, progress)
+    if cache_key and result.file_id:
+        media_cache.put(cache_key, kind, result.file_id)
+    return result
+
+
+async def _deliver(bot, chat_id: int, url: str, kind: str, caption: Optional[str],
+                   parse_mode: Optional[str], filename: Optional[str],
+                   progress: Optional[ProgressCallback]) -> RelayResult:
+    async with aiohttp.ClientSession(timeout=RELAY_TIMEOUT, trace_configs=[http_trace()]) as session:
+        info = await probe(session, url)
+
+        if info.size is not None and info.size > UPLOAD_LIMIT:
+            return await send_link(bot, chat_id, info.url, info.size)
+
+        # Cheapest path: let Telegram fetch the file itself
+        if info.size is not None and info.size <= URL_SEND_LIMIT:
+            try:
+                message = await getattr(bot, f"send_{kind}")(
+                    chat_id, info.url, caption=caption, parse_mode=parse_mode
+                )
+                found = file_id_of(message)
+                return RelayResult('url', found[1] if found else None, info.size)
+            except Exception as e:
+                logger.info(f"Telegram could not fetch {info.url} ({e}), relaying")
+
+        # Relay through the bot with a fixed-size buffer
+        async with _transfer_slots:
+            with tempfile.TemporaryFile() as spool:
+                try:
+                    size = await _stream_to_file(session, info.url, spool, progress)
+                except MediaTooLarge:
+                    return await send_link(bot, chat_id, info.url, None)
+
+                name = filename or os.path.basename(info.url.split('?', 1)[0]) or 'media'
+                message = await _upload_file(session, bot, chat_id, kind, spool, name, caption, parse_mode)
+                return RelayResult('upload', _file_id_from_message(message, kind), size)
+
+
+async def send_link(bot, chat_id: int, url: str, size: Optional[int]) -> RelayResult:
+    """Fallback for files Telegram won't accept: send a download link"""
+    size_text = f"{size / (1024 * 1024):.1f} Mo" if size else "plus de 50 Mo"
+    await bot.send_message(
+        chat_id,
+        "📦 **Fichier trop volumineux pour Telegram**\n\n"
+        f"**Taille :** {size_text}\n\n"
+        f"🔗 [Télécharger directement]({url})",
+        parse_mode='Markdown',
+        disable_web_page_preview=True
+    )
+    return RelayResult('link', None, size)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+NICE-BOT - Meme Buffer
+Pre-validated memes fetched in batches in the background, served from memory
+"""
+
+import os
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, List, NamedTuple, Optional
+from urllib.parse import urlparse
+
+import aiohttp
+
+from services.metrics import http_trace, track_queue
+
+logger = logging.getLogger(__name__)
+
+MEME_API_URL = os.getenv("MEME_API_URL", "https://meme-api.com/gimme")
+
+# Memes kept ready; a refill starts when fewer than MEME_LOW_WATER remain
+MEME_BUFFER_SIZE = int(os.getenv("MEME_BUFFER_SIZE", "30"))
+MEME_LOW_WATER = int(os.getenv("MEME_LOW_WATER", "10"))
+
+# Memes per /gimme/N call (the API caps N at 50)
+MEME_BATCH = min(50, int(os.getenv("MEME_BATCH", "20")))
+
+# Seconds to wait before retrying after a failed refill
+MEME_RETRY_DELAY = 30
+
+# Recently served posts, skipped when they come back in a later batch
+RECENT_POSTS = 500
+
+MEME_TIMEOUT = aiohttp.ClientTimeout(total=10)
+
+PHOTO_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+ANIMATION_EXTENSIONS = ('.gif', '.mp4', '.webm')
+
+
+class Meme(NamedTuple):
+    title: str
+    url: str
+    subreddit: str
+    author: str
+    ups: int
+    post_link: str
+    spoiler: bool
+
+    @property
+    def is_animation(self) -> bool:
+        return self.url.lower().endswith(ANIMATION_EXTENSIONS)
+
+
+def parse_meme(data: dict) -> Optional[Meme]:
+    """Meme from an API item, None if NSFW or not a photo/animation Telegram can send"""
+    url = data.get('url') or ''
+    if data.get('nsfw') or not url.startswith('https://'):
+        return None
+    if not urlparse(url).path.lower().endswith(PHOTO_EXTENSIONS + ANIMATION_EXTENSIONS):
+        return None
+    return Meme(
+        title=data.get('title') or 'Meme sans titre',
+        url=url,
+        subreddit=data.get('subreddit') or 'unknown',
+        author=data.get('author') or 'unknown',
+        ups=int(data.get('ups') or 0),
+        post_link=data.get('postLink') or '',
+        spoiler=bool(data.get('spoiler')),
+    )
+
+
+class MemeBuffer:
+    """Bounded ring of ready-to-send memes, refilled by a background task"""
+
+    def __init__(self, size: int = MEME_BUFFER_SIZE, low_water: int = MEME_LOW_WATER,
+                 batch: int = MEME_BATCH, api_url: str = MEME_API_URL):
+        self.size = size
+        self.low_water = low_water
+        self.batch = batch
+        self.api_url = api_url.rstrip('/')
+        self._memes: Deque[Meme] = deque(maxlen=size)
+        self._recent: Deque[str] = deque(maxlen=RECENT_POSTS)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._wanted: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._memes)
+
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=MEME_TIMEOUT, trace_configs=[http_trace()])
+        return self._session
+
+    async def fetch(self, count: int) -> List[Meme]:
+        """One /gimme/N call, keeping only valid memes not served recently"""
+        async with self.session().get(f"{self.api_url}/{count}") as response:
+            response.raise_for_status()
+            data = await response.json(content_type=None)
+
+        items = data.get('memes', [data]) if isinstance(data, dict) else []
+        queued = {meme.url for meme in self._memes}
+        memes = []
+        for item in items:
+            meme = parse_meme(item)
+            if meme and meme.url not in queued and meme.url not in self._recent:
+                queued.add(meme.url)
+                memes.append(meme)
+        return memes
+
+    def _served(self, meme: Meme) -> Meme:
+        self._recent.append(meme.url)
+        if len(self._memes) < self.low_water and self._wanted is not None:
+            self._wanted.set()
+        return meme
+
+    async def get(self) -> Optional[Meme]:
+        """A meme from memory, or a live fetch when the buffer is empty"""
+        if self._memes:
+            return self._served(self._memes.popleft())
+        try:
+            memes = await self.fetch(min(self.batch, 5))
+        except Exception as e:
+            logger.error(f"Meme API error: {e}")
+            return None
+        if not memes:
+            return None
+        # The rest of the live batch primes the buffer
+        self._memes.extend(memes[1:])
+        return self._served(memes[0])
+
+    async def refill(self) -> int:
+        """Top the buffer up to its size; returns how many memes were added"""
+        added = 0
+        while len(self._memes) < self.size:
+            memes = await self.fetch(min(self.batch, self.size - len(self._memes)))
+            if not memes:
+                break
+            self._memes.extend(memes)
+            added += len(memes)
+        return added
+
+    async def _run(self):
+        while True:
+            try:
+                added = await self.refill()
+                logger.debug(f"Meme buffer refilled (+{added}, {len(self._memes)} ready)")
+            except Exception as e:
+                logger.warning(f"Meme refill failed: {e}")
+                await asyncio.sleep(MEME_RETRY_DELAY)
+                continue
+            self._wanted.clear()
+            await self._wanted.wait()
+
+    def start(self):
+        """Fill the buffer now and again whenever it runs low (call from the running loop)"""
+        if self._task is None:
+            self._wanted = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+# Shared instance used by /meme
+meme_buffer = MemeBuffer()
+track_queue("meme_buffer", lambda: len(meme_buffer))
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+NICE-BOT - Metrics
+Counters, histograms and gauges rendered in the Prometheus text format for /metrics
+"""
+
+import re
+import math
+import time
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import aiohttp
+from telegram.request import HTTPXRequest
+
+from services.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Histogram upper bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+# Distinct upstream hosts tracked; the rest are reported as "other"
+MAX_PROVIDERS = 50
+
+# Bot API paths carry the token: /bot<token>/sendVideo, /file/bot<token>/videos/...
+BOT_TOKEN_PATH = re.compile(r'/bot\d+:[^/]+')
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + '}'
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Counter:
+    def __init__(self, registry: "Registry", name: str, labelnames: Sequence[str]):
+        self.registry = registry
+        self.name = name
+        self.labelnames = tuple(labelnames)
+
+    def inc(self, *labels, amount: float = 1):
+        shard = self.registry._shard()
+        key = (self.name, labels)
+        series = shard.get(key)
+        if series is None:
+            shard[key] = [amount]
+        else:
+            series[0] += amount
+
+
+class Histogram:
+    def __init__(self, registry: "Registry", name: str, labelnames: Sequence[str], buckets: Sequence[float]):
+        self.registry = registry
+        self.name = name
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels):
+        shard = self.registry._shard()
+        key = (self.name, labels)
+        series = shard.get(key)
+        if series is None:
+            # One slot per bucket, +Inf, then sum and count
+            series = shard[key] = [0] * (len(self.buckets) + 3)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+
+class Registry:
+    """Metric store whose recording path never takes a lock.
+
+    Every thread (the event loop, to_thread workers) writes to its own dict
+    of series, so there is nothing to contend on; a scrape copies each shard
+    and adds them up. Gauges are callbacks read only when scraped.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: List[Dict[Tuple, list]] = []
+        self._metrics: Dict[str, Tuple[str, str, object]] = {}
+        self._callbacks: Dict[str, List[Tuple[Dict[str, str], Callable[[], float]]]] = {}
+
+    def _shard(self) -> Dict[Tuple, list]:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            self._shards.append(shard)
+        return shard
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(self, name, labelnames)
+        self._metrics[name] = ('counter', help_text, metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(self, name, labelnames, buckets)
+        self._metrics[name] = ('histogram', help_text, metric)
+        return metric
+
+    def callback(self, name: str, help_text: str, fn: Callable[[], float], kind: str = 'gauge', **labels):
+        """Value read from fn at scrape time; several label sets may share a name"""
+        if name not in self._metrics:
+            self._metrics[name] = (kind, help_text, None)
+        self._callbacks.setdefault(name, []).append((labels, fn))
+
+    def _merged(self) -> Dict[Tuple, list]:
+        merged: Dict[Tuple, list] = {}
+        for shard in list(self._shards):
+            for key, series in shard.copy().items():
+                total = merged.get(key)
+                if total is None:
+                    merged[key] = list(series)
+                else:
+                    for i, value in enumerate(series):
+                        total[i] += value
+        return merged
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format"""
+        series_by_name: Dict[str, List[Tuple[tuple, list]]] = {}
+        for (name, labels), series in self._merged().items():
+            series_by_name.setdefault(name, []).append((labels, series))
+
+        lines = []
+        for name, (kind, help_text, metric) in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if isinstance(metric, Counter):
+                for labels, series in sorted(series_by_name.get(name, [])):
+                    lines.append(f"{name}{_labels(metric.labelnames, labels)} {_number(series[0])}")
+            elif isinstance(metric, Histogram):
+                bounds = metric.buckets + (math.inf,)
+                names = metric.labelnames + ('le',)
+                for labels, series in sorted(series_by_name.get(name, [])):
+                    cumulative = 0
+                    for bound, count in zip(bounds, series):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels(names, labels + (_number(bound),))} {cumulative}")
+                    base = _labels(metric.labelnames, labels)
+                    lines.append(f"{name}_sum{base} {_number(series[-2])}")
+                    lines.append(f"{name}_count{base} {series[-1]}")
+            for labels, fn in self._callbacks.get(name, []):
+                try:
+                    value = fn()
+                except Exception as e:
+                    logger.debug(f"Metric {name} {labels} unavailable: {e}")
+                    continue
+                lines.append(f"{name}{_labels(tuple(labels), tuple(labels.values()))} {_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+# Shared registry rendered by /metrics
+metrics = Registry()
+
+UPDATES = metrics.counter(
+    "nicebot_updates_total", "Telegram updates received", ("type",))
+HANDLER_SECONDS = metrics.histogram(
+    "nicebot_handler_seconds", "Time spent in each command or update handler", ("handler",))
+HANDLER_ERRORS = metrics.counter(
+    "nicebot_handler_errors_total", "Handlers that raised", ("handler",))
+COMMAND_RESULTS = metrics.counter(
+    "nicebot_command_results_total", "Command outcomes reported by log_command_usage", ("command", "status"))
+UPSTREAM_SECONDS = metrics.histogram(
+    "nicebot_upstream_seconds", "Time to response headers from external APIs", ("provider",))
+UPSTREAM_ERRORS = metrics.counter(
+    "nicebot_upstream_errors_total", "External API calls that failed or returned 4xx/5xx", ("provider", "reason"))
+SQLITE_SECONDS = metrics.histogram(
+    "nicebot_sqlite_query_seconds", "SQLite statement execution time", ("statement", "table"), QUERY_BUCKETS)
+LOOP_LAG_SECONDS = metrics.histogram(
+    "nicebot_event_loop_lag_seconds", "How late the event loop ran a timer", (), LAG_BUCKETS)
+LOOP_BLOCKS = metrics.counter(
+    "nicebot_event_loop_blocked_total", "Times the loop was caught blocked, by running handler", ("handler",))
+SLOW_HANDLERS = metrics.counter(
+    "nicebot_slow_handlers_total", "Handlers still running past SLOW_HANDLER_SECONDS", ("handler",))
+
+
+def track_queue(name: str, depth: Callable[[], float]):
+    """Report the length of a background queue"""
+    metrics.callback("nicebot_queue_depth", "Items waiting in background queues", depth, queue=name)
+
+
+def track_cache(name: str, cache):
+    """Report the hits, misses, size and hit ratio of a TTLCache"""
+    def ratio() -> float:
+        total = cache.hits + cache.misses
+        return round(cache.hits / total, 4) if total else 0.0
+
+    metrics.callback("nicebot_cache_hits_total", "Cache lookups that found a value",
+                     lambda: cache.hits, kind='counter', cache=name)
+    metrics.callback("nicebot_cache_misses_total", "Cache lookups that found nothing",
+                     lambda: cache.misses, kind='counter', cache=name)
+    metrics.callback("nicebot_cache_entries", "Entries held by a cache", lambda: len(cache), cache=name)
+    metrics.callback("nicebot_cache_hit_ratio", "Hits over lookups since startup", ratio, cache=name)
+
+
+# ---------------------------------------------------------------- upstream HTTP
+
+_providers: set = set()
+
+
+def provider_of(host: Optional[str]) -> str:
+    """'fr.wikipedia.org' -> 'wikipedia.org', with a bounded number of distinct values"""
+    if not host:
+        return 'unknown'
+    parts = host.lower().split('.')
+    provider = '.'.join(parts[-2:]) if len(parts) > 2 and not host[0].isdigit() else host.lower()
+    if provider not in _providers:
+        if len(_providers) >= MAX_PROVIDERS:
+            return 'other'
+        _providers.add(provider)
+    return provider
+
+
+def _span_name(params) -> str:
+    # No query string (several APIs take their key as a parameter) and no bot token
+    path = BOT_TOKEN_PATH.sub('/bot<token>', params.url.path)
+    return f"{params.method} {params.url.host}{path}"[:120]
+
+
+async def _on_request_start(session, context, params):
+    context.start = time.perf_counter()
+
+
+async def _on_request_end(session, context, params):
+    provider = provider_of(params.url.host)
+    elapsed = time.perf_counter() - context.start
+    UPSTREAM_SECONDS.observe(elapsed, provider)
+    status = params.response.status
+    if status >= 400:
+        UPSTREAM_ERRORS.inc(provider, str(status))
+    tracer.record(_span_name(params), context.start, elapsed, f"HTTP {status}" if status >= 400 else None)
+
+
+async def _on_request_exception(session, context, params):
+    provider = provider_of(params.url.host)
+    elapsed = time.perf_counter() - context.start
+    UPSTREAM_SECONDS.observe(elapsed, provider)
+    UPSTREAM_ERRORS.inc(provider, type(params.exception).__name__)
+    tracer.record(_span_name(params), context.start, elapsed, type(params.exception).__name__)
+
+
+def http_trace() -> aiohttp.TraceConfig:
+    """Trace config timing (and tracing) every request of the aiohttp session it is passed to"""
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(_on_request_start)
+    trace.on_request_end.append(_on_request_end)
+    trace.on_request_exception.append(_on_request_exception)
+    return trace
+
+
+class TracedRequest(HTTPXRequest):
+    """PTB's Bot API transport (httpx), timed and traced like the aiohttp sessions"""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs) -> Tuple[int, bytes]:
+        # The URL holds the bot token: only the API method goes into the span name
+        name = f"telegram {url.rsplit('/', 1)[-1]}"
+        start = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+        except Exception as e:
+            elapsed = time.perf_counter() - start
+            UPSTREAM_SECONDS.observe(elapsed, 'telegram.org')
+            UPSTREAM_ERRORS.inc('telegram.org', type(e).__name__)
+            tracer.record(name, start, elapsed, type(e).__name__)
+            raise
+        elapsed = time.perf_counter() - start
+        UPSTREAM_SECONDS.observe(elapsed, 'telegram.org')
+        if code >= 400:
+            UPSTREAM_ERRORS.inc('telegram.org', str(code))
+        tracer.record(name, start, elapsed, f"HTTP {code}" if code >= 400 else None)
+        return code, payload
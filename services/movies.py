@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+NICE-BOT - Movie Lookups
+TMDB search and details behind TTL caches, over one shared session
+"""
+
+import os
+import asyncio
+import hashlib
+import logging
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set
+
+import aiohttp
+
+from services.ttl_cache import TTLCache
+from services.metrics import http_trace
+
+logger = logging.getLogger(__name__)
+
+TMDB_API_URL = "https://api.themoviedb.org/3"
+TMDB_IMAGE_URL = "https://image.tmdb.org/t/p/w500"
+TMDB_LANGUAGE = os.getenv("TMDB_LANGUAGE", "fr-FR")
+
+# Results offered in the /film carousel
+FILM_RESULTS = int(os.getenv("FILM_RESULTS", "5"))
+
+# Searches change slowly, movie details even less
+FILM_SEARCH_TTL = int(os.getenv("FILM_SEARCH_TTL", "21600"))
+FILM_DETAILS_TTL = 86400
+FILM_CACHE_ENTRIES = 1024
+
+# Details fetched ahead of the card being shown, and how many at once
+FILM_PREFETCH = 2
+FILM_PREFETCH_CONCURRENCY = 4
+
+TMDB_TIMEOUT = aiohttp.ClientTimeout(total=10)
+
+
+class MovieHit(NamedTuple):
+    id: int
+    title: str
+    original_title: str
+    overview: str
+    release_date: str
+    vote_average: float
+    vote_count: int
+    poster_url: str
+
+
+class MovieDetails(NamedTuple):
+    runtime: int
+    genres: List[str]
+    tagline: str
+    directors: List[str]
+    cast: List[str]
+
+
+def query_key(query: str) -> str:
+    """Same key for 'Inception', ' inception ' and 'INCEPTION'"""
+    return ' '.join(query.lower().split())
+
+
+def query_token(query: str) -> str:
+    """Short stable id of a query, small enough for callback_data"""
+    return hashlib.sha1(query_key(query).encode('utf-8')).hexdigest()[:12]
+
+
+def _poster(path: Optional[str]) -> str:
+    return f"{TMDB_IMAGE_URL}{path}" if path else ''
+
+
+class MovieClient:
+    """Cached TMDB lookups shared by every /film request"""
+
+    def __init__(self, api_key: Optional[str] = None, results: int = FILM_RESULTS):
+        self.api_key = api_key
+        self.results = results
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._searches = TTLCache(FILM_SEARCH_TTL, FILM_CACHE_ENTRIES, name="tmdb_searches")
+        self._details = TTLCache(FILM_DETAILS_TTL, FILM_CACHE_ENTRIES, name="tmdb_details")
+        # callback token -> query, so carousel buttons can find their results again
+        self._queries = TTLCache(FILM_SEARCH_TTL, FILM_CACHE_ENTRIES)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._prefetch_slots = asyncio.Semaphore(FILM_PREFETCH_CONCURRENCY)
+        # The loop only keeps weak references to tasks: hold the prefetches until they finish
+        self._prefetches: Set[asyncio.Task] = set()
+
+    @property
+    def key(self) -> Optional[str]:
+        return self.api_key or os.getenv("TMDB_API_KEY")
+
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=TMDB_TIMEOUT, trace_configs=[http_trace()])
+        return self._session
+
+    async def close(self):
+        for task in list(self._prefetches):
+            task.cancel()
+        await asyncio.gather(*self._prefetches, return_exceptions=True)
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def _get(self, path: str, **params) -> dict:
+        # Params go through aiohttp so titles like "Tom & Jerry" are escaped
+        params = {'api_key': self.key, 'language': TMDB_LANGUAGE, **params}
+        async with self.session().get(f"{TMDB_API_URL}{path}", params=params) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def _shared(self, key: str, cache: TTLCache, fetch):
+        """Cached value for key; concurrent misses share one upstream call"""
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await fetch()
+            cache.set(key, result)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters get the error; nobody may be waiting, so mark it retrieved
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def search(self, query: str) -> List[MovieHit]:
+        """Top results for a title, poster URLs included (one call per normalized query)"""
+        key = query_key(query)
+        self._queries.set(query_token(key), key)
+
+        async def fetch():
+            data = await self._get("/search/movie", query=key, include_adult='false')
+            return [
+                MovieHit(
+                    id=movie['id'],
+                    title=movie.get('title') or 'N/A',
+                    original_title=movie.get('original_title') or '',
+                    overview=movie.get('overview') or 'Pas de description disponible.',
+                    release_date=movie.get('release_date') or 'N/A',
+                    vote_average=float(movie.get('vote_average') or 0),
+                    vote_count=int(movie.get('vote_count') or 0),
+                    poster_url=_poster(movie.get('poster_path')),
+                )
+                for movie in (data.get('results') or [])[:self.results]
+            ]
+
+        return await self._shared(f"search:{key}", self._searches, fetch)
+
+    def query_for(self, token: str) -> Optional[str]:
+        """Query behind a carousel token, None once it has expired"""
+        return self._queries.get(token)
+
+    async def details(self, movie_id: int) -> MovieDetails:
+        """Runtime, genres and credits of one movie, fetched when its card is shown"""
+        async def fetch():
+            data = await self._get(f"/movie/{movie_id}", append_to_response='credits')
+            credits = data.get('credits') or {}
+            return MovieDetails(
+                runtime=int(data.get('runtime') or 0),
+                genres=[genre['name'] for genre in data.get('genres') or []],
+                tagline=data.get('tagline') or '',
+                directors=[person['name'] for person in credits.get('crew') or []
+                           if person.get('job') == 'Director'],
+                cast=[person['name'] for person in (credits.get('cast') or [])[:4]],
+            )
+
+        return await self._shared(f"details:{movie_id}", self._details, fetch)
+
+    async def _prefetch_one(self, movie_id: int):
+        async with self._prefetch_slots:
+            try:
+                await self.details(movie_id)
+            except Exception as e:
+                logger.debug(f"TMDB prefetch of {movie_id} failed: {e}")
+
+    def prefetch(self, hits: Sequence[MovieHit]):
+        """Warm the details of the next cards concurrently, in the background"""
+        for hit in hits:
+            if f"details:{hit.id}" not in self._details:
+                task = asyncio.create_task(self._prefetch_one(hit.id))
+                self._prefetches.add(task)
+                task.add_done_callback(self._prefetches.discard)
+
+
+# Shared instance used by /film
+movie_client = MovieClient()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+NICE-BOT - News Feed
+Topics fetched in the background into a local store, answered from an inverted index
+"""
+
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+
+import aiohttp
+
+from services.content_pool import keywords
+from services.downloads import clean_url
+from services.metrics import http_trace
+from services.store import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+# Topics always kept fresh
+NEWS_TOPICS = [
+    topic.strip() for topic in
+    os.getenv("NEWS_TOPICS", "Technology,Science,World News,Business,Sports").split(',')
+    if topic.strip()
+]
+
+# Seconds between two refreshes of every topic
+NEWS_REFRESH_INTERVAL = int(os.getenv("NEWS_REFRESH_INTERVAL", "1800"))
+
+# Store bounds: articles kept, their maximum age, and topics users added by searching
+NEWS_MAX_ARTICLES = 1000
+NEWS_MAX_AGE = timedelta(days=3)
+NEWS_MAX_TOPICS = 50
+NEWS_TOPIC_IDLE = timedelta(days=7)
+
+# Topics fetched at the same time during a refresh
+NEWS_CONCURRENCY = 3
+
+NEWS_SNAPSHOT_FILE = Path(__file__).parent.parent / "data" / "news.json"
+
+NEWS_TIMEOUT = aiohttp.ClientTimeout(total=15)
+
+MEDIASTACK_URL = "http://api.mediastack.com/v1/news"
+WIKIMEDIA_URL = "https://api.princetechn.com/api/search/wikimedia"
+
+
+class Article(NamedTuple):
+    id: str
+    title: str
+    summary: str
+    url: str
+    source: str
+    image: str
+    published_at: str
+    topic: str
+
+
+def article_id(url: str) -> str:
+    """Same id for a URL with or without tracking parameters, www. or trailing slash"""
+    return hashlib.sha1(clean_url(url).encode('utf-8')).hexdigest()[:16]
+
+
+def topic_key(topic: str) -> str:
+    return ' '.join(topic.lower().split())
+
+
+class NewsFeed:
+    """Article store with a keyword -> article ids index, refreshed by a background task"""
+
+    def __init__(self, topics: Iterable[str] = NEWS_TOPICS, interval: int = NEWS_REFRESH_INTERVAL,
+                 snapshot_file: Path = NEWS_SNAPSHOT_FILE):
+        self.interval = interval
+        self.snapshot_file = snapshot_file
+        self.configured = {topic_key(topic): topic for topic in topics}
+        # Topics added by /news searches: key -> [topic as typed, last time someone asked]
+        self.requested: Dict[str, List[str]] = {}
+        self.refreshed_at: Optional[str] = None
+        self._articles: Dict[str, Article] = {}
+        self._by_keyword: Dict[str, Set[str]] = {}
+        self._by_topic: Dict[str, Set[str]] = {}
+        self._loaded = False
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        self._load()
+        return len(self._articles)
+
+    # ------------------------------------------------------------------ store
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            if self.snapshot_file.exists():
+                with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.requested = data.get('requested', {})
+                self.refreshed_at = data.get('refreshed_at')
+                self._ingest(Article(*item) for item in data.get('articles', []))
+                logger.info(f"Loaded {len(self._articles)} news articles")
+        except Exception as e:
+            logger.error(f"Error loading news snapshot: {e}")
+
+    def _snapshot(self) -> dict:
+        """Built on the loop, so the writer thread never iterates the live dicts"""
+        return {
+            'refreshed_at': self.refreshed_at,
+            'requested': {key: list(entry) for key, entry in self.requested.items()},
+            'articles': [list(article) for article in self._articles.values()],
+        }
+
+    def _index(self, article: Article):
+        words = set(keywords(f"{article.title} {article.summary} {article.topic}"))
+        for word in words:
+            self._by_keyword.setdefault(word, set()).add(article.id)
+        self._by_topic.setdefault(topic_key(article.topic), set()).add(article.id)
+
+    def _ingest(self, articles: Iterable[Article]) -> int:
+        """Add articles not seen yet (by URL hash); returns how many were new"""
+        added = 0
+        for article in articles:
+            if article.id not in self._articles:
+                self._articles[article.id] = article
+                self._index(article)
+                added += 1
+        return added
+
+    def _prune(self):
+        """Drop old articles and idle search topics, then rebuild the index"""
+        cutoff = (datetime.now() - NEWS_MAX_AGE).isoformat()
+        kept = sorted(
+            (a for a in self._articles.values() if a.published_at >= cutoff),
+            key=lambda a: a.published_at, reverse=True
+        )[:NEWS_MAX_ARTICLES]
+        idle = (datetime.now() - NEWS_TOPIC_IDLE).isoformat()
+        self.requested = {key: entry for key, entry in self.requested.items() if entry[1] >= idle}
+
+        self._articles = {a.id: a for a in kept}
+        self._by_keyword, self._by_topic = {}, {}
+        for article in kept:
+            self._index(article)
+
+    # ------------------------------------------------------------------ query
+
+    def search(self, query: str, limit: int = 3) -> List[Article]:
+        """Newest articles of a topic, or matching every keyword of the query"""
+        self._load()
+        ids = self._by_topic.get(topic_key(query))
+        if not ids:
+            words = keywords(query)
+            postings = [self._by_keyword.get(word, set()) for word in words]
+            ids = set.intersection(*postings) if postings else set()
+        articles = sorted((self._articles[i] for i in ids), key=lambda a: a.published_at, reverse=True)
+        return articles[:limit]
+
+    async def lookup(self, query: str, limit: int = 3) -> List[Article]:
+        """Answer from the index; unknown topics are fetched live and kept refreshed"""
+        key = topic_key(query)
+        now = datetime.now().isoformat(timespec='seconds')
+        if key in self.requested:
+            self.requested[key][1] = now
+        found = self.search(query, limit)
+        if found:
+            return found
+
+        articles = await self.fetch_topic(query)
+        if articles:
+            self._ingest(articles)
+            if key not in self.configured and len(self.requested) < NEWS_MAX_TOPICS:
+                self.requested[key] = [query, now]
+        return self.search(query, limit) or articles[:limit]
+
+    # ------------------------------------------------------------------ fetch
+
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=NEWS_TIMEOUT, trace_configs=[http_trace()])
+        return self._session
+
+    async def fetch_topic(self, topic: str) -> List[Article]:
+        """Articles for a topic from Mediastack when configured, else PrinceTech Wikimedia"""
+        now = datetime.now().isoformat(timespec='seconds')
+        mediastack_key = os.getenv("MEDIASTACK_API_KEY")
+        if mediastack_key:
+            params = {'access_key': mediastack_key, 'keywords': topic, 'languages': 'fr,en',
+                      'sort': 'published_desc', 'limit': 25}
+            async with self.session().get(MEDIASTACK_URL, params=params) as response:
+                response.raise_for_status()
+                data = await response.json(content_type=None)
+            return [
+                Article(article_id(item['url']), item.get('title') or topic,
+                        item.get('description') or '', item['url'], item.get('source') or '',
+                        item.get('image') or '', (item.get('published_at') or now)[:19], topic)
+                for item in data.get('data') or [] if item.get('url')
+            ]
+
+        params = {'apikey': os.getenv("PRINCETECHN_API_KEY", "prince"), 'title': topic}
+        async with self.session().get(WIKIMEDIA_URL, params=params) as response:
+            response.raise_for_status()
+            data = await response.json(content_type=None)
+        result = data.get('result') if data.get('success') else None
+        url = (result or {}).get('content_urls', {}).get('desktop', {}).get('page', '')
+        if not url:
+            return []
+        return [Article(article_id(url), result.get('title', topic),
+                        result.get('extract', 'Aucune information disponible.'), url, 'Wikimedia',
+                        result.get('thumbnail', {}).get('source', ''), now, topic)]
+
+    async def refresh(self) -> int:
+        """Fetch every configured and requested topic; returns how many articles were new"""
+        self._load()
+        topics = list(self.configured.values()) + [
+            topic for key, (topic, _) in self.requested.items() if key not in self.configured
+        ]
+        slots = asyncio.Semaphore(NEWS_CONCURRENCY)
+
+        async def fetch(topic: str) -> List[Article]:
+            async with slots:
+                try:
+                    return await self.fetch_topic(topic)
+                except Exception as e:
+                    logger.warning(f"News refresh for '{topic}' failed: {e}")
+                    return []
+
+        batches = await asyncio.gather(*(fetch(topic) for topic in topics))
+        added = sum(self._ingest(batch) for batch in batches)
+        self._prune()
+        self.refreshed_at = datetime.now().isoformat(timespec='seconds')
+        try:
+            await asyncio.to_thread(atomic_write_json, self.snapshot_file, self._snapshot())
+        except Exception as e:
+            logger.error(f"Error saving news snapshot: {e}")
+        logger.info(f"News refreshed: {len(topics)} topics, {added} new articles")
+        return added
+
+    def _seconds_until_due(self) -> float:
+        """A snapshot fresher than the interval is reused after a restart"""
+        self._load()
+        try:
+            age = (datetime.now() - datetime.fromisoformat(self.refreshed_at)).total_seconds()
+        except (TypeError, ValueError):
+            return 0
+        return max(0.0, self.interval - age)
+
+    async def _run(self):
+        await asyncio.sleep(self._seconds_until_due())
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Refresh when due, then every interval (call from the running loop)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+# Shared instance used by /news
+news_feed = NewsFeed()
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+NICE-BOT - PDF Renderer
+Templated PDF generation in a worker pool with Unicode fonts parsed once per worker
+"""
+
+import io
+import os
+import re
+import copy
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from fontTools import ttLib
+from fpdf import FPDF, XPos, YPos
+from fpdf.fonts import SubsetMap
+
+logger = logging.getLogger(__name__)
+
+# Workers rendering documents. Threads by default (one small instance on the
+# free tier); 'process' gives real parallelism at the cost of a bot import per worker
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+PDF_EXECUTOR = os.getenv("PDF_EXECUTOR", "thread").lower()
+
+# Characters accepted per document, all fields together
+PDF_MAX_CHARS = int(os.getenv("PDF_MAX_CHARS", "20000"))
+
+# Where to look for DejaVu Sans (first directory holding the regular face wins)
+FONT_DIRS = [
+    os.getenv("PDF_FONT_DIR", ""),
+    str(Path(__file__).parent.parent / "assets" / "fonts"),
+    "/usr/share/fonts/truetype/dejavu",
+    "/usr/share/fonts/dejavu",
+    "/usr/share/fonts/TTF",
+    "/usr/local/share/fonts",
+]
+FONT_FILES = {'': 'DejaVuSans.ttf', 'B': 'DejaVuSans-Bold.ttf', 'I': 'DejaVuSans-Oblique.ttf'}
+FONT_FAMILY = 'dejavu'
+CORE_FAMILY = 'helvetica'
+
+
+class PDFTooLarge(ValueError):
+    """The document content exceeds PDF_MAX_CHARS"""
+
+
+def find_fonts() -> Dict[str, str]:
+    """Style -> TTF path of the first complete-enough DejaVu install, {} if none"""
+    for directory in filter(None, FONT_DIRS):
+        regular = Path(directory) / FONT_FILES['']
+        if regular.is_file():
+            return {
+                style: str(Path(directory) / name)
+                for style, name in FONT_FILES.items()
+                if (Path(directory) / name).is_file()
+            }
+    return {}
+
+
+# ------------------------------------------------------------ worker side
+# Everything below runs inside the pool workers.
+
+_font_templates: Dict[str, object] = {}
+_font_data: Dict[str, bytes] = {}
+_font_lock = threading.Lock()
+
+
+def _load_fonts(font_files: Dict[str, str]):
+    """Parse each TTF once (metrics, cmap, widths) and keep its bytes in memory"""
+    with _font_lock:
+        if _font_templates or not font_files:
+            return
+        loader = FPDF()
+        for style, path in font_files.items():
+            loader.add_font(FONT_FAMILY, style, path)
+            _font_templates[style] = loader.fonts[f"{FONT_FAMILY}{style}"]
+            _font_data[style] = Path(path).read_bytes()
+
+
+def _font_for_document(style: str, number: int):
+    """Per-document copy of a parsed font.
+
+    Metrics, widths and cmap are shared with the template (read-only). The
+    fontTools object is not: subsetting mutates it on output, so each
+    document gets its own, lazily loaded from the bytes kept in memory.
+    """
+    font = copy.copy(_font_templates[style])
+    font.i = number
+    font.ttfont = ttLib.TTFont(io.BytesIO(_font_data[style]), recalcTimestamp=False, lazy=True)
+    font.missing_glyphs = []
+    font.biggest_size_pt = 0
+    font.subset = SubsetMap(font)
+    return font
+
+
+class BotDocument(FPDF):
+    """FPDF with the NICE-BOT footer and the cached fonts attached"""
+
+    def __init__(self):
+        super().__init__()
+        self.unicode = bool(_font_templates)
+        self.family = FONT_FAMILY if self.unicode else CORE_FAMILY
+        self.set_auto_page_break(True, margin=15)
+
+    def style(self, style: str = '', size: int = 12):
+        # Missing italic/bold faces fall back to the regular one
+        if self.unicode:
+            if style not in _font_templates:
+                style = ''
+            # Fonts are attached on first use, so unused faces cost nothing
+            fontkey = f"{FONT_FAMILY}{style}"
+            if fontkey not in self.fonts:
+                self.fonts[fontkey] = _font_for_document(style, len(self.fonts) + 1)
+        self.set_font(self.family, style, size)
+
+    def clean(self, text: str) -> str:
+        text = re.sub(r'(\*\*|__|`)', '', str(text))
+        if not self.unicode:
+            text = text.encode('latin-1', errors='replace').decode('latin-1')
+        return text
+
+    def write_block(self, text: str, style: str = '', size: int = 12, height: float = 7):
+        self.style(style, size)
+        self.multi_cell(0, height, self.clean(text), new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+
+    def footer(self):
+        self.set_y(-12)
+        self.style('I', 8)
+        self.cell(0, 5, self.clean(f"NICE-BOT - page {self.page_no()}"), align='C')
+
+
+def _header(pdf: BotDocument, title: str, fields: dict):
+    pdf.write_block(title, 'B', 16, 10)
+    pdf.ln(2)
+    meta = f"Généré le : {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}"
+    if fields.get('author'):
+        meta += f"\nUtilisateur : {fields['author']}"
+    pdf.write_block(meta, 'I', 10, 5)
+    pdf.ln(6)
+
+
+def template_text(pdf: BotDocument, fields: dict):
+    """Plain text: title, metadata and the content"""
+    _header(pdf, fields.get('title') or "Document NICE-BOT", fields)
+    pdf.write_block(fields['text'])
+
+
+def template_translation(pdf: BotDocument, fields: dict):
+    """Original text and its translation"""
+    _header(pdf, "Traduction", fields)
+    source = fields.get('source_lang') or 'auto'
+    pdf.write_block(f"Texte original ({source})", 'B', 12)
+    pdf.write_block(fields['original'])
+    pdf.ln(4)
+    pdf.write_block(f"Traduction ({fields['target_lang'].upper()})", 'B', 12)
+    pdf.write_block(fields['translated'])
+
+
+def template_ai_answer(pdf: BotDocument, fields: dict):
+    """Question and AI answer"""
+    _header(pdf, "Réponse IA", fields)
+    pdf.write_block("Question", 'B', 12)
+    pdf.write_block(fields['question'])
+    pdf.ln(4)
+    pdf.write_block("Réponse", 'B', 12)
+    pdf.write_block(fields['answer'])
+
+
+def template_transcript(pdf: BotDocument, fields: dict):
+    """Conversation: (speaker, text) pairs in order"""
+    _header(pdf, fields.get('title') or "Conversation", fields)
+    for speaker, text in fields['messages']:
+        pdf.write_block(speaker, 'B', 10, 6)
+        pdf.write_block(text, '', 11, 6)
+        pdf.ln(2)
+
+
+TEMPLATES: Dict[str, Callable[[BotDocument, dict], None]] = {
+    'text': template_text,
+    'translation': template_translation,
+    'ai_answer': template_ai_answer,
+    'transcript': template_transcript,
+}
+
+
+def render_document(template: str, fields: dict) -> bytes:
+    """Blocking render of one document (runs in a worker)"""
+    pdf = BotDocument()
+    pdf.add_page()
+    TEMPLATES[template](pdf, fields)
+    return bytes(pdf.output())
+
+
+def _worker_ready() -> bool:
+    return bool(_font_templates)
+
+
+# ------------------------------------------------------------- loop side
+
+def content_length(fields: dict) -> int:
+    """Characters of text a document will contain"""
+    total = 0
+    for value in fields.values():
+        if isinstance(value, str):
+            total += len(value)
+        elif isinstance(value, (list, tuple)):
+            total += sum(len(str(part)) for item in value for part in
+                         (item if isinstance(item, (list, tuple)) else (item,)))
+    return total
+
+
+class PDFRenderer:
+    """Submits documents to the worker pool"""
+
+    def __init__(self, workers: int = PDF_WORKERS, mode: str = PDF_EXECUTOR,
+                 max_chars: int = PDF_MAX_CHARS):
+        self.workers = workers
+        self.mode = mode
+        self.max_chars = max_chars
+        self.font_files: Dict[str, str] = {}
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def unicode(self) -> bool:
+        return bool(self.font_files)
+
+    def start(self) -> Executor:
+        """Create the pool; each worker parses the fonts once when it starts"""
+        with self._lock:
+            if self._executor is None:
+                self.font_files = find_fonts()
+                if not self.font_files:
+                    logger.warning("No DejaVu font found, PDFs fall back to latin-1 core fonts")
+                if self.mode == 'process':
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn'),
+                        initializer=_load_fonts, initargs=(self.font_files,)
+                    )
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix='pdf',
+                        initializer=_load_fonts, initargs=(self.font_files,)
+                    )
+            return self._executor
+
+    async def warm_up(self):
+        """Spin up the workers now so the first /pdf does not pay for font parsing"""
+        loop = asyncio.get_running_loop()
+        executor = self.start()
+        await asyncio.gather(*(
+            loop.run_in_executor(executor, _worker_ready) for _ in range(self.workers)
+        ))
+
+    async def render(self, template: str, **fields) -> bytes:
+        """PDF bytes for a template; raises PDFTooLarge past max_chars"""
+        if template not in TEMPLATES:
+            raise ValueError(f"Unknown PDF template: {template}")
+        if content_length(fields) > self.max_chars:
+            raise PDFTooLarge(template)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.start(), render_document, template, fields)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+# Shared instance used by /pdf
+pdf_renderer = PDFRenderer()
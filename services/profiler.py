@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+NICE-BOT - Sampling Profiler
+On-demand, time-bounded stack sampling of every thread and asyncio task, as collapsed stacks
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+from collections import Counter
+from types import FrameType
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+from services.watchdog import awaited_frames
+
+logger = logging.getLogger(__name__)
+
+# Profile length accepted by /perfprofile and /debug/profile
+PROFILE_DEFAULT_SECONDS = 15
+PROFILE_MAX_SECONDS = 120
+
+# Seconds between two samples of the threads, and of the suspended asyncio tasks
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.01"))
+TASK_SAMPLE_INTERVAL = 0.05
+
+# Root frame of the samples taken on the event-loop thread and of the awaiting tasks
+LOOP_ROOT = "asyncio-loop"
+TASKS_ROOT = "asyncio-tasks"
+
+# Leaf functions where an idle loop thread waits for I/O
+IDLE_FUNCTIONS = ('select', 'poll', 'epoll', 'kqueue', 'control')
+
+
+class ProfilerBusy(Exception):
+    """A profile is already running"""
+
+
+class Profile(NamedTuple):
+    folded: str
+    samples: int
+    seconds: float
+    loop_busy: float
+    hot: List[Tuple[str, float]]
+
+
+def frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def fold(root: str, frames: Iterable[FrameType]) -> str:
+    """'root;outer;...;inner' line of the collapsed-stack format (no ';' inside names)"""
+    return ';'.join([root] + [frame_name(frame).replace(';', ',') for frame in frames])
+
+
+def thread_frames(frame: Optional[FrameType]) -> List[FrameType]:
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+class SamplingProfiler:
+    """Samples stacks only while a profile runs; when idle it has no thread, task or hook.
+
+    A thread reads every other thread's stack through sys._current_frames(),
+    the event-loop thread included, which shows where the loop spends its
+    time (or blocks). A task on the loop samples where suspended asyncio
+    tasks are awaiting. Both go into one collapsed-stack file, readable by
+    flamegraph.pl or speedscope.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.running = False
+
+    def _sample_threads(self, until: float, loop_thread: int, stacks: Counter) -> int:
+        me = threading.get_ident()
+        samples = 0
+        names = {}
+        while time.monotonic() < until:
+            if samples % 100 == 0:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                root = LOOP_ROOT if ident == loop_thread else names.get(ident, f"thread-{ident}")
+                stacks[fold(root, thread_frames(frame))] += 1
+            samples += 1
+            time.sleep(self.interval)
+        return samples
+
+    async def _sample_tasks(self, until: float, stacks: Counter):
+        me = asyncio.current_task()
+        while time.monotonic() < until:
+            for task in asyncio.all_tasks():
+                if task is not me and not task.done():
+                    frames = awaited_frames(task)
+                    if frames:
+                        stacks[fold(TASKS_ROOT, frames)] += 1
+            await asyncio.sleep(TASK_SAMPLE_INTERVAL)
+
+    async def profile(self, seconds: float = PROFILE_DEFAULT_SECONDS) -> Profile:
+        """Sample for seconds (capped at PROFILE_MAX_SECONDS); raises ProfilerBusy if one is running"""
+        if self.running:
+            raise ProfilerBusy()
+        self.running = True
+        seconds = max(1.0, min(float(seconds), PROFILE_MAX_SECONDS))
+        # One counter per sampler: the thread and the loop never write to the same dict
+        stacks: Counter = Counter()
+        task_stacks: Counter = Counter()
+        try:
+            until = time.monotonic() + seconds
+            samples, _ = await asyncio.gather(
+                asyncio.to_thread(self._sample_threads, until, threading.get_ident(), stacks),
+                self._sample_tasks(until, task_stacks),
+            )
+        finally:
+            self.running = False
+        stacks.update(task_stacks)
+
+        # Share of loop-thread samples not parked in the selector, and its hottest leaves
+        loop_stacks = [(stack, count) for stack, count in stacks.items() if stack.startswith(LOOP_ROOT + ';')]
+        loop_total = sum(count for _, count in loop_stacks) or 1
+        leaves: Counter = Counter()
+        for stack, count in loop_stacks:
+            leaf = stack.rsplit(';', 1)[-1]
+            if not leaf.split('.')[-1].endswith(IDLE_FUNCTIONS):
+                leaves[leaf] += count
+        busy = sum(leaves.values()) / loop_total
+
+        folded = '\n'.join(f"{stack} {count}" for stack, count in stacks.most_common()) + '\n'
+        hot = [(leaf, count / loop_total) for leaf, count in leaves.most_common(5)]
+        logger.info(f"Profile taken: {seconds:.0f}s, {samples} samples, loop busy {busy:.0%}")
+        return Profile(folded, samples, seconds, busy, hot)
+
+
+# Shared instance used by /perfprofile and /debug/profile
+profiler = SamplingProfiler()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+NICE-BOT - QR Engine
+Local QR rendering off the event loop, with an LRU cache of rendered images
+"""
+
+import io
+import os
+import asyncio
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional
+
+import aiohttp
+import qrcode
+from PIL import Image
+
+from services.metrics import http_trace
+
+logger = logging.getLogger(__name__)
+
+# Threads encoding images (PIL releases the GIL while compressing)
+QR_WORKERS = int(os.getenv("QR_WORKERS", "2"))
+
+# Rendered images kept in memory, bounded by count and by total bytes
+QR_CACHE_ENTRIES = 512
+QR_CACHE_BYTES = 16 * 1024 * 1024
+
+DEFAULT_SIZE = 300
+MIN_SIZE = 100
+MAX_SIZE = 1000
+BORDER = 4
+
+# Payloads per /qr album (Telegram media groups hold at most 10 items)
+MAX_BATCH = 10
+
+QR_SERVER_URL = "https://api.qrserver.com/v1/create-qr-code/"
+
+
+class QRSpec(NamedTuple):
+    """Everything that determines the rendered output (and the cache key)"""
+    payload: str
+    size: int = DEFAULT_SIZE
+    fill: str = '000000'
+    back: str = 'ffffff'
+    fmt: str = 'png'
+
+
+def _matrix(payload: str) -> List[List[bool]]:
+    code = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, border=BORDER)
+    code.add_data(payload)
+    code.make(fit=True)
+    return code.get_matrix()
+
+
+def render_png(spec: QRSpec) -> bytes:
+    """Blocking PNG render: whole pixels per module, centred on a spec.size square.
+
+    Codes with more modules than spec.size get one pixel per module (a larger
+    image) rather than dropping modules.
+    """
+    matrix = _matrix(spec.payload)
+    modules = len(matrix)
+    box = max(1, spec.size // modules)
+    # Two-colour palette image: index 0 is the fill colour, index 1 the background
+    palette = list(bytes.fromhex(spec.fill)) + list(bytes.fromhex(spec.back))
+    code = Image.new('P', (modules, modules), 1)
+    code.putpalette(palette)
+    code.putdata([0 if dark else 1 for row in matrix for dark in row])
+    if box > 1:
+        code = code.resize((modules * box, modules * box), Image.NEAREST)
+
+    side = max(spec.size, code.width)
+    image = code
+    if side > code.width:
+        # Extra background widens the quiet zone evenly
+        image = Image.new('P', (side, side), 1)
+        image.putpalette(palette)
+        offset = (side - code.width) // 2
+        image.paste(code, (offset, offset))
+
+    output = io.BytesIO()
+    image.save(output, format='PNG', optimize=True)
+    return output.getvalue()
+
+
+def render_svg(spec: QRSpec) -> bytes:
+    """Blocking SVG render: one path with a unit square per dark module"""
+    matrix = _matrix(spec.payload)
+    modules = len(matrix)
+    path = ''.join(
+        f"M{x},{y}h1v1h-1z"
+        for y, row in enumerate(matrix) for x, dark in enumerate(row) if dark
+    )
+    svg = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{spec.size}" height="{spec.size}" '
+        f'viewBox="0 0 {modules} {modules}" shape-rendering="crispEdges">'
+        f'<rect width="100%" height="100%" fill="#{spec.back}"/>'
+        f'<path fill="#{spec.fill}" d="{path}"/></svg>'
+    )
+    return svg.encode('utf-8')
+
+
+RENDERERS = {'png': render_png, 'svg': render_svg}
+
+
+class QREngine:
+    """Renders QR codes in a thread pool and remembers recent results"""
+
+    def __init__(self, workers: int = QR_WORKERS, max_entries: int = QR_CACHE_ENTRIES,
+                 max_bytes: int = QR_CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='qr')
+        self._cache: "OrderedDict[QRSpec, bytes]" = OrderedDict()
+        self._cache_bytes = 0
+        self._inflight: Dict[QRSpec, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, spec: QRSpec, data: bytes):
+        self._cache[spec] = data
+        self._cache_bytes += len(data)
+        while self._cache and (len(self._cache) > self.max_entries or self._cache_bytes > self.max_bytes):
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= len(evicted)
+
+    async def render(self, spec: QRSpec) -> bytes:
+        """Image bytes for a spec; identical concurrent requests share one render"""
+        data = self._cache.get(spec)
+        if data is not None:
+            self._cache.move_to_end(spec)
+            self.hits += 1
+            return data
+
+        pending = self._inflight.get(spec)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, RENDERERS[spec.fmt], spec)
+        self._inflight[spec] = future
+        try:
+            data = await future
+        finally:
+            del self._inflight[spec]
+        self._remember(spec, data)
+        return data
+
+    async def render_many(self, specs: List[QRSpec]) -> List[bytes]:
+        """Render several payloads in parallel, in order"""
+        return list(await asyncio.gather(*(self.render(spec) for spec in specs)))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def render_remote(spec: QRSpec, session: Optional[aiohttp.ClientSession] = None) -> Optional[bytes]:
+    """Same render through api.qrserver.com (fallback and benchmark baseline)"""
+    params = {
+        "size": f"{spec.size}x{spec.size}",
+        "data": spec.payload,
+        "format": spec.fmt,
+        "bgcolor": spec.back,
+        "color": spec.fill,
+        "qzone": "1",
+    }
+    owned = session is None
+    session = session or aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=10), trace_configs=[http_trace()]
+    )
+    try:
+        async with session.get(QR_SERVER_URL, params=params) as response:
+            if response.status == 200:
+                return await response.read()
+            logger.warning(f"QR Server API returned {response.status}")
+    except Exception as e:
+        logger.warning(f"QR Server API failed: {e}")
+    finally:
+        if owned:
+            await session.close()
+    return None
+
+
+# Shared instance used by /qr
+qr_engine = QREngine()
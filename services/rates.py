@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+NICE-BOT - Exchange Rates
+Rate table refreshed in the background, with the last good snapshot kept on disk
+"""
+
+import os
+import json
+import asyncio
+import logging
+from array import array
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import aiohttp
+
+from services.store import atomic_write_json
+from services.metrics import http_trace
+
+logger = logging.getLogger(__name__)
+
+# Where rates come from: an http(s) URL returning {"rates": {...}} or a local JSON file
+RATES_SOURCE = os.getenv("RATES_SOURCE", "https://open.er-api.com/v6/latest/EUR")
+
+# Seconds between two refreshes
+RATES_REFRESH_INTERVAL = int(os.getenv("RATES_REFRESH_INTERVAL", str(6 * 3600)))
+
+PROJECT_ROOT = Path(__file__).parent.parent
+
+# Last good snapshot, reloaded on startup
+RATES_SNAPSHOT_FILE = PROJECT_ROOT / "data" / "rates.json"
+
+RATES_TIMEOUT = aiohttp.ClientTimeout(total=15)
+
+# Used until the first snapshot exists (rates per 1 EUR)
+SEED_RATES = {
+    'EUR': 1.0, 'USD': 1.09, 'GBP': 0.86, 'JPY': 161.50, 'CNY': 7.85,
+    'CAD': 1.48, 'AUD': 1.66, 'CHF': 0.94, 'INR': 90.50, 'RUB': 100.00,
+    'XOF': 655.957, 'XAF': 655.957, 'MAD': 10.80, 'DZD': 146.50, 'TND': 3.38,
+    'BRL': 5.42, 'MXN': 18.60, 'ZAR': 20.30, 'KRW': 1450.00, 'SGD': 1.45,
+    'HKD': 8.50, 'NOK': 11.70, 'SEK': 11.40, 'DKK': 7.46, 'PLN': 4.35,
+    'THB': 38.50, 'IDR': 17000.00, 'MYR': 5.10, 'PHP': 61.50,
+    'BTC': 0.000016, 'ETH': 0.00045,
+}
+SEED_DATE = "2024-01-01T00:00:00"
+
+
+class RateTable:
+    """Immutable rate snapshot: one float array indexed by currency code.
+
+    Every rate is expressed per unit of the base currency, so any cross rate
+    is two array reads and a division.
+    """
+
+    __slots__ = ('base', 'codes', 'index', 'rates', 'updated_at', 'source')
+
+    def __init__(self, base: str, rates: Dict[str, float], updated_at: str, source: str):
+        self.base = base
+        self.codes: Tuple[str, ...] = tuple(sorted(rates))
+        self.index: Dict[str, int] = {code: i for i, code in enumerate(self.codes)}
+        self.rates = array('d', (float(rates[code]) for code in self.codes))
+        self.updated_at = updated_at
+        self.source = source
+
+    def __contains__(self, code: str) -> bool:
+        return code in self.index
+
+    def rate(self, from_code: str, to_code: str) -> float:
+        """Units of to_code for one from_code"""
+        return self.rates[self.index[to_code]] / self.rates[self.index[from_code]]
+
+    def convert(self, amount: float, from_code: str, to_code: str) -> float:
+        return amount * self.rate(from_code, to_code)
+
+    def as_dict(self) -> Dict[str, float]:
+        return dict(zip(self.codes, self.rates))
+
+    def to_json(self) -> dict:
+        return {'base': self.base, 'updated_at': self.updated_at,
+                'source': self.source, 'rates': self.as_dict()}
+
+    @classmethod
+    def from_json(cls, data: dict) -> "RateTable":
+        return cls(data['base'], data['rates'], data['updated_at'], data.get('source', ''))
+
+
+def _parse_rates(data: dict) -> Tuple[str, Dict[str, float]]:
+    """Base and positive numeric rates from a provider payload"""
+    rates = data.get('rates') or data.get('conversion_rates') or {}
+    base = (data.get('base') or data.get('base_code') or 'EUR').upper()
+    clean = {
+        code.upper(): float(value) for code, value in rates.items()
+        if isinstance(value, (int, float)) and value > 0
+    }
+    clean[base] = 1.0
+    return base, clean
+
+
+class RateEngine:
+    """Holds the current RateTable and keeps it fresh"""
+
+    def __init__(self, source: str = RATES_SOURCE, interval: int = RATES_REFRESH_INTERVAL,
+                 snapshot_file: Path = RATES_SNAPSHOT_FILE):
+        self.source = source
+        self.interval = interval
+        self.snapshot_file = snapshot_file
+        self._table: Optional[RateTable] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def table(self) -> RateTable:
+        if self._table is None:
+            self._table = self._load_snapshot()
+        return self._table
+
+    def _load_snapshot(self) -> RateTable:
+        try:
+            if self.snapshot_file.exists():
+                with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+                    return RateTable.from_json(json.load(f))
+        except Exception as e:
+            logger.error(f"Error loading rate snapshot: {e}")
+        return RateTable('EUR', SEED_RATES, SEED_DATE, 'seed')
+
+    async def _fetch(self) -> dict:
+        if self.source.startswith(('http://', 'https://')):
+            async with aiohttp.ClientSession(timeout=RATES_TIMEOUT, trace_configs=[http_trace()]) as session:
+                async with session.get(self.source) as response:
+                    response.raise_for_status()
+                    return await response.json(content_type=None)
+        # Local stand-in (offline testing, fixed rates), relative to the project root
+        path = Path(self.source)
+        if not path.is_absolute():
+            path = PROJECT_ROOT / path
+        return json.loads(await asyncio.to_thread(path.read_text, encoding='utf-8'))
+
+    async def refresh(self) -> bool:
+        """Fetch new rates; on failure the current table stays in place"""
+        try:
+            base, rates = _parse_rates(await self._fetch())
+        except Exception as e:
+            logger.warning(f"Rate refresh from {self.source} failed: {e}")
+            return False
+        if len(rates) < 2:
+            logger.warning(f"Rate refresh from {self.source} returned no rates")
+            return False
+
+        # Currencies the provider lacks (e.g. crypto) keep their last known value
+        previous = self.table
+        if base in previous:
+            for code, value in previous.as_dict().items():
+                rates.setdefault(code, value / previous.rates[previous.index[base]])
+
+        table = RateTable(base, rates, datetime.now().isoformat(timespec='seconds'), self.source)
+        self._table = table
+        try:
+            await asyncio.to_thread(atomic_write_json, self.snapshot_file, table.to_json())
+        except Exception as e:
+            logger.error(f"Error saving rate snapshot: {e}")
+        logger.info(f"Exchange rates refreshed ({len(table.codes)} currencies)")
+        return True
+
+    def _seconds_until_due(self) -> float:
+        """A snapshot fresher than the interval is reused after a restart"""
+        try:
+            age = (datetime.now() - datetime.fromisoformat(self.table.updated_at)).total_seconds()
+        except ValueError:
+            return 0
+        return max(0.0, self.interval - age) if self.table.source == self.source else 0
+
+    async def _run(self):
+        await asyncio.sleep(self._seconds_until_due())
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Refresh when due, then every interval (call from the running loop)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+# Shared instance used by /devise
+rate_engine = RateEngine()
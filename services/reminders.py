@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+NICE-BOT - Reminder Scheduler
+One-shot, daily, weekly and cron reminders in SQLite, fired by a single timer
+"""
+
+import os
+import time
+import heapq
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Optional, Set, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from telegram.helpers import escape_markdown
+
+from db import get_connection
+from services.metrics import track_queue
+from services.weather_alerts import AlertSender
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "Europe/Paris")
+
+# Reminders due within this many seconds are held in memory; the rest stay in SQLite
+REMINDER_HORIZON = 3600
+
+# Active reminders per user
+MAX_REMINDERS_PER_USER = 25
+
+# Reminder messages sent per second, all chats together
+REMINDER_SEND_RATE = float(os.getenv("REMINDER_SEND_RATE", "20"))
+
+WEEKDAYS = {
+    'lundi': 1, 'mardi': 2, 'mercredi': 3, 'jeudi': 4,
+    'vendredi': 5, 'samedi': 6, 'dimanche': 0,
+}
+
+
+def get_zone(name: Optional[str]) -> ZoneInfo:
+    try:
+        return ZoneInfo(name or DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo(DEFAULT_TIMEZONE)
+
+
+def _field(spec: str, low: int, high: int) -> Set[int]:
+    """Values of one cron field: *, */n, a-b, a-b/n, a,b,c"""
+    values: Set[int] = set()
+    for part in spec.split(','):
+        part, _, step = part.partition('/')
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(x) for x in part.split('-', 1))
+        else:
+            start = end = int(part)
+        if start < low or end > high or start > end:
+            raise ValueError(f"cron field out of range: {spec}")
+        values.update(range(start, end + 1, int(step) if step else 1))
+    return values
+
+
+class CronSpec:
+    """Five-field cron expression (minute hour day month weekday, 0 = Sunday)"""
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError("cron needs 5 fields")
+        self.expression = ' '.join(fields)
+        self.minutes = sorted(_field(fields[0], 0, 59))
+        self.hours = sorted(_field(fields[1], 0, 23))
+        self.days = _field(fields[2], 1, 31)
+        self.months = _field(fields[3], 1, 12)
+        self.weekdays = {d % 7 for d in _field(fields[4], 0, 7)}
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    def _day_matches(self, day) -> bool:
+        if day.month not in self.months:
+            return False
+        in_days = day.day in self.days
+        in_weekdays = day.isoweekday() % 7 in self.weekdays
+        # Standard cron: with both restricted, either one matching is enough
+        if not self.any_day and not self.any_weekday:
+            return in_days or in_weekdays
+        return in_days and in_weekdays
+
+    def next_after(self, moment: datetime) -> datetime:
+        """First matching local time strictly after moment (an aware datetime)"""
+        start = (moment + timedelta(minutes=1)).replace(second=0, microsecond=0, tzinfo=None)
+        day = start.date()
+        for _ in range(366 * 8):
+            if self._day_matches(day):
+                for hour in self.hours:
+                    for minute in self.minutes:
+                        candidate = datetime(day.year, day.month, day.day, hour, minute)
+                        if candidate >= start:
+                            return candidate.replace(tzinfo=moment.tzinfo)
+            day += timedelta(days=1)
+        raise ValueError(f"cron never fires: {self.expression}")
+
+
+class Reminder(NamedTuple):
+    id: int
+    user_id: int
+    chat_id: int
+    message: str
+    next_fire: float
+    recurrence: Optional[str]
+    timezone: str
+
+
+def next_fire(recurrence: str, timezone: str, after: float) -> float:
+    """Epoch of the next occurrence strictly after an epoch, in the reminder's timezone"""
+    zone = get_zone(timezone)
+    return CronSpec(recurrence).next_after(datetime.fromtimestamp(after, zone)).timestamp()
+
+
+class ReminderScheduler:
+    """Every reminder lives in SQLite; only those due within the horizon are in memory.
+
+    A single task sleeps until the earliest due reminder (a heap of
+    (fire time, id)), so a million recurring reminders cost one timer and a
+    window of heap entries, not a million sleeping tasks. A recurring
+    reminder computes its next occurrence only when it fires.
+    """
+
+    def __init__(self, horizon: int = REMINDER_HORIZON):
+        self.horizon = horizon
+        self.sender = AlertSender(REMINDER_SEND_RATE, kind="reminder")
+        self._heap: List[Tuple[float, int]] = []
+        self._loaded_until = 0.0
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    # --------------------------------------------------------------- settings
+
+    def timezone(self, user_id: int) -> str:
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT timezone FROM user_timezones WHERE user_id = ?", (user_id,))
+            row = cursor.fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else DEFAULT_TIMEZONE
+
+    def set_timezone(self, user_id: int, timezone: str):
+        conn = get_connection()
+        try:
+            conn.execute('''
+                INSERT INTO user_timezones (user_id, timezone) VALUES (?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET timezone = excluded.timezone
+            ''', (user_id, timezone))
+            conn.commit()
+        finally:
+            conn.close()
+
+    # -------------------------------------------------------------- reminders
+
+    def add(self, user_id: int, chat_id: int, message: str, fire_at: float,
+            recurrence: Optional[str] = None, timezone: str = DEFAULT_TIMEZONE) -> Optional[int]:
+        """Store a reminder; returns its id, None if the user has too many"""
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM reminders WHERE user_id = ?", (user_id,))
+            if cursor.fetchone()[0] >= MAX_REMINDERS_PER_USER:
+                return None
+            cursor.execute('''
+                INSERT INTO reminders (user_id, chat_id, message, next_fire, recurrence, timezone)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (user_id, chat_id, message, fire_at, recurrence, timezone))
+            conn.commit()
+            reminder_id = cursor.lastrowid
+        finally:
+            conn.close()
+        self._schedule(fire_at, reminder_id)
+        return reminder_id
+
+    def cancel(self, user_id: int, reminder_id: int) -> bool:
+        """Delete one of the user's reminders; a heap entry left behind is skipped when due"""
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM reminders WHERE id = ? AND user_id = ?", (reminder_id, user_id))
+            conn.commit()
+            return cursor.rowcount > 0
+        finally:
+            conn.close()
+
+    def list(self, user_id: int) -> List[Reminder]:
+        """The user's reminders, soonest first (read through the user_id index)"""
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, user_id, chat_id, message, next_fire, recurrence, timezone
+                FROM reminders WHERE user_id = ? ORDER BY next_fire
+            ''', (user_id,))
+            return [Reminder(*row) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+    def _get(self, reminder_id: int) -> Optional[Reminder]:
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, user_id, chat_id, message, next_fire, recurrence, timezone
+                FROM reminders WHERE id = ?
+            ''', (reminder_id,))
+            row = cursor.fetchone()
+        finally:
+            conn.close()
+        return Reminder(*row) if row else None
+
+    def _reschedule(self, reminder: Reminder, fire_at: Optional[float]):
+        conn = get_connection()
+        try:
+            if fire_at is None:
+                conn.execute("DELETE FROM reminders WHERE id = ?", (reminder.id,))
+            else:
+                conn.execute("UPDATE reminders SET next_fire = ? WHERE id = ?", (fire_at, reminder.id))
+            conn.commit()
+        finally:
+            conn.close()
+
+    # ---------------------------------------------------------------- timer
+
+    def _schedule(self, fire_at: float, reminder_id: int):
+        # Later reminders are picked up when the window reaches them
+        if fire_at <= self._loaded_until:
+            heapq.heappush(self._heap, (fire_at, reminder_id))
+            if self._wake is not None:
+                self._wake.set()
+
+    def _load_window(self, since: float, until: float) -> List[Tuple[float, int]]:
+        """(next_fire, id) of the reminders due in (since, until]"""
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT next_fire, id FROM reminders WHERE next_fire > ? AND next_fire <= ?
+            ''', (since, until))
+            return [tuple(row) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+    def _advance(self, reminder_id: int, scheduled: float) -> Optional[Tuple[Reminder, Optional[float]]]:
+        """Due reminder and its next occurrence (stored already); None if it no longer applies"""
+        reminder = self._get(reminder_id)
+        # Cancelled, or rescheduled since this heap entry was pushed
+        if reminder is None or reminder.next_fire != scheduled:
+            return None
+        following = None
+        if reminder.recurrence:
+            # Occurrences missed while the bot was down are not replayed
+            following = next_fire(reminder.recurrence, reminder.timezone, max(scheduled, time.time()))
+        self._reschedule(reminder, following)
+        return reminder, following
+
+    def _send(self, reminder: Reminder):
+        zone = get_zone(reminder.timezone)
+        when = datetime.fromtimestamp(reminder.next_fire, zone).strftime('%d/%m %H:%M')
+        repeat = "\n🔁 **Récurrent**" if reminder.recurrence else ""
+        self.sender.send(reminder.chat_id, f"""
+🔔 **RAPPEL !**
+
+📝 **Message :** {escape_markdown(reminder.message)}
+🕐 **Programmé à :** {when}{repeat}
+
+✅ **C'est maintenant !**
+        """)
+
+    async def _run(self):
+        while True:
+            now = time.time()
+            if now >= self._loaded_until - 1:
+                # Move the bound before querying: an add() committed meanwhile is then
+                # pushed by _schedule, and a duplicate entry is skipped by _advance
+                since, self._loaded_until = self._loaded_until, now + self.horizon
+                for entry in await asyncio.to_thread(self._load_window, since, self._loaded_until):
+                    heapq.heappush(self._heap, entry)
+
+            while self._heap and self._heap[0][0] <= now:
+                scheduled, reminder_id = heapq.heappop(self._heap)
+                try:
+                    due = await asyncio.to_thread(self._advance, reminder_id, scheduled)
+                except Exception as e:
+                    logger.error(f"Error firing reminder {reminder_id}: {e}")
+                    continue
+                if due is not None:
+                    reminder, following = due
+                    self._send(reminder)
+                    if following is not None:
+                        self._schedule(following, reminder.id)
+
+            wake_at = min(self._heap[0][0], self._loaded_until) if self._heap else self._loaded_until
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(0.0, wake_at - time.time()))
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self, bot):
+        """Start the timer and sender (call from the running loop, once the bot is up)"""
+        if self._task is None:
+            self.sender.start(bot)
+            self._wake = asyncio.Event()
+            # Overdue reminders from before a restart fire right away
+            self._loaded_until = 0.0
+            self._heap = []
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.sender.stop()
+
+
+# Shared instance used by /rappel
+reminder_scheduler = ReminderScheduler()
+track_queue("reminder_messages", lambda: len(reminder_scheduler.sender))
+track_queue("reminders_in_window", lambda: len(reminder_scheduler._heap))
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+NICE-BOT - Shared Settings Store
+In-memory keyed documents with debounced, atomic persistence
+"""
+
+import os
+import copy
+import json
+import functools
+import asyncio
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+from db import get_connection
+
+logger = logging.getLogger(__name__)
+
+# "json" keeps one file per store, "sqlite" moves stores into the kv_store table
+STORE_BACKEND = os.getenv("SETTINGS_BACKEND", "json").lower()
+
+# Delay before dirty changes are written (several changes share one flush)
+FLUSH_DELAY = float(os.getenv("SETTINGS_FLUSH_DELAY", "1.0"))
+
+# All stores created in this process, flushed together on shutdown
+_stores: Dict[str, "JsonStore"] = {}
+
+
+def atomic_write_json(path: Path, data: Any):
+    """Atomic write: temp file + fsync + rename"""
+    path.parent.mkdir(exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{path.name}.", dir=path.parent)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class JsonStore:
+    """Keyed document made of sections (e.g. 'groups') mapping keys to JSON values.
+
+    The in-memory copy is authoritative; the file (or SQLite table) is only
+    written by coalesced flushes, so concurrent handlers never overwrite each
+    other's changes and a crash mid-write leaves the previous file intact.
+    """
+
+    def __init__(self, name: str, path: Path, sections: Tuple[str, ...], flush_delay: float = FLUSH_DELAY):
+        self.name = name
+        self.path = Path(path)
+        self.sections = sections
+        self.flush_delay = flush_delay
+        self._data: Optional[Dict[str, Dict[str, Any]]] = None
+        self._dirty: Set[Tuple[str, str]] = set()
+        self._lock = threading.RLock()
+        # Held from a flush's snapshot until its write is on disk, so writes land in order
+        self._write_lock = threading.Lock()
+        self._flush_handle = None
+        self._flush_task: Optional[asyncio.Task] = None
+        _stores[name] = self
+
+    # ------------------------------------------------------------------ reads
+
+    def _ensure_loaded(self) -> Dict[str, Dict[str, Any]]:
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    data = self._load_sqlite() if STORE_BACKEND == "sqlite" else self._load_file()
+                    for section in self.sections:
+                        data.setdefault(section, {})
+                    self._data = data
+        return self._data
+
+    def get(self, section: str, key: str, default: Any = None) -> Any:
+        """Get a copy of one value"""
+        value = self._ensure_loaded().get(section, {}).get(str(key), default)
+        return copy.deepcopy(value)
+
+    def contains(self, section: str, key: str) -> bool:
+        """Check if a key exists in a section"""
+        return str(key) in self._ensure_loaded().get(section, {})
+
+    def items(self, section: str) -> Dict[str, Any]:
+        """Get a copy of a whole section"""
+        return copy.deepcopy(self._ensure_loaded().get(section, {}))
+
+    def count(self, section: str) -> int:
+        """Number of keys in a section"""
+        return len(self._ensure_loaded().get(section, {}))
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Get a copy of the full document"""
+        return copy.deepcopy(self._ensure_loaded())
+
+    # ----------------------------------------------------------------- writes
+
+    def set(self, section: str, key: str, value: Any):
+        """Set one value and schedule a flush"""
+        data = self._ensure_loaded()
+        with self._lock:
+            data.setdefault(section, {})[str(key)] = copy.deepcopy(value)
+            self._dirty.add((section, str(key)))
+        self._schedule_flush()
+
+    def update(self, section: str, key: str, **fields):
+        """Merge fields into a dict value and schedule a flush"""
+        data = self._ensure_loaded()
+        with self._lock:
+            entry = data.setdefault(section, {}).setdefault(str(key), {})
+            entry.update(copy.deepcopy(fields))
+            self._dirty.add((section, str(key)))
+        self._schedule_flush()
+
+    def delete(self, section: str, key: str) -> Any:
+        """Remove a key, returning its previous value (or None)"""
+        data = self._ensure_loaded()
+        with self._lock:
+            value = data.get(section, {}).pop(str(key), None)
+            if value is not None:
+                self._dirty.add((section, str(key)))
+        if value is not None:
+            self._schedule_flush()
+        return value
+
+    # -------------------------------------------------------------- persistence
+
+    def _schedule_flush(self):
+        """Coalesce writes: one flush per store per flush_delay window"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (scripts, tests): write through
+            self.flush()
+            return
+
+        with self._lock:
+            if self._flush_handle is None:
+                self._flush_handle = loop.call_later(self.flush_delay, self._flush_soon)
+
+    def _take(self) -> Optional[Tuple[Set[Tuple[str, str]], Callable[[], None]]]:
+        """Dirty keys and a blocking write of their current state, or None if clean"""
+        with self._lock:
+            self._flush_handle = None
+            if not self._dirty or self._data is None:
+                return None
+            dirty = self._dirty
+            self._dirty = set()
+            if STORE_BACKEND == "sqlite":
+                return dirty, functools.partial(self._write_sqlite, *self._rows(dirty))
+            return dirty, functools.partial(atomic_write_json, self.path, copy.deepcopy(self._data))
+
+    def _failed(self, dirty: Set[Tuple[str, str]], error: Exception):
+        # Keep the changes and retry them after another flush_delay
+        with self._lock:
+            self._dirty |= dirty
+        logger.error(f"Error saving {self.name} settings: {error}")
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # Write-through callers retry on their next change
+            return
+        self._schedule_flush()
+
+    def _flush_soon(self):
+        """Debounced flush: snapshot on the loop, write in a worker thread"""
+        if not self._write_lock.acquire(blocking=False):
+            # The previous write is still running: flush after it
+            with self._lock:
+                self._flush_handle = None
+            self._schedule_flush()
+            return
+        pending = self._take()
+        if pending is None:
+            self._write_lock.release()
+            return
+        self._flush_task = asyncio.get_running_loop().create_task(self._write_async(*pending))
+
+    async def _write_async(self, dirty: Set[Tuple[str, str]], write: Callable[[], None]):
+        def run():
+            try:
+                write()
+            finally:
+                self._write_lock.release()
+        try:
+            await asyncio.to_thread(run)
+        except Exception as e:
+            self._failed(dirty, e)
+
+    def flush(self):
+        """Write pending changes now, after any write in progress (shutdown, scripts)"""
+        with self._write_lock:
+            pending = self._take()
+            if pending is None:
+                return
+            dirty, write = pending
+            try:
+                write()
+            except Exception as e:
+                self._failed(dirty, e)
+
+    def _load_file(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            if self.path.exists():
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading {self.name} settings: {e}")
+        return {}
+
+    def _load_sqlite(self) -> Dict[str, Dict[str, Any]]:
+        data: Dict[str, Dict[str, Any]] = {}
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT section, key, value FROM kv_store WHERE store = ?", (self.name,)
+            )
+            rows = cursor.fetchall()
+            if not rows and self.path.exists():
+                # First start on SQLite: migrate the legacy JSON file
+                data = self._load_file()
+                cursor.executemany(
+                    "INSERT OR REPLACE INTO kv_store (store, section, key, value) VALUES (?, ?, ?, ?)",
+                    [
+                        (self.name, section, key, json.dumps(value, ensure_ascii=False))
+                        for section, entries in data.items()
+                        for key, value in entries.items()
+                    ]
+                )
+                conn.commit()
+                logger.info(f"Migrated {self.path.name} into SQLite store '{self.name}'")
+                return data
+            for section, key, value in rows:
+                data.setdefault(section, {})[key] = json.loads(value)
+        finally:
+            conn.close()
+        return data
+
+    def _rows(self, dirty: Set[Tuple[str, str]]) -> Tuple[list, list]:
+        """kv_store upserts and deletes for the keys that changed since the last flush"""
+        upserts = []
+        deletes = []
+        for section, key in dirty:
+            entries = self._data.get(section, {})
+            if key in entries:
+                upserts.append((self.name, section, key, json.dumps(entries[key], ensure_ascii=False)))
+            else:
+                deletes.append((self.name, section, key))
+        return upserts, deletes
+
+    def _write_sqlite(self, upserts: list, deletes: list):
+        conn = get_connection()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO kv_store (store, section, key, value) VALUES (?, ?, ?, ?)",
+                    upserts
+                )
+                conn.executemany(
+                    "DELETE FROM kv_store WHERE store = ? AND section = ? AND key = ?",
+                    deletes
+                )
+        finally:
+            conn.close()
+
+
+def flush_all_stores():
+    """Flush every store immediately (called on shutdown)"""
+    for store in list(_stores.values()):
+        if store._flush_handle is not None:
+            store._flush_handle.cancel()
+        store.flush()
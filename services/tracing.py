@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+NICE-BOT - Request Tracing
+Trace ids carried by contextvars from the webhook to handlers, SQLite and upstream APIs
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import itertools
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Deque, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Completed traces kept in memory for /logs
+TRACE_BUFFER = int(os.getenv("TRACE_BUFFER", "500"))
+
+# Share of updates traced (1 = all of them)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1"))
+
+# Append every completed trace to this JSON-lines file when set
+TRACE_EXPORT_FILE = os.getenv("TRACE_EXPORT_FILE", "")
+TRACE_EXPORT_INTERVAL = 5
+
+# (span id, parent span id, name, start offset in the trace, duration, error class or None)
+SpanRecord = Tuple[int, int, str, float, float, Optional[str]]
+
+_span_ids = itertools.count(1)
+
+
+class Trace:
+    __slots__ = ('id', 'name', 'attrs', 'started_at', 'start', 'duration', 'error', 'spans', 'open')
+
+    def __init__(self, name: str, attrs: dict):
+        self.id = f"{random.getrandbits(64):016x}"
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.error: Optional[str] = None
+        self.spans: List[SpanRecord] = []
+        # The root span plus work handed off to other tasks; exported when it drops to 0
+        self.open = 1
+
+    @property
+    def label(self) -> str:
+        """The command handled, else the root name"""
+        return next((span[2] for span in self.spans if span[2].startswith('/')), self.name)
+
+    def to_dict(self) -> dict:
+        return {
+            'trace_id': self.id,
+            'name': self.name,
+            'label': self.label,
+            'attrs': self.attrs,
+            'started_at': datetime.fromtimestamp(self.started_at).isoformat(timespec='milliseconds'),
+            'duration_ms': round(self.duration * 1000, 3),
+            'error': self.error,
+            'spans': [
+                {'id': span_id, 'parent': parent, 'name': name, 'offset_ms': round(offset * 1000, 3),
+                 'duration_ms': round(duration * 1000, 3), 'error': error}
+                for span_id, parent, name, offset, duration, error in list(self.spans)
+            ],
+        }
+
+
+class Span:
+    """An open span: the parent of whatever runs inside it"""
+    __slots__ = ('trace', 'id')
+
+    def __init__(self, trace: Trace, span_id: int):
+        self.trace = trace
+        self.id = span_id
+
+
+_current: ContextVar[Optional[Span]] = ContextVar('nicebot_span', default=None)
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current.get()
+    return span.trace.id if span is not None else None
+
+
+class Tracer:
+    """Records spans into per-trace lists; finished traces go to a ring buffer.
+
+    Outside a trace, span() and record() cost one ContextVar lookup. Inside,
+    a span is one tuple appended to its trace (list.append is safe from the
+    to_thread workers that inherit the context), so tracing every update
+    stays in the microseconds. Work queued for other tasks (downloads) keeps
+    the trace open through handoff() and resume().
+    """
+
+    def __init__(self, size: int = TRACE_BUFFER, sample_rate: float = TRACE_SAMPLE_RATE,
+                 export_file: str = TRACE_EXPORT_FILE):
+        self.sample_rate = sample_rate
+        self.export_file = export_file
+        self.recent: Deque[Trace] = deque(maxlen=size)
+        self._export: List[Trace] = []
+        self._task: Optional[asyncio.Task] = None
+
+    @contextmanager
+    def trace(self, name: str, **attrs):
+        """Root span of a request; yields the Trace, or None when not sampled"""
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            yield None
+            return
+        trace = Trace(name, attrs)
+        token = _current.set(Span(trace, 0))
+        try:
+            yield trace
+        except Exception as e:
+            trace.error = type(e).__name__
+            raise
+        finally:
+            _current.reset(token)
+            self.recent.append(trace)
+            self._close(trace)
+
+    def _close(self, trace: Trace):
+        # A trace lasts until its root or its last handed-off work ends, whichever is later
+        trace.duration = max(trace.duration, time.perf_counter() - trace.start)
+        trace.open -= 1
+        if not trace.open and self.export_file:
+            self._export.append(trace)
+
+    @contextmanager
+    def span(self, name: str, expected: Tuple[type, ...] = ()):
+        """Nested span around a block, within the current trace if there is one.
+
+        Exceptions in expected (flow control) are not recorded as errors.
+        """
+        parent = _current.get()
+        if parent is None:
+            yield
+            return
+        span = Span(parent.trace, next(_span_ids))
+        token = _current.set(span)
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except expected:
+            raise
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            _current.reset(token)
+            parent.trace.spans.append(
+                (span.id, parent.id, name, start - parent.trace.start, time.perf_counter() - start, error)
+            )
+
+    def handoff(self) -> Optional[Span]:
+        """Current span, for work that carries on the request in another task (see resume)"""
+        parent = _current.get()
+        if parent is not None:
+            parent.trace.open += 1
+        return parent
+
+    @contextmanager
+    def resume(self, parent: Optional[Span], name: str):
+        """Run a block as a child span of a handoff(), e.g. in a long-lived worker task"""
+        if parent is None:
+            yield
+            return
+        token = _current.set(parent)
+        try:
+            with self.span(name):
+                yield
+        finally:
+            _current.reset(token)
+            self._close(parent.trace)
+
+    def record(self, name: str, start: float, duration: float, error: Optional[str] = None):
+        """Leaf span timed by the caller (start from time.perf_counter())"""
+        parent = _current.get()
+        if parent is not None:
+            trace = parent.trace
+            trace.spans.append((next(_span_ids), parent.id, name, start - trace.start, duration, error))
+
+    def slowest(self, count: int = 5) -> List[Trace]:
+        return sorted(list(self.recent), key=lambda trace: trace.duration, reverse=True)[:count]
+
+    # -------------------------------------------------------------- exporter
+
+    def _write(self, traces: List[Trace]):
+        with open(self.export_file, 'a', encoding='utf-8') as f:
+            for trace in traces:
+                f.write(json.dumps(trace.to_dict(), ensure_ascii=False) + '\n')
+
+    async def flush(self):
+        traces, self._export = self._export, []
+        if traces:
+            try:
+                await asyncio.to_thread(self._write, traces)
+            except Exception as e:
+                logger.error(f"Error exporting traces: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(TRACE_EXPORT_INTERVAL)
+            await self.flush()
+
+    def start(self):
+        """Start the JSON-lines exporter if TRACE_EXPORT_FILE is set"""
+        if self.export_file and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+
+# Shared instance used by the webhook, handlers, SQLite and HTTP hooks
+tracer = Tracer()
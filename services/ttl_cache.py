@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+NICE-BOT - TTL Cache
+Small in-memory cache with per-entry expiry and an LRU size bound
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+from services.metrics import track_cache
+
+
+class TTLCache:
+    """Maps keys to values for ttl seconds, keeping at most max_entries.
+
+    A named cache reports its hit ratio on /metrics.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 1024, name: Optional[str] = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        if name:
+            track_cache(name, self)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Value for a key, or default if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store a value; ttl overrides the cache default for this entry"""
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return entry[1] if entry is not None else default
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        # A membership probe is not a lookup, so it leaves hits and misses alone
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry is not None and entry[0] >= time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
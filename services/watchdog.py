@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+NICE-BOT - Loop Watchdog
+Event-loop lag probe, blocked-loop stack capture and slow-handler reports
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from contextlib import contextmanager
+from types import FrameType
+from typing import Dict, List, Optional, Set, Tuple
+
+from services.metrics import LOOP_BLOCKS, LOOP_LAG_SECONDS, SLOW_HANDLERS, metrics
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two heartbeats of the loop (each one measures its lag)
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))
+
+# A heartbeat this late means something is running on the loop without yielding
+LOOP_BLOCK_SECONDS = float(os.getenv("LOOP_BLOCK_SECONDS", "0.3"))
+
+# Handlers still running after this long are reported with the line they await
+SLOW_HANDLER_SECONDS = float(os.getenv("SLOW_HANDLER_SECONDS", "5"))
+
+# Frames kept from a captured stack
+STACK_DEPTH = 12
+
+
+def awaited_frames(task: asyncio.Task) -> List[FrameType]:
+    """Frames of a suspended task, outermost first, following the chain of awaited coroutines.
+
+    Task.get_stack() only returns the outermost frame of a suspended task.
+    """
+    frames = []
+    coro = task.get_coro()
+    while coro is not None:
+        frame = getattr(coro, 'cr_frame', None) or getattr(coro, 'gi_frame', None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, 'cr_await', None) or getattr(coro, 'gi_yieldfrom', None)
+    return frames
+
+
+def awaited_stack(task: asyncio.Task) -> str:
+    """Where a suspended task is waiting, formatted like a traceback"""
+    return ''.join(
+        f'  File "{frame.f_code.co_filename}", line {frame.f_lineno}, in {frame.f_code.co_name}\n'
+        for frame in awaited_frames(task)[-STACK_DEPTH:]
+    )
+
+
+class LoopWatchdog:
+    """Finds what holds up the event loop, without attaching a profiler.
+
+    A heartbeat task on the loop records its own lag. A daemon thread checks
+    that heartbeat; when it stops beating for LOOP_BLOCK_SECONDS, the loop
+    thread is stuck in synchronous code (SQLite, FPDF, PIL...) and the thread
+    captures its stack right then, together with the handler that was running.
+    Handlers are registered while they run, so the heartbeat also reports
+    those that take too long while awaiting.
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, block_seconds: float = LOOP_BLOCK_SECONDS,
+                 slow_seconds: float = SLOW_HANDLER_SECONDS):
+        self.interval = interval
+        self.block_seconds = block_seconds
+        self.slow_seconds = slow_seconds
+        self.last_lag = 0.0
+        self._beat = time.monotonic()
+        self._running: Dict[asyncio.Task, Tuple[str, float]] = {}
+        self._reported: Set[asyncio.Task] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    @contextmanager
+    def track(self, label: str):
+        """Register the current task as running handler label"""
+        task = asyncio.current_task()
+        if task is None:
+            yield
+            return
+        self._running[task] = (label, time.monotonic())
+        try:
+            yield
+        finally:
+            self._running.pop(task, None)
+            self._reported.discard(task)
+
+    def _label_of(self, task: Optional[asyncio.Task]) -> str:
+        entry = self._running.get(task) if task is not None else None
+        return entry[0] if entry else 'event loop'
+
+    # -------------------------------------------------------------- heartbeat
+
+    def _check_handlers(self):
+        now = time.monotonic()
+        for task, (label, start) in list(self._running.items()):
+            if now - start < self.slow_seconds or task in self._reported:
+                continue
+            self._reported.add(task)
+            SLOW_HANDLERS.inc(label)
+            logger.warning(
+                f"Slow handler {label}: running for {now - start:.1f}s, awaiting:\n{awaited_stack(task)}"
+            )
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self._beat = time.monotonic()
+            self.last_lag = max(0.0, loop.time() - expected)
+            LOOP_LAG_SECONDS.observe(self.last_lag)
+            if self._running:
+                self._check_handlers()
+
+    # ---------------------------------------------------------------- sampler
+
+    def _capture_block(self, stalled: float):
+        frame = sys._current_frames().get(self._loop_thread)
+        stack = ''.join(traceback.format_stack(frame, limit=STACK_DEPTH)) if frame else ''
+        label = self._label_of(asyncio.current_task(self._loop))
+        LOOP_BLOCKS.inc(label)
+        logger.warning(f"Event loop blocked for {stalled:.2f}s+ in {label}:\n{stack}")
+
+    def _sample(self):
+        reported_beat = None
+        while not self._stopping.wait(self.interval / 2):
+            beat = self._beat
+            stalled = time.monotonic() - beat - self.interval
+            # One capture per stall: the stack is the one running past the threshold
+            if stalled >= self.block_seconds and beat != reported_beat:
+                reported_beat = beat
+                try:
+                    self._capture_block(stalled)
+                except Exception as e:
+                    logger.error(f"Error capturing blocked loop stack: {e}")
+
+    def start(self):
+        """Start the heartbeat and the sampling thread (call from the running loop)"""
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._loop_thread = threading.get_ident()
+            self._beat = time.monotonic()
+            self._stopping.clear()
+            self._task = asyncio.create_task(self._run())
+            self._thread = threading.Thread(target=self._sample, name="loop-watchdog", daemon=True)
+            self._thread.start()
+
+    async def stop(self):
+        if self._task is not None:
+            self._stopping.set()
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            self._thread.join(timeout=1)
+            self._thread = None
+
+
+# Shared instance started by main.lifespan
+loop_watchdog = LoopWatchdog()
+metrics.callback("nicebot_event_loop_lag_last_seconds", "Lag measured by the latest heartbeat",
+                 lambda: round(loop_watchdog.last_lag, 6))
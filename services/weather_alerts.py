@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+NICE-BOT - Weather Alerts
+Subscriptions in SQLite, one poll per unique place, threshold rules matched by bisection
+"""
+
+import os
+import re
+import time
+import asyncio
+import logging
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import aiohttp
+from telegram.error import Forbidden, RetryAfter
+
+from db import get_connection
+from services.metrics import http_trace, track_queue
+from services.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two polls of every subscribed place
+WEATHER_ALERT_INTERVAL = int(os.getenv("WEATHER_ALERT_INTERVAL", "900"))
+
+# A rule that fired stays quiet for this long in the same chat and place
+WEATHER_ALERT_COOLDOWN = int(os.getenv("WEATHER_ALERT_COOLDOWN", str(6 * 3600)))
+
+# Alert messages sent per second, all chats together (Telegram allows ~30)
+WEATHER_SEND_RATE = float(os.getenv("WEATHER_SEND_RATE", "10"))
+
+# Places subscribed per chat
+MAX_PLACES_PER_CHAT = 5
+
+# Places per Open-Meteo request (it accepts comma-separated coordinates)
+POLL_BATCH = 50
+
+GEOCODING_URL = "https://geocoding-api.open-meteo.com/v1/search"
+FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+WEATHER_TIMEOUT = aiohttp.ClientTimeout(total=15)
+
+SNOW_CODES = {71, 73, 75, 77, 85, 86}
+STORM_CODES = {95, 96, 99}
+
+
+class Rule(NamedTuple):
+    metric: str
+    above: bool       # fires when the value is >= threshold (else <=)
+    default: float
+    label: str
+    unit: str
+
+
+# Rule name -> what it watches; '>' rules fire at or above the threshold
+RULES: Dict[str, Rule] = {
+    'temp>': Rule('temperature', True, 35, "🌡️ Forte chaleur", "°C"),
+    'temp<': Rule('temperature', False, -5, "🥶 Grand froid", "°C"),
+    'vent>': Rule('wind', True, 60, "💨 Vent fort", "km/h"),
+    'pluie>': Rule('precipitation', True, 5, "🌧️ Pluie intense", "mm"),
+    'neige': Rule('snow', True, 1, "❄️ Neige", ""),
+    'orage': Rule('storm', True, 1, "⛈️ Orage", ""),
+}
+
+RULE_PATTERN = re.compile(r'^(temp|vent|pluie)([<>])(-?\d+(?:[.,]\d+)?)$')
+
+
+class Place(NamedTuple):
+    key: str
+    name: str
+    latitude: float
+    longitude: float
+
+
+class Alert(NamedTuple):
+    subscription_id: int
+    chat_id: int
+    place: str
+    rule: str
+    value: float
+
+
+def parse_rules(tokens: Iterable[str]) -> Optional[Dict[str, float]]:
+    """{'vent>': 50.0, 'orage': 1.0} from ['vent>50', 'orage']; None if a token is invalid"""
+    rules = {}
+    for token in tokens:
+        token = token.lower()
+        match = RULE_PATTERN.match(token)
+        # Only the directions defined in RULES ('vent<10' is not a rule)
+        if match and match.group(1) + match.group(2) in RULES:
+            rules[match.group(1) + match.group(2)] = float(match.group(3).replace(',', '.'))
+        elif token in RULES and RULES[token].metric in ('snow', 'storm'):
+            rules[token] = 1.0
+        else:
+            return None
+    return rules
+
+
+def metrics_of(current: dict) -> Dict[str, float]:
+    """Rule metrics from an Open-Meteo 'current' block"""
+    code = int(current.get('weather_code') or 0)
+    return {
+        'temperature': float(current.get('temperature_2m') or 0),
+        'wind': float(current.get('wind_speed_10m') or 0),
+        'precipitation': float(current.get('precipitation') or 0),
+        'snow': 1.0 if code in SNOW_CODES else 0.0,
+        'storm': 1.0 if code in STORM_CODES else 0.0,
+    }
+
+
+class PlaceGroup:
+    """Every subscription of one place, as sorted threshold columns per rule.
+
+    For a rule, thresholds are kept sorted with the subscription ids in a
+    parallel array, so the subscribers a reading triggers are one bisection
+    away: a prefix for '>' rules, a suffix for '<' rules. Evaluating a place
+    costs O(rules * log n) plus the alerts produced, whatever its audience.
+    """
+
+    __slots__ = ('place', 'columns')
+
+    def __init__(self, place: Place, rows: List[Tuple[int, str, float]]):
+        self.place = place
+        self.columns: Dict[str, Tuple[array, array]] = {}
+        by_rule: Dict[str, List[Tuple[float, int]]] = {}
+        for subscription_id, rule, threshold in rows:
+            by_rule.setdefault(rule, []).append((threshold, subscription_id))
+        for rule, pairs in by_rule.items():
+            pairs.sort()
+            self.columns[rule] = (array('d', (t for t, _ in pairs)), array('q', (i for _, i in pairs)))
+
+    def triggered(self, metrics: Dict[str, float]) -> List[Tuple[int, str, float]]:
+        """(subscription id, rule, value) for every subscriber the reading triggers"""
+        fired = []
+        for rule, (thresholds, ids) in self.columns.items():
+            spec = RULES[rule]
+            value = metrics[spec.metric]
+            if spec.above:
+                selected = ids[:bisect_right(thresholds, value)]
+            else:
+                selected = ids[bisect_left(thresholds, value):]
+            fired.extend((subscription_id, rule, value) for subscription_id in selected)
+        return fired
+
+
+class AlertSender:
+    """Single queue drained at WEATHER_SEND_RATE messages per second"""
+
+    def __init__(self, rate: float = WEATHER_SEND_RATE, kind: str = "weather alert"):
+        self.interval = 1.0 / rate
+        self.kind = kind
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._bot = None
+        self.on_blocked = None
+
+    def __len__(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def send(self, chat_id: int, text: str):
+        if self._queue is not None:
+            self._queue.put_nowait((chat_id, text))
+
+    async def _run(self):
+        while True:
+            chat_id, text = await self._queue.get()
+            for _ in range(3):
+                try:
+                    await self._bot.send_message(chat_id=chat_id, text=text, parse_mode='Markdown')
+                    break
+                except RetryAfter as e:
+                    delay = e.retry_after
+                    await asyncio.sleep(delay.total_seconds() if hasattr(delay, 'total_seconds') else delay)
+                except Forbidden:
+                    # The bot was blocked or removed: stop alerting that chat
+                    if self.on_blocked:
+                        self.on_blocked(chat_id)
+                    break
+                except Exception as e:
+                    logger.error(f"Error sending {self.kind} to {chat_id}: {e}")
+                    break
+            await asyncio.sleep(self.interval)
+
+    def start(self, bot):
+        if self._task is None:
+            self._bot = bot
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            self._queue = None
+
+
+class WeatherAlerts:
+    """Subscription store, grouped poller and rule evaluation"""
+
+    def __init__(self, interval: int = WEATHER_ALERT_INTERVAL, cooldown: int = WEATHER_ALERT_COOLDOWN):
+        self.interval = interval
+        self.cooldown = cooldown
+        self.sender = AlertSender()
+        self.sender.on_blocked = self.unsubscribe
+        self._groups: Optional[Dict[str, PlaceGroup]] = None
+        self._chats: Dict[int, int] = {}
+        self._last_alert: Dict[int, float] = {}
+        self._places = TTLCache(7 * 86400, 1024, name="weather_places")
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=WEATHER_TIMEOUT, trace_configs=[http_trace()])
+        return self._session
+
+    # ---------------------------------------------------------- subscriptions
+
+    async def geocode(self, city: str) -> Optional[Place]:
+        """First Open-Meteo match for a city name (cached)"""
+        key = ' '.join(city.lower().split())
+        place = self._places.get(key)
+        if place is not None:
+            return place
+        params = {'name': city, 'count': 1, 'language': 'fr'}
+        async with self.session().get(GEOCODING_URL, params=params) as response:
+            response.raise_for_status()
+            data = await response.json(content_type=None)
+        if not data.get('results'):
+            return None
+        result = data['results'][0]
+        lat, lon = round(result['latitude'], 2), round(result['longitude'], 2)
+        name = ', '.join(filter(None, (result.get('name'), result.get('country'))))
+        # Coordinates, not spelling, identify a place: "Paris" and "paris, fr" share a poll
+        place = Place(f"{lat:.2f},{lon:.2f}", name, lat, lon)
+        self._places.set(key, place)
+        return place
+
+    def subscribe(self, user_id: int, chat_id: int, place: Place, rules: Dict[str, float]) -> bool:
+        """Add or update rules for a place; False if the chat already watches too many places"""
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT COUNT(DISTINCT place_key), SUM(place_key = ?)
+                FROM weather_subscriptions WHERE chat_id = ?
+            ''', (place.key, chat_id))
+            places, existing = cursor.fetchone()
+            if not existing and (places or 0) >= MAX_PLACES_PER_CHAT:
+                return False
+            cursor.executemany('''
+                INSERT INTO weather_subscriptions
+                    (user_id, chat_id, place_key, place_name, latitude, longitude, rule, threshold)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (chat_id, place_key, rule) DO UPDATE SET threshold = excluded.threshold
+            ''', [(user_id, chat_id, place.key, place.name, place.latitude, place.longitude, rule, threshold)
+                  for rule, threshold in rules.items()])
+            conn.commit()
+        finally:
+            conn.close()
+        self._groups = None
+        return True
+
+    def unsubscribe(self, chat_id: int, place_name: Optional[str] = None) -> int:
+        """Remove a chat's subscriptions (all, or those of one place); returns rows removed.
+
+        A place matches by its full name ("Paris, France") or its city ("paris"), case-insensitively.
+        """
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            if place_name:
+                name = ' '.join(place_name.lower().split())
+                city = name.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                cursor.execute('''
+                    DELETE FROM weather_subscriptions
+                    WHERE chat_id = ? AND (lower(place_name) = ? OR lower(place_name) LIKE ? ESCAPE '\\')
+                ''', (chat_id, name, city + ', %'))
+            else:
+                cursor.execute("DELETE FROM weather_subscriptions WHERE chat_id = ?", (chat_id,))
+            conn.commit()
+            removed = cursor.rowcount
+        finally:
+            conn.close()
+        self._groups = None
+        return removed
+
+    def subscriptions(self, chat_id: int) -> Dict[str, List[Tuple[str, float]]]:
+        """Place name -> [(rule, threshold)] for a chat"""
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT place_name, rule, threshold FROM weather_subscriptions
+                WHERE chat_id = ? ORDER BY place_name, rule
+            ''', (chat_id,))
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+        places: Dict[str, List[Tuple[str, float]]] = {}
+        for name, rule, threshold in rows:
+            places.setdefault(name, []).append((rule, threshold))
+        return places
+
+    def groups(self) -> Dict[str, PlaceGroup]:
+        """Subscriptions grouped by place, rebuilt after any change"""
+        if self._groups is None:
+            conn = get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT id, chat_id, place_key, place_name, latitude, longitude, rule, threshold,
+                           last_alert_at
+                    FROM weather_subscriptions
+                ''')
+                rows = cursor.fetchall()
+            finally:
+                conn.close()
+
+            places: Dict[str, Place] = {}
+            by_place: Dict[str, List[Tuple[int, str, float]]] = {}
+            self._chats = {}
+            for sub_id, chat_id, key, name, lat, lon, rule, threshold, last_alert in rows:
+                if rule not in RULES:
+                    continue
+                places.setdefault(key, Place(key, name, lat, lon))
+                by_place.setdefault(key, []).append((sub_id, rule, threshold))
+                self._chats[sub_id] = chat_id
+                if last_alert and sub_id not in self._last_alert:
+                    self._last_alert[sub_id] = last_alert
+            self._groups = {key: PlaceGroup(places[key], subs) for key, subs in by_place.items()}
+        return self._groups
+
+    # ---------------------------------------------------------------- polling
+
+    async def fetch_current(self, places: List[Place]) -> Dict[str, Dict[str, float]]:
+        """Metrics for up to POLL_BATCH places in one Open-Meteo request"""
+        params = {
+            'latitude': ','.join(f"{p.latitude:.2f}" for p in places),
+            'longitude': ','.join(f"{p.longitude:.2f}" for p in places),
+            'current': 'temperature_2m,wind_speed_10m,precipitation,weather_code',
+        }
+        async with self.session().get(FORECAST_URL, params=params) as response:
+            response.raise_for_status()
+            data = await response.json(content_type=None)
+        readings = data if isinstance(data, list) else [data]
+        return {place.key: metrics_of(reading.get('current') or {})
+                for place, reading in zip(places, readings)}
+
+    def evaluate(self, readings: Dict[str, Dict[str, float]], now: Optional[float] = None) -> List[Alert]:
+        """Alerts for the readings, leaving out rules still cooling down"""
+        now = now or time.time()
+        groups = self.groups()
+        alerts = []
+        for key, metrics in readings.items():
+            group = groups.get(key)
+            if group is None:
+                continue
+            for sub_id, rule, value in group.triggered(metrics):
+                if now - self._last_alert.get(sub_id, 0) < self.cooldown:
+                    continue
+                self._last_alert[sub_id] = now
+                alerts.append(Alert(sub_id, self._chats[sub_id], group.place.name, rule, value))
+        return alerts
+
+    def _record(self, alerts: List[Alert]):
+        conn = get_connection()
+        try:
+            conn.executemany("UPDATE weather_subscriptions SET last_alert_at = ? WHERE id = ?",
+                             [(self._last_alert[a.subscription_id], a.subscription_id) for a in alerts])
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _notify(self, alerts: List[Alert]):
+        """One message per chat and place, whatever the number of rules that fired"""
+        grouped: Dict[Tuple[int, str], List[Alert]] = {}
+        for alert in alerts:
+            grouped.setdefault((alert.chat_id, alert.place), []).append(alert)
+        for (chat_id, place), items in grouped.items():
+            lines = []
+            for alert in items:
+                spec = RULES[alert.rule]
+                value = f" : {alert.value:g} {spec.unit}" if spec.unit else ""
+                lines.append(f"• {spec.label}{value}")
+            self.sender.send(chat_id, f"🚨 **ALERTE MÉTÉO - {place}**\n\n" + '\n'.join(lines) +
+                             "\n\n⚙️ `/alertes stop` pour désactiver")
+
+    async def poll(self) -> int:
+        """One pass over every subscribed place; returns the number of alerts sent"""
+        places = [group.place for group in self.groups().values()]
+        readings: Dict[str, Dict[str, float]] = {}
+        for start in range(0, len(places), POLL_BATCH):
+            batch = places[start:start + POLL_BATCH]
+            try:
+                readings.update(await self.fetch_current(batch))
+            except Exception as e:
+                logger.warning(f"Weather poll failed for {len(batch)} places: {e}")
+
+        alerts = self.evaluate(readings)
+        if alerts:
+            self._notify(alerts)
+            await asyncio.to_thread(self._record, alerts)
+        logger.info(f"Weather poll: {len(readings)}/{len(places)} places, {len(alerts)} alerts")
+        return len(alerts)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.poll()
+            except Exception as e:
+                logger.error(f"Weather alert poll error: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self, bot):
+        """Start polling and the sender (call from the running loop, once the bot is up)"""
+        if self._task is None:
+            self.sender.start(bot)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.sender.stop()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+# Shared instance used by /alertes
+weather_alert_engine = WeatherAlerts()
+track_queue("weather_alerts", lambda: len(weather_alert_engine.sender))
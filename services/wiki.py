@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+NICE-BOT - Wikipedia Lookups
+Summary and search requests hedged in parallel, cached, with a language fallback chain
+"""
+
+import os
+import re
+import asyncio
+import logging
+from typing import Dict, NamedTuple, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+import aiohttp
+
+from services.ttl_cache import TTLCache
+from services.metrics import http_trace
+
+logger = logging.getLogger(__name__)
+
+# Languages tried in order until one has an article
+WIKI_LANGUAGES = [lang.strip() for lang in os.getenv("WIKI_LANGUAGES", "fr,en").split(',') if lang.strip()]
+
+# Seconds the summary request gets on its own before the search is started too
+WIKI_HEDGE_DELAY = float(os.getenv("WIKI_HEDGE_DELAY", "0.25"))
+
+# Summaries and query -> title resolutions; misses are kept for a shorter time
+WIKI_SUMMARY_TTL = int(os.getenv("WIKI_SUMMARY_TTL", "21600"))
+WIKI_TITLE_TTL = 86400
+WIKI_MISS_TTL = 3600
+WIKI_CACHE_ENTRIES = 2048
+
+WIKI_TIMEOUT = aiohttp.ClientTimeout(total=10)
+
+# Wikimedia asks API clients to identify themselves
+WIKI_HEADERS = {'User-Agent': 'NICE-BOT/1.0 (Telegram bot)'}
+
+LANGUAGE_PREFIX = re.compile(r'^([a-z]{2,3}):\s*(.+)$')
+
+
+class WikiSummary(NamedTuple):
+    title: str
+    extract: str
+    url: str
+    lang: str
+    thumbnail: str = ''
+
+
+def split_language(query: str) -> Tuple[Optional[str], str]:
+    """'en:Python' -> ('en', 'Python'); no prefix -> (None, query)"""
+    match = LANGUAGE_PREFIX.match(query.strip())
+    if match:
+        return match.group(1), match.group(2).strip()
+    return None, query.strip()
+
+
+def _query_key(query: str) -> str:
+    return ' '.join(query.lower().split())
+
+
+class WikiClient:
+    """Cached Wikipedia lookups over one shared session"""
+
+    def __init__(self, languages: Sequence[str] = WIKI_LANGUAGES, hedge_delay: float = WIKI_HEDGE_DELAY):
+        self.languages = list(languages) or ['fr']
+        self.hedge_delay = hedge_delay
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._summaries = TTLCache(WIKI_SUMMARY_TTL, WIKI_CACHE_ENTRIES, name="wiki_summaries")
+        self._titles = TTLCache(WIKI_TITLE_TTL, WIKI_CACHE_ENTRIES, name="wiki_titles")
+        self._inflight: Dict[Tuple, asyncio.Future] = {}
+
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=WIKI_TIMEOUT, headers=WIKI_HEADERS, trace_configs=[http_trace()]
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def _get_json(self, url: str, params: Optional[dict] = None) -> Optional[dict]:
+        """JSON body, None on 404; other HTTP errors raise"""
+        async with self.session().get(url, params=params) as response:
+            if response.status == 404:
+                return None
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def summary(self, lang: str, title: str) -> Optional[WikiSummary]:
+        """REST summary of a page (redirects followed), None if it does not exist"""
+        key = (lang, title)
+        cached = self._summaries.get(key)
+        if cached is not None:
+            return cached
+
+        url = f"https://{lang}.wikipedia.org/api/rest_v1/page/summary/{quote(title.replace(' ', '_'), safe='')}"
+        data = await self._get_json(url)
+        if not data or not data.get('extract'):
+            return None
+
+        result = WikiSummary(
+            title=data.get('title', title),
+            extract=data['extract'],
+            url=data.get('content_urls', {}).get('desktop', {}).get('page', ''),
+            lang=lang,
+            thumbnail=data.get('thumbnail', {}).get('source', ''),
+        )
+        self._summaries.set(key, result)
+        self._summaries.set((lang, result.title), result)
+        return result
+
+    async def search(self, lang: str, query: str) -> Optional[Tuple[str, str]]:
+        """(title, snippet) of the best full-text match, None if nothing matches"""
+        data = await self._get_json(f"https://{lang}.wikipedia.org/w/api.php", params={
+            'action': 'query', 'format': 'json', 'list': 'search',
+            'srsearch': query, 'srlimit': 1,
+        })
+        hits = (data or {}).get('query', {}).get('search') or []
+        if not hits:
+            return None
+        return hits[0]['title'], re.sub('<.*?>', '', hits[0].get('snippet', ''))
+
+    async def _lookup_language(self, lang: str, query: str) -> Optional[WikiSummary]:
+        """Summary and search raced in one language.
+
+        The summary request goes first; if it has not answered within the
+        hedge delay, the search starts alongside it so a 404 costs no extra
+        round trip. Whichever resolves the title is remembered.
+        """
+        key = (lang, _query_key(query))
+        title = self._titles.get(key)
+        if title is not None:
+            return await self.summary(lang, title) if title else None
+
+        direct = asyncio.ensure_future(self.summary(lang, query))
+        search: Optional[asyncio.Future] = None
+        errors = []
+        try:
+            try:
+                try:
+                    result = await asyncio.wait_for(asyncio.shield(direct), self.hedge_delay)
+                except asyncio.TimeoutError:
+                    search = asyncio.ensure_future(self.search(lang, query))
+                    result = await direct
+            except Exception as e:
+                errors.append(e)
+                result = None
+
+            if result is not None:
+                self._titles.set(key, result.title)
+                return result
+
+            if search is None:
+                search = asyncio.ensure_future(self.search(lang, query))
+            try:
+                hit = await search
+            except Exception as e:
+                errors.append(e)
+                hit = None
+        finally:
+            for task in (direct, search):
+                if task is not None and not task.done():
+                    task.cancel()
+
+        if hit is None:
+            if errors:
+                raise errors[-1]
+            self._titles.set(key, '', ttl=WIKI_MISS_TTL)
+            return None
+
+        title, snippet = hit
+        self._titles.set(key, title)
+        page = await self.summary(lang, title)
+        if page is None:
+            url = f"https://{lang}.wikipedia.org/wiki/{quote(title.replace(' ', '_'))}"
+            page = WikiSummary(title, f"{snippet}...", url, lang)
+        return page
+
+    async def _lookup(self, query: str, languages: Sequence[str]) -> Optional[WikiSummary]:
+        error: Optional[Exception] = None
+        for lang in languages:
+            try:
+                result = await self._lookup_language(lang, query)
+            except Exception as e:
+                logger.warning(f"Wikipedia ({lang}) lookup failed for '{query}': {e}")
+                error = e
+                continue
+            if result is not None:
+                return result
+        if error is not None:
+            raise error
+        return None
+
+    async def lookup(self, query: str, lang: Optional[str] = None) -> Optional[WikiSummary]:
+        """First article for a query along the language chain (lang goes first).
+
+        Concurrent lookups of the same query share one set of requests.
+        """
+        languages = [lang] + [l for l in self.languages if l != lang] if lang else self.languages
+        key = (tuple(languages), _query_key(query))
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._lookup(query, languages)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters get the error; nobody may be waiting, so mark it retrieved
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+
+# Shared instance used by /wiki
+wiki_client = WikiClient()
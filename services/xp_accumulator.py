@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+NICE-BOT - XP Accumulator
+Write-behind cache of user_stats rows, flushed in batched UPSERTs
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from db import get_connection
+from services.metrics import track_queue
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two batched flushes
+FLUSH_INTERVAL = float(os.getenv("XP_FLUSH_INTERVAL", "5"))
+
+# Cached users idle for longer than this are dropped after a flush
+IDLE_EVICT_SECONDS = 3600
+
+
+class XPAccumulator:
+    """Keeps the stats of active users in memory and writes them in batches.
+
+    The in-memory rows are authoritative: level-ups and badges are computed
+    from them immediately, while SQLite sees one UPSERT per user per flush
+    window instead of one write per command.
+    """
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self.lock = threading.RLock()
+        self._state: Dict[int, dict] = {}
+        self._last_seen: Dict[int, float] = {}
+        self._dirty: Set[int] = set()
+        self._counters: Dict[Tuple[int, str], int] = {}
+        self._badges: List[Tuple[int, int]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        """Users with changes not written to SQLite yet"""
+        return len(self._dirty)
+
+    # ----------------------------------------------------------------- state
+
+    def load(self, user_id: int) -> dict:
+        """Cached stats row of a user (read from SQLite on first access)"""
+        with self.lock:
+            stats = self._state.get(user_id)
+            if stats is None:
+                stats = self._read(user_id)
+                self._state[user_id] = stats
+            self._last_seen[user_id] = time.monotonic()
+            return stats
+
+    def peek(self, user_id: int) -> Optional[dict]:
+        """Copy of the cached stats, None if the user is not cached"""
+        with self.lock:
+            stats = self._state.get(user_id)
+            return dict(stats) if stats is not None else None
+
+    def _read(self, user_id: int) -> dict:
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT xp_points, level, total_commands, streak_days, last_activity
+                FROM user_stats WHERE user_id = ?
+            ''', (user_id,))
+            row = cursor.fetchone()
+        finally:
+            conn.close()
+
+        if row:
+            return {
+                'xp_points': row[0],
+                'level': row[1],
+                'total_commands': row[2],
+                'streak_days': row[3],
+                'last_activity': row[4]
+            }
+        return {
+            'xp_points': 0,
+            'level': 1,
+            'total_commands': 0,
+            'streak_days': 0,
+            'last_activity': None
+        }
+
+    def mark_dirty(self, user_id: int, category: Optional[str] = None, badge_ids: Iterable[int] = ()):
+        """Queue a user's row (plus counter and badge changes) for the next flush"""
+        with self.lock:
+            self._dirty.add(user_id)
+            if category:
+                key = (user_id, category)
+                self._counters[key] = self._counters.get(key, 0) + 1
+            self._badges.extend((user_id, badge_id) for badge_id in badge_ids)
+
+        # Without a flush loop (scripts, admin tools) write through
+        if self._task is None:
+            self.flush()
+
+    def forget(self, user_id: int):
+        """Drop a user's cached row (after a direct database edit)"""
+        with self.lock:
+            self._state.pop(user_id, None)
+            self._last_seen.pop(user_id, None)
+            self._dirty.discard(user_id)
+
+    # ----------------------------------------------------------------- flush
+
+    def flush(self):
+        """Write every pending change in one transaction"""
+        with self.lock:
+            if not self._dirty and not self._counters and not self._badges:
+                return
+            rows = [
+                (user_id, stats['xp_points'], stats['level'], stats['total_commands'],
+                 stats['streak_days'], stats['last_activity'])
+                for user_id in self._dirty
+                if (stats := self._state.get(user_id)) is not None
+            ]
+            dirty, counters, badges = self._dirty, self._counters, self._badges
+            self._dirty, self._counters, self._badges = set(), {}, []
+
+            conn = get_connection()
+            try:
+                with conn:
+                    conn.executemany('''
+                        INSERT INTO user_stats (user_id, xp_points, level, total_commands, streak_days, last_activity)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(user_id) DO UPDATE SET
+                            xp_points = excluded.xp_points,
+                            level = excluded.level,
+                            total_commands = excluded.total_commands,
+                            streak_days = excluded.streak_days,
+                            last_activity = excluded.last_activity
+                    ''', rows)
+                    conn.executemany('''
+                        INSERT INTO user_counters (user_id, category, count)
+                        VALUES (?, ?, ?)
+                        ON CONFLICT(user_id, category) DO UPDATE SET count = count + excluded.count
+                    ''', [(user_id, category, count) for (user_id, category), count in counters.items()])
+                    conn.executemany('''
+                        INSERT OR IGNORE INTO user_badges (user_id, badge_id)
+                        VALUES (?, ?)
+                    ''', badges)
+            except Exception as e:
+                # Put the changes back so the next flush retries them
+                logger.error(f"Error flushing XP: {e}")
+                self._dirty |= dirty
+                for key, count in counters.items():
+                    self._counters[key] = self._counters.get(key, 0) + count
+                self._badges = badges + self._badges
+                return
+            finally:
+                conn.close()
+
+            self._evict_idle()
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - IDLE_EVICT_SECONDS
+        for user_id, seen in list(self._last_seen.items()):
+            if seen < cutoff and user_id not in self._dirty:
+                self._state.pop(user_id, None)
+                del self._last_seen[user_id]
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+    def start(self):
+        """Start the periodic flush task (call from the running event loop)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+            logger.info(f"XP accumulator started (flush every {self.flush_interval}s)")
+
+    async def stop(self):
+        """Stop the flush task and write everything still pending"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.flush()
+
+
+# Shared instance used by the gamification engine
+xp_accumulator = XPAccumulator()
+track_queue("xp_unflushed_users", lambda: xp_accumulator.pending)
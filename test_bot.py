@@ -183,6 +183,37 @@ async def test_bot_setup():
         print(f"❌ Bot setup failed: {e}")
         return False
 
+async def test_trace_redaction():
+    """Test that traced Bot API calls never record the bot token"""
+    print("\n🔎 Testing trace redaction...")
+    
+    try:
+        from types import SimpleNamespace
+        from telegram import Bot
+        from yarl import URL
+        from services.metrics import _on_request_end, _on_request_start
+        from services.tracing import tracer
+    
+        bot = Bot("123456:ABC-secret_token")
+        urls = [f"{bot.base_url}/sendVideo", f"{bot.base_file_url}/videos/file_1.mp4"]
+    
+        with tracer.trace("test") as trace:
+            for url in urls:
+                context = SimpleNamespace()
+                params = SimpleNamespace(method="POST", url=URL(url), response=SimpleNamespace(status=200))
+                await _on_request_start(None, context, params)
+                await _on_request_end(None, context, params)
+    
+        names = [span[2] for span in trace.spans]
+        if len(names) != len(urls) or any(bot.token in name for name in names):
+            print(f"❌ Bot token found in span names: {names}")
+            return False
+        print(f"✅ Span names redacted: {', '.join(names)}")
+        return True
+    except Exception as e:
+        print(f"❌ Trace redaction test failed: {e}")
+        return False
+
 async def main():
     """Run all tests"""
     print("🧪 NICE-BOT Test Suite")
@@ -193,7 +224,8 @@ async def main():
         ("Environment", test_environment),
         ("Database", test_database),
         ("APIs", test_apis),
-        ("Bot Setup", test_bot_setup)
+        ("Bot Setup", test_bot_setup),
+        ("Trace Redaction", test_trace_redaction)
     ]
     
     results = []